@@ -0,0 +1,117 @@
+"""
+Puts entities that are far from the view to sleep, and wakes them up when the
+view comes near.
+
+"""
+import bootstrap
+import ecs
+import config
+import common
+
+class ActivationSystem(ecs.System):
+	"""
+	Keeps only the entities near the view awake.
+
+	The active region is the scroller's view rectangle, in level coordinates,
+	grown by margin pixels on every side.  Awake entities whose Position is
+	outside of it are given an Asleep component, which takes them out of the
+	views of the other systems.  Sleeping entities are bucketed by position in
+	a grid of cell_size cells, so that waking them only looks in the cells the
+	region covers.  The cost of a frame then grows with the number of entities
+	near the view rather than the size of the level.
+
+	Entities with PlayerInput are never put to sleep, since the view follows
+	them.  Should run before the systems it puts entities to sleep for.
+
+	"""
+	def __init__(self, margin=None, cell_size=None):
+		super(ActivationSystem, self).__init__()
+
+		self.reads = (common.Position, common.PlayerInput, 'scroller')
+		self.writes = (common.Asleep,)
+		if margin is None:
+			margin = config.ACTIVATION_MARGIN
+		if cell_size is None:
+			cell_size = config.ACTIVATION_CELL
+		self.margin = margin
+		self.cell_size = cell_size
+
+		self.sleeping = {} # e_id -> grid cell
+		self._cells = {} # grid cell -> set of e_ids
+		self._changed = None # set from EntityManager.track
+
+	def region(self):
+		"""
+		Returns (left, bottom, right, top) of the active region
+		"""
+		scroller = self.sys_man.parent.scroller
+		half_w = scroller.view_w / (2.0 * scroller.scale) + self.margin
+		half_h = scroller.view_h / (2.0 * scroller.scale) + self.margin
+		return (scroller.restricted_fx - half_w, scroller.restricted_fy - half_h,
+				scroller.restricted_fx + half_w, scroller.restricted_fy + half_h)
+
+	def update(self, dt, entity_manager):
+		if self._changed is None:
+			self._changed = entity_manager.track(common.Position)
+		left, bottom, right, top = self.region()
+
+		# entities that were removed, or woken by something else, while asleep
+		# are dropped before their e_ids can be used again
+		asleep = entity_manager.components(common.Asleep)
+		if len(asleep) != len(self.sleeping):
+			for e_id in [e_id for e_id in self.sleeping if e_id not in asleep]:
+				self._unbucket(e_id)
+
+		# sleeping entities that were moved by something else, like a script,
+		# have to be found in their new cell
+		for e_id in self._changed:
+			if e_id in self.sleeping:
+				pos = entity_manager.component_for_entity(e_id, common.Position)
+				self._unbucket(e_id)
+				if pos:
+					self._bucket(e_id, pos)
+		self._changed.clear()
+
+		size = self.cell_size
+		for i in xrange(int(left // size), int(right // size) + 1):
+			for j in xrange(int(bottom // size), int(top // size) + 1):
+				cell = self._cells.get((i, j))
+				if not cell:
+					continue
+				for e_id in list(cell):
+					pos = entity_manager.component_for_entity(e_id, common.Position)
+					if not pos:
+						self._unbucket(e_id) # lost its Position while asleep
+					elif left <= pos.x <= right and bottom <= pos.y <= top:
+						self._unbucket(e_id)
+						entity_manager.remove_component(e_id, common.Asleep)
+
+		awake = entity_manager.view(common.Position, exclude=(common.Asleep, common.PlayerInput))
+		leaving = [(e_id, pos) for e_id, pos in awake
+				   if not (left <= pos.x <= right and bottom <= pos.y <= top)]
+		for e_id, pos in leaving:
+			entity_manager.add_component(e_id, common.Asleep())
+			self._bucket(e_id, pos)
+
+	def restored(self, entity_manager):
+		"""
+		Buckets the sleeping entities again, after a snapshot.Snapshotter has
+		put different entities to sleep
+		"""
+		self.sleeping.clear()
+		self._cells.clear()
+		for e_id in entity_manager.components(common.Asleep):
+			pos = entity_manager.component_for_entity(e_id, common.Position)
+			if pos:
+				self._bucket(e_id, pos)
+		if self._changed is not None:
+			self._changed.clear()
+		
+	def _bucket(self, e_id, pos):
+		cell = (int(pos.x // self.cell_size), int(pos.y // self.cell_size))
+		self.sleeping[e_id] = cell
+		self._cells.setdefault(cell, set()).add(e_id)
+
+	def _unbucket(self, e_id):
+		cell = self.sleeping.pop(e_id)
+		self._cells[cell].discard(e_id)
@@ -0,0 +1,143 @@
+"""
+Structure-of-arrays storage for Position and Velocity.
+
+When numpy is available a level can keep the x/y and v_x/v_y of every moving
+entity in contiguous arrays, so that gravity and velocity integration are a
+single vectorized step each instead of a Python loop over components.
+
+Every other read or write of x, y, v_x or v_y is then a numpy scalar access,
+which costs several times as much as an attribute, and most systems still
+work one entity at a time.  So the store only pays off once those systems
+work on whole arrays as well, and config.ARRAY_STORE is off by default.
+
+"""
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+import common
+import entitymanager
+
+class KinematicStore(entitymanager.View):
+	"""
+	A View of every entity with both a Position and a Velocity that owns the
+	numeric data of those components.  Sleeping entities are left out.
+
+	pos		: (capacity, 2) array of x, y
+
+	vel		: (capacity, 2) array of v_x, v_y
+
+	gravity	: (capacity,) boolean array of Velocity.use_gravity
+
+	Only the first len(store) rows are in use.  The Position and Velocity objects
+	of the entities stay in the EntityManager as usual, but while they are in the
+	store their attributes read and write these arrays, so other systems can keep
+	using them as before.
+
+	"""
+	def __init__(self, capacity=64):
+		if numpy is None:
+			raise ImportError('KinematicStore requires numpy')
+		super(KinematicStore, self).__init__((common.Position, common.Velocity),
+											 exclude=(common.Asleep,))
+
+		self.pos = numpy.zeros((capacity, 2))
+		self.vel = numpy.zeros((capacity, 2))
+		self.gravity = numpy.zeros(capacity, dtype=bool)
+
+		self._entities = [] # slot -> e_id
+		self._slots = {} # e_id -> slot
+
+	@property
+	def capacity(self):
+		return len(self.pos)
+
+	def entities(self):
+		"""
+		Returns a list of the e_ids in the store, in the order of their rows
+
+		"""
+		return list(self._entities)
+
+	def integrate(self, dt):
+		"""
+		Moves every entity in the store by its velocity.  Returns a list of the
+		e_ids of the entities that moved.
+
+		"""
+		n = len(self._entities)
+		self.pos[:n] += self.vel[:n] * dt
+		entities = self._entities
+		return [entities[slot] for slot in numpy.flatnonzero(self.vel[:n].any(axis=1)).tolist()]
+
+	def apply_gravity(self, dt, gravity):
+		"""
+		Accelerates every entity in the store that uses gravity
+
+		"""
+		n = len(self._entities)
+		self.vel[:n, 1] -= self.gravity[:n] * (dt * gravity)
+
+	def _grow(self):
+		capacity = self.capacity * 2
+		for name in ('pos', 'vel', 'gravity'):
+			old = getattr(self, name)
+			new = numpy.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+			new[:len(old)] = old
+			setattr(self, name, new)
+
+	def _add(self, e_id, row):
+		if e_id in self._slots:
+			# one of the entity's components was replaced, so start over
+			self._discard(e_id)
+
+		slot = len(self._entities)
+		if slot == self.capacity:
+			self._grow()
+
+		e_id, pos, vel = row
+		self.pos[slot] = pos.x, pos.y
+		self.vel[slot] = vel.v_x, vel.v_y
+		self.gravity[slot] = vel.use_gravity
+		pos.attach(self, slot)
+		vel.attach(self, slot)
+
+		self._entities.append(e_id)
+		self._slots[e_id] = slot
+		super(KinematicStore, self)._add(e_id, row)
+
+	def _discard(self, e_id):
+		slot = self._slots.pop(e_id, None)
+		if slot is None:
+			return
+
+		e_id, pos, vel = self._rows[e_id]
+		pos.detach()
+		vel.detach()
+
+		# fill the hole with the last row so the used rows stay contiguous
+		last = len(self._entities) - 1
+		if slot != last:
+			moved = self._entities[last]
+			self.pos[slot] = self.pos[last]
+			self.vel[slot] = self.vel[last]
+			self.gravity[slot] = self.gravity[last]
+			self._entities[slot] = moved
+			self._slots[moved] = slot
+			for component in self._rows[moved][1:]:
+				component.attach(self, slot)
+		self._entities.pop()
+
+		super(KinematicStore, self)._discard(e_id)
+
+def attach(entity_manager, capacity=64):
+	"""
+	Creates a KinematicStore for entity_manager and registers it, so that
+	GravitySystem and VelocitySystem use it.  Returns the store.
+
+	"""
+	store = KinematicStore(capacity)
+	entity_manager.register_view(store)
+	entity_manager.kinematics = store
+	return store
@@ -0,0 +1,218 @@
+"""
+Loads the images a level uses ahead of time, and keeps what is made from them.
+
+Images are decoded from their PNG files on a worker thread, and put on their
+atlas pages on the main thread, which owns the GL context, a few at a time in
+pump, so loading doesn't hold up a frame for long.  An image that is asked for
+before it has been loaded is loaded there and then.
+
+Each level has a manifest of the images it asked for the last time it ran,
+kept as JSON in config.CACHE_DIR, which preload queues up for decoding as soon
+as the level starts loading.
+
+Grids, animations and their flipped variants are made once and kept, so
+asking for one again costs a dictionary lookup.  Animations are also named for
+snapshot, after how they were made.
+
+"""
+import json
+import os
+import Queue
+import threading
+import time
+
+import bootstrap
+import pyglet
+
+import config
+import atlas
+import jumper
+import snapshot
+
+MANIFEST_EXTENSION = '.assets.json'
+
+class AssetManager(object):
+	"""
+	Keeps the images and animations of the game.
+
+	atlas	: the atlas.Atlas that images in config.IMAGES_DIR are put on
+
+	level	: the name of the level whose manifest requests are recorded in
+
+	"""
+	def __init__(self):
+		self.atlas = atlas.Atlas(atlas.layout(), load=False)
+		self.level = None
+
+		self._made = {} # key -> grid, animation, or image from outside the atlas
+		self._requested = set() # image names asked for since preload
+		self._queued = set() # image names given to the worker and not added yet
+		self._requests = Queue.Queue()
+		self._decoded = Queue.Queue()
+		self._thread = threading.Thread(target=self._decode, name='asset decoder')
+		self._thread.daemon = True
+		self._thread.start()
+
+	def preload(self, level):
+		"""
+		Starts decoding the images in level's manifest, and records the images
+		asked for from now on in it
+		"""
+		self.level = level
+		self._requested = set()
+		path = manifest_path(level)
+		if not os.path.exists(path):
+			return
+		with open(path) as f:
+			names = json.load(f)['images']
+		for name in names:
+			self.queue(str(name))
+
+	def queue(self, name):
+		"""
+		Has an image decoded on the worker thread, to be added by pump
+		"""
+		if (name not in self.atlas and name not in self._queued
+				and self.atlas.has_place(name)):
+			self._queued.add(name)
+			self._requests.put(name)
+
+	def pump(self, budget=None):
+		"""
+		Puts images the worker has decoded on their pages, for up to budget
+		seconds.  Called once per frame by the level.  Returns the number of
+		images still being decoded.
+		"""
+		if budget is None:
+			budget = config.ASSET_UPLOAD_BUDGET
+		end = time.time() + budget
+		while self._queued and time.time() < end:
+			try:
+				name, image = self._decoded.get_nowait()
+			except Queue.Empty:
+				break
+			self._add(name, image)
+		return len(self._queued)
+
+	def save_manifest(self):
+		"""
+		Writes the images the level asked for to its manifest
+		"""
+		if self.level is None:
+			return
+		path = manifest_path(self.level)
+		directory = os.path.dirname(path)
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		with open(path, 'w') as f:
+			json.dump({'images': sorted(self._requested)}, f, indent=1)
+
+	def image(self, name):
+		"""
+		Returns an image in config.IMAGES_DIR, as a region of its atlas page
+		"""
+		self._requested.add(name)
+		region = self.atlas.regions.get(name)
+		if region is not None:
+			return region
+		if not self.atlas.has_place(name):
+			return self._outside_atlas(name)
+
+		# needed now, so whatever the worker is up to is added first, in case it
+		# is this one, and otherwise it is decoded here
+		while name in self._queued:
+			name_, image = self._decoded.get()
+			self._add(name_, image)
+		region = self.atlas.regions.get(name)
+		if region is not None:
+			return region
+		return self.atlas.add(name, pyglet.image.load(os.path.join(self.atlas.directory, name)))
+
+	def grid(self, name, rows, columns):
+		"""
+		Returns the image cut into rows and columns, like atlas.Atlas.grid
+		"""
+		key = ('grid', name, rows, columns)
+		made = self._made.get(key)
+		if made is None:
+			self.image(name) # loaded, if it isn't already
+			made = self._made[key] = self.atlas.grid(name, rows, columns)
+		return made
+
+	def animation(self, name, rows, columns, period, frames=None, flip_x=False):
+		"""
+		Returns an Animation of the cells of grid(name, rows, columns), or of
+		the first frames of them, each shown for period seconds, and flipped
+		left to right if flip_x is set
+		"""
+		key = ('animation', name, rows, columns, period, frames, flip_x)
+		made = self._made.get(key)
+		if made is None:
+			if flip_x:
+				made = self.animation(name, rows, columns, period, frames).get_transform(flip_x=True)
+			else:
+				cells = self.grid(name, rows, columns)[:frames]
+				made = pyglet.image.Animation.from_image_sequence(cells, period)
+			self._made[key] = made
+			label = '{} {}x{} {}s'.format(name, rows, columns, period)
+			if frames is not None:
+				label += ' first {}'.format(frames)
+			if flip_x:
+				label += ' flipped'
+			snapshot.register_image(label, made)
+		return made
+
+	def jumper_animation(self, name, rows, columns, period):
+		"""
+		Returns a JumperAnimation that walks through the cells of an image
+		facing right, stands on its first cell, and is flipped to face left
+		"""
+		anim = jumper.JumperAnimation()
+		anim.walk_right = self.animation(name, rows, columns, period)
+		anim.walk_left = self.animation(name, rows, columns, period, flip_x=True)
+		anim.stand_right = self.animation(name, rows, columns, period, 1)
+		anim.stand_left = self.animation(name, rows, columns, period, 1, flip_x=True)
+		return anim
+
+	def _outside_atlas(self, name):
+		key = ('image', name)
+		image = self._made.get(key)
+		if image is None:
+			import pyglet.gl as gl
+			image = bootstrap.resources().image(name)
+			gl.glBindTexture(image.target, image.id)
+			gl.glTexParameteri(image.target, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+			gl.glTexParameteri(image.target, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
+			self._made[key] = image
+		return image
+
+	def _add(self, name, image):
+		self._queued.discard(name)
+		# an image the worker couldn't decode is left for image to load, which
+		# raises the error where it can be seen
+		if image is not None and name not in self.atlas:
+			self.atlas.add(name, image)
+
+	def _decode(self):
+		while True:
+			name = self._requests.get()
+			try:
+				image = pyglet.image.load(os.path.join(self.atlas.directory, name))
+			except Exception:
+				image = None
+			self._decoded.put((name, image))
+
+def manifest_path(level):
+	return os.path.join(config.GAME_DIR, config.CACHE_DIR,
+						os.path.basename(level) + MANIFEST_EXTENSION)
+
+_manager = None
+
+def manager():
+	"""
+	Returns the AssetManager, making it the first time.  Needs a GL context.
+	"""
+	global _manager
+	if _manager is None:
+		_manager = AssetManager()
+	return _manager
@@ -0,0 +1,217 @@
+"""
+Packs the images in config.IMAGES_DIR into a few texture atlas pages.
+
+Every image loaded on its own is its own texture, so sprites of different
+kinds can't be drawn in one batch, and each one binds its texture when it is
+drawn.  An Atlas puts the images on shared pages instead, with NEAREST
+filtering set once per page, so the pixel art stays sharp.
+
+Packing only needs the sizes of the images, which are read from their PNG
+headers, so the layout can be worked out without a GL context.  It is cached
+as JSON in config.CACHE_DIR and made again when the images change.
+
+Usage:
+
+	python atlas.py
+
+"""
+import json
+import os
+import struct
+
+import config
+
+LAYOUT_FILE = 'atlas.json'
+
+PADDING = 1 # pixels between images on a page
+
+class Atlas(object):
+	"""
+	Atlas pages, and the regions of the images on them.
+
+	pages	: list of pyglet Textures
+
+	regions	: {image name: TextureRegion of its page}, for the images put on
+			  their pages so far
+
+	With load False, the pages start out empty, and images are put on them one
+	at a time with add, so that decoding them can be done elsewhere.
+
+	"""
+	def __init__(self, layout, directory=None, load=True):
+		import pyglet
+		import pyglet.gl as gl
+
+		if directory is None:
+			directory = images_path()
+		self.directory = directory
+		self.pages = []
+		self.regions = {}
+		self._places = {} # image name -> (page, x, y, width, height)
+		for page in layout['pages']:
+			texture = pyglet.image.Texture.create(page['width'], page['height'], gl.GL_RGBA,
+												  min_filter=gl.GL_NEAREST,
+												  mag_filter=gl.GL_NEAREST)
+			for name, place in page['images'].iteritems():
+				self._places[name] = (texture,) + tuple(place)
+			self.pages.append(texture)
+		if load:
+			for name in self._places:
+				self.add(name, pyglet.image.load(os.path.join(directory, name)))
+
+	def __contains__(self, name):
+		return name in self.regions
+
+	def has_place(self, name):
+		"""
+		Returns True if the layout has a place for an image, whether or not it
+		has been added yet
+		"""
+		return name in self._places
+
+	def add(self, name, image):
+		"""
+		Puts decoded image data on its place on a page.  Returns its region.
+		"""
+		texture, x, y, width, height = self._places[name]
+		texture.blit_into(image, x, y, 0)
+		region = self.regions[name] = texture.get_region(x, y, width, height)
+		return region
+
+	def image(self, name):
+		"""
+		Returns the region of an image
+		"""
+		return self.regions[name]
+
+	def grid(self, name, rows, columns):
+		"""
+		Returns the regions of an image cut into rows and columns of equal size,
+		in the order of a pyglet ImageGrid: left to right, from the bottom row
+		"""
+		region = self.regions[name]
+		width = region.width // columns
+		height = region.height // rows
+		return [region.get_region(column * width, row * height, width, height)
+				for row in xrange(rows) for column in xrange(columns)]
+
+	def animation(self, name, rows, columns, period):
+		"""
+		Returns an Animation of the cells of grid(name, rows, columns), each
+		shown for period seconds
+		"""
+		import pyglet
+		return pyglet.image.Animation.from_image_sequence(self.grid(name, rows, columns),
+														  period)
+
+def images_path():
+	return os.path.join(config.GAME_DIR, config.IMAGES_DIR)
+
+def layout_path():
+	return os.path.join(config.GAME_DIR, config.CACHE_DIR, LAYOUT_FILE)
+
+def png_size(path):
+	"""
+	Returns (width, height) of a PNG file, read from its header without
+	decoding the image
+	"""
+	with open(path, 'rb') as f:
+		header = f.read(24)
+	if header[:8] != '\x89PNG\r\n\x1a\n':
+		raise ValueError('{} is not a PNG file'.format(path))
+	return struct.unpack('>II', header[16:24])
+
+def sources(directory):
+	"""
+	Returns {name: [size in bytes, mtime]} of the PNG files in directory, to
+	tell when a layout is out of date
+	"""
+	found = {}
+	for name in os.listdir(directory):
+		if name.lower().endswith('.png'):
+			stat = os.stat(os.path.join(directory, name))
+			found[name] = [stat.st_size, stat.st_mtime]
+	return found
+
+def pack(sizes, page_size=None):
+	"""
+	Packs images onto pages with a shelf packer.  sizes is {name: (width,
+	height)}.  Returns a list of pages, each a dictionary of its width and
+	height and the {name: [x, y, width, height]} of its images.
+
+	Images are placed tallest first, left to right along shelves that stack up
+	from the bottom of the page.  Each page is shrunk to the smallest power of
+	two sizes that fit what is on it, and an image too big for a page gets one
+	of its own.
+	"""
+	if page_size is None:
+		page_size = config.ATLAS_SIZE
+	order = sorted(sizes, key=lambda name: (-sizes[name][1], -sizes[name][0], name))
+
+	pages = []
+	page = None
+	for name in order:
+		width, height = sizes[name]
+		if width > page_size or height > page_size:
+			pages.append({'width': _power_of_two(width), 'height': _power_of_two(height),
+						  'images': {name: [0, 0, width, height]}})
+			continue
+
+		if page is not None and page['x'] + width > page_size:
+			# next shelf
+			page['y'] += page['shelf'] + PADDING
+			page['x'] = page['shelf'] = 0
+		if page is None or page['y'] + height > page_size:
+			page = {'x': 0, 'y': 0, 'shelf': 0, 'used_width': 0, 'images': {}}
+			pages.append(page)
+
+		page['images'][name] = [page['x'], page['y'], width, height]
+		page['x'] += width + PADDING
+		page['shelf'] = max(page['shelf'], height)
+		page['used_width'] = max(page['used_width'], page['x'] - PADDING)
+
+	for page in pages:
+		if 'x' in page:
+			page['width'] = _power_of_two(page.pop('used_width'))
+			page['height'] = _power_of_two(page.pop('y') + page.pop('shelf'))
+			del page['x']
+	return pages
+
+def layout(directory=None):
+	"""
+	Returns the layout of the images in directory, from the cache if it is up
+	to date, otherwise packing them and caching the result
+	"""
+	if directory is None:
+		directory = images_path()
+	found = sources(directory)
+
+	path = layout_path()
+	if os.path.exists(path):
+		with open(path) as f:
+			cached = json.load(f)
+		if (cached.get('sources') == found and cached.get('page_size') == config.ATLAS_SIZE):
+			return cached
+
+	sizes = dict((name, png_size(os.path.join(directory, name))) for name in found)
+	result = {'sources': found, 'page_size': config.ATLAS_SIZE,
+			  'pages': pack(sizes, config.ATLAS_SIZE)}
+	cache_dir = os.path.dirname(path)
+	if not os.path.isdir(cache_dir):
+		os.makedirs(cache_dir)
+	with open(path, 'w') as f:
+		json.dump(result, f, indent=1, sort_keys=True)
+	return result
+
+def _power_of_two(n):
+	size = 1
+	while size < n:
+		size *= 2
+	return size
+
+if __name__ == '__main__':
+	for n, page in enumerate(layout()['pages']):
+		print 'page {}: {}x{}, {} images'.format(n, page['width'], page['height'],
+												 len(page['images']))
+		for name, (x, y, width, height) in sorted(page['images'].iteritems()):
+			print '\t{} at ({}, {}), {}x{}'.format(name, x, y, width, height)
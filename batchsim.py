@@ -0,0 +1,172 @@
+"""
+Runs many headless levels at once, in a pool of processes, for checking levels
+and for automated playtesting.
+
+A run is one level, from a map in config.MAPS_DIR, with its player driven by
+a script of inputs made from a seed, or by an input recording.  Every run
+builds its own EntityManager, SystemManager and, for a recording, InputManager
+with headless.load, so runs don't share anything but the map cache, and each
+process of the pool works through runs one after the other.
+
+A run is completed when the right of the player's collider gets within a
+tile of the right edge of the map, so maps walled in at the edge count.  The
+results are written out as JSON, one entry per run, with the frames
+simulated, the time they took, and whether and when the level was completed.
+
+Usage:
+
+	python batchsim.py [map ...] [--seeds 100] [--frames 6000] [--processes N]
+					   [--replay recording ...] [--output results.json]
+
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import headless # sets up headless mode, so it comes before the other game modules
+import config
+import common
+import chunkmap
+import levelcache
+
+SEGMENT_FRAMES = (10, 90) # range of the lengths of the segments of a random script
+
+def random_script(seed, frames):
+	"""
+	Returns a script of (frames, inputs) segments covering at least frames
+	frames, made from seed.  The player mostly walks right, and sometimes
+	stops, turns back or jumps.
+	"""
+	rng = random.Random(seed)
+	script = []
+	total = 0
+	while total < frames:
+		length = rng.randint(*SEGMENT_FRAMES)
+		total += length
+		inputs = {'HORIZONTAL_1': rng.choice((1.0, 1.0, 1.0, 0.0, -1.0))}
+		if rng.random() < 0.5:
+			# a jump is a short press at the start of the segment
+			press = min(length - 1, rng.randint(2, 8))
+			script.append((press, dict(inputs, JUMP=1)))
+			length -= press
+		script.append((length, inputs))
+	return script
+
+def run(job):
+	"""
+	Runs one job, a dictionary with the map, the frames to run for, and either
+	a seed for random_script or the path of an input recording as replay.
+	Returns a dictionary of the job and its results.
+	"""
+	map_name = job['map']
+	frames = job['frames']
+	replay = job.get('replay')
+
+	headless_level, player = headless.load(map_name, replay=replay)
+	database = headless_level.database
+	pos = database.component_for_entity(player, common.Position)
+	hit_rect = database.component_for_entity(player, common.RectCollider).hit_rect
+	cm = headless_level.collision_map
+	goal = (cm.width - 1) * cm.tile_width
+
+	if replay is None:
+		script = iter(random_script(job['seed'], frames))
+		input_dict = database.component_for_entity(player, common.PlayerInput).input
+		left = 0 # frames left in the current segment
+
+	completed_at = None
+	start = time.time()
+	for frame in xrange(frames):
+		if replay is None:
+			if not left:
+				left, inputs = next(script)
+				for name in input_dict:
+					input_dict[name] = inputs.get(name, 0)
+			left -= 1
+		headless_level.step()
+		if hit_rect.right >= goal:
+			completed_at = frame + 1
+			if job.get('stop_on_complete', True):
+				break
+	elapsed = time.time() - start
+
+	simulated = headless_level.frames
+	result = dict(job)
+	result.update({
+		'frames_simulated': simulated,
+		'seconds': elapsed,
+		'frames_per_second': simulated / elapsed if elapsed else None,
+		'completed': completed_at is not None,
+		'completed_at': completed_at,
+		'player': [float(pos.x), float(pos.y)],
+	})
+	return result
+
+def run_all(jobs, processes=None):
+	"""
+	Runs jobs in a pool of processes, by default one per core.  Returns the
+	results in the order of jobs.
+	"""
+	if config.LEVEL_CACHE:
+		# compiled here, so the processes don't all compile the same maps at once
+		for name in set(job['map'] for job in jobs):
+			if not name.endswith(chunkmap.EXTENSION):
+				levelcache.load(name).close()
+
+	pool = multiprocessing.Pool(processes)
+	try:
+		results = pool.map(run, jobs, chunksize=1)
+	finally:
+		pool.close()
+		pool.join()
+	return results
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('maps', nargs='*', default=['logic-map-1.tmx'])
+	parser.add_argument('--seeds', type=int, default=100, help='runs with random scripts per map')
+	parser.add_argument('--first-seed', type=int, default=0)
+	parser.add_argument('--replay', nargs='*', default=[],
+						help='input recordings to run on every map as well')
+	parser.add_argument('--frames', type=int, default=6000, help='most frames per run')
+	parser.add_argument('--keep-going', action='store_true',
+						help="don't stop runs when they complete the level")
+	parser.add_argument('--processes', type=int, help='default: one per core')
+	parser.add_argument('--output', help='file to write the JSON to, instead of stdout')
+	args = parser.parse_args()
+
+	jobs = []
+	for map_name in args.maps:
+		for seed in xrange(args.first_seed, args.first_seed + args.seeds):
+			jobs.append({'map': map_name, 'seed': seed, 'frames': args.frames})
+		for replay in args.replay:
+			jobs.append({'map': map_name, 'replay': replay, 'frames': args.frames})
+	for job in jobs:
+		job['stop_on_complete'] = not args.keep_going
+
+	start = time.time()
+	results = run_all(jobs, args.processes)
+	elapsed = time.time() - start
+
+	frames = sum(result['frames_simulated'] for result in results)
+	completed = sum(result['completed'] for result in results)
+	sys.stderr.write('{} runs, {} completed, {} frames in {:.2f}s ({:.0f} frames/s)\n'.format(
+					 len(results), completed, frames, elapsed, frames / elapsed))
+
+	output = {
+		'step': config.STEP,
+		'seconds': elapsed,
+		'runs': results,
+	}
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(output, f, indent=2, sort_keys=True)
+	else:
+		json.dump(output, sys.stdout, indent=2, sort_keys=True)
+		print
+
+if __name__ == '__main__':
+	main()
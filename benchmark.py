@@ -0,0 +1,208 @@
+"""
+Deterministic benchmark of the ECS hot loop at growing entity counts.
+
+For each entity count a synthetic level is built headless, with a player
+like the one in main.py driven by scripted input, and the other entities made
+like it but without a PlayerInput, walking and jumping to the same script
+through their Velocity.  They collide with copies of logic-map-1.tmx laid side
+by side so that the crowding stays the same as the count grows.  The standard
+systems are then run for a number of frames and the timings are written out as
+JSON.
+
+Only the player has a PlayerInput, as in a real level, since the systems that
+follow the player, like PlayerViewTrackerSystem, would otherwise run once per
+entity.
+
+Entities are never put to sleep, so that every one of them is simulated no
+matter where the view is.
+
+Usage:
+
+	python benchmark.py [--sizes 100,1000,10000] [--frames 120] [--output results.json]
+
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+
+import headless # sets up headless mode, so it comes before the other game modules
+import ecs
+import config
+import collisionmap
+import common
+import jumper
+import level
+import profiler
+import arraystore
+
+MAP = 'logic-map-1.tmx'
+
+ENTITIES_PER_MAP = 100 # entities for every copy of the map
+
+SCRIPT_GROUPS = 8 # entities follow the script in this many groups, each offset in it
+
+# (frames, inputs) pairs which the script groups loop through
+SCRIPT = (
+	(60, {'HORIZONTAL_1': 1.0}),
+	(5, {'HORIZONTAL_1': 1.0, 'JUMP': 1}),
+	(40, {'HORIZONTAL_1': 1.0}),
+	(30, {}),
+	(60, {'HORIZONTAL_1': -1.0}),
+	(5, {'JUMP': 1}),
+	(30, {'HORIZONTAL_1': -1.0}),
+)
+
+def script_inputs(frame):
+	"""
+	Returns the scripted inputs for a frame
+	"""
+	frame %= sum(length for length, inputs in SCRIPT)
+	for length, inputs in SCRIPT:
+		if frame < length:
+			return inputs
+		frame -= length
+
+def group_inputs(group, frame):
+	"""
+	Returns the scripted inputs of a group for a frame
+	"""
+	return script_inputs(frame + group * 17)
+
+class ScriptedWalkerSystem(ecs.System):
+	"""
+	Walks and jumps the entities with a Jumper but no PlayerInput to the script,
+	like WalkerSystem and JumperSystem do for players
+	"""
+	def __init__(self, groups):
+		super(ScriptedWalkerSystem, self).__init__()
+
+		self.reads = (common.PlayerInput,)
+		self.writes = (jumper.Jumper, common.Velocity)
+		self.groups = groups # e_id -> script group
+
+	def update(self, dt, entity_manager):
+		# the level's frame count, so the script follows snapshots that are restored
+		frame = self.sys_man.parent.frames
+		inputs = [group_inputs(group, frame) for group in xrange(SCRIPT_GROUPS)]
+		walkers = entity_manager.view(jumper.Jumper, common.Velocity,
+									  exclude=(common.PlayerInput,))
+		for e_id, walker, vel in walkers:
+			scripted = inputs[self.groups[e_id]]
+			vel.v_x = scripted.get('HORIZONTAL_1', 0) * walker.walk
+			if abs(vel.v_y) > 0:
+				walker.in_air = True
+			if scripted.get('JUMP') and not walker.in_air:
+				vel.v_y = walker.jump
+				walker.in_air = True
+
+def tiled_collision_map(copies):
+	"""
+	Returns a CollisionMap of copies of MAP side by side.  Flags are stored a
+	column at a time, so repeating them repeats the map to the right.
+	"""
+	base = collisionmap.CollisionMap.from_tmx(headless.map_path(MAP), 'Structure')
+	return collisionmap.CollisionMap(base.width * copies, base.height,
+									 base.tile_width, base.tile_height,
+									 base.flags * copies)
+
+def build(count, seed=0):
+	"""
+	Builds a HeadlessLevel with a scripted player and count - 1 scripted
+	walkers.  Returns (level, the player's input dictionary).
+	"""
+	cm = tiled_collision_map(max(1, count // ENTITIES_PER_MAP))
+	bench_level = headless.HeadlessLevel(cm)
+	database = bench_level.database
+
+	robot = headless.robot_sprite()
+	width, height = robot.width, robot.height
+	player_input = headless.player_input()
+	rng = random.Random(seed)
+	map_width = cm.width * cm.tile_width
+	map_height = cm.height * cm.tile_height
+
+	groups = {}
+	for n in xrange(count):
+		e_id = level.add_player(database, headless.StubSprite(width, height),
+								jumper.JumperAnimation(), None if n else player_input,
+								rng.uniform(width, map_width - width),
+								rng.uniform(2*height, map_height - height))
+		if n:
+			groups[e_id] = n % SCRIPT_GROUPS
+
+	level.add_standard_systems(bench_level, activation_system=False)
+	bench_level.systems.add_system(ScriptedWalkerSystem(groups), 1) # with WalkerSystem
+	return bench_level, player_input.input
+
+def drive(input_dict, frame):
+	"""
+	Sets the player's input dictionary to what the script says for frame
+	"""
+	scripted = group_inputs(0, frame)
+	for name in input_dict:
+		input_dict[name] = scripted.get(name, 0)
+
+def run(count, frames, warmup=10, seed=0):
+	"""
+	Builds a level of count entities and times frames steps of it, after warmup
+	untimed steps.  Returns a dictionary of results.
+	"""
+	bench_level, inputs = build(count, seed)
+
+	for frame in xrange(warmup):
+		drive(inputs, frame)
+		bench_level.step()
+
+	bench_level.systems.profiler = profiler.FrameProfiler(capacity=frames)
+	for frame in xrange(warmup, warmup + frames):
+		drive(inputs, frame)
+		bench_level.step()
+
+	stats = bench_level.systems.profiler.stats()
+	systems = dict((name, {'min_ms': low*1000, 'mean_ms': mean*1000, 'p99_ms': p99*1000})
+				   for name, low, mean, p99 in stats)
+	seconds = sum(bench_level.systems.profiler.samples('frame'))
+	return {
+		'entities': count,
+		'frames': frames,
+		'seconds': seconds,
+		'frames_per_second': frames / seconds,
+		'us_per_entity_frame': seconds / frames / count * 1e6,
+		'systems': systems,
+	}
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--sizes', default='100,1000,10000',
+						help='comma separated entity counts')
+	parser.add_argument('--frames', type=int, default=120, help='timed frames per size')
+	parser.add_argument('--warmup', type=int, default=10, help='untimed frames per size')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--output', help='file to write the JSON to, instead of stdout')
+	args = parser.parse_args()
+
+	results = {
+		'map': MAP,
+		'step': config.STEP,
+		'array_store': bool(config.ARRAY_STORE and arraystore.numpy is not None),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'runs': [],
+	}
+	for count in [int(size) for size in args.sizes.split(',')]:
+		result = run(count, args.frames, args.warmup, args.seed)
+		results['runs'].append(result)
+		sys.stderr.write('{:>7} entities: {:9.1f} frames/s, {:6.2f} us per entity per frame\n'.format(
+						 count, result['frames_per_second'], result['us_per_entity_frame']))
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent=2, sort_keys=True)
+	else:
+		json.dump(results, sys.stdout, indent=2, sort_keys=True)
+		print
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,122 @@
+"""
+Gets the environment ready for the game's modules, and times startup.
+
+config only holds settings, so that importing it, and with it any module of
+the game, costs nothing.  Anything with side effects is done here instead,
+once, by importing this module before ecs, util, cocos or pyglet:
+
+	adds the libraries in config.LIB_DIR to sys.path
+
+	in headless mode, stops pyglet from making a hidden window, which has to
+	happen before cocos is imported
+
+pyglet's resource path, which cocos.tiles.load and pyglet.resource lookups
+use, is only set up and indexed when resources() is first called, right
+before something is looked up, rather than when the game starts.
+
+mark() records how long it took to get to a point of startup, and report()
+lists the marks.  Run this module to time importing the game's modules, each
+in a fresh interpreter.
+
+Usage:
+
+	python bootstrap.py [--headless] [module ...]
+
+"""
+import os
+import sys
+import time
+
+_start = time.time()
+
+import config
+
+_marks = [] # (label, time)
+_resources = False
+
+def add_library_paths():
+	"""
+	Adds each directory in config.LIB_DIR to sys.path, if it isn't there yet
+	"""
+	if not os.path.isdir(config.LIB_DIR): # build machines may have the libraries installed instead
+		return
+	for lib in sorted(os.listdir(config.LIB_DIR)):
+		path = os.path.join(config.LIB_DIR, lib)
+		if path not in sys.path:
+			sys.path.append(path)
+
+def configure_pyglet():
+	"""
+	Sets the pyglet options the game needs before pyglet makes any windows
+	"""
+	if config.HEADLESS:
+		import pyglet
+		# cocos can be imported without a display, as long as pyglet doesn't make
+		# a hidden window to hold a GL context
+		pyglet.options['shadow_window'] = False
+
+def resources():
+	"""
+	Returns pyglet.resource, with config.MAPS_DIR and config.IMAGES_DIR on its
+	path
+	"""
+	global _resources
+	import pyglet
+	if not _resources:
+		_resources = True
+		# absolute, since pyglet takes relative paths to be from the script
+		# that was run, which tools and tests may run from elsewhere
+		pyglet.resource.path.append(os.path.join(config.GAME_DIR, config.MAPS_DIR))
+		pyglet.resource.path.append(os.path.join(config.GAME_DIR, config.IMAGES_DIR))
+		# something may have looked up a resource before, and pyglet only sees
+		# new paths when it indexes again.  Callers are about to look something
+		# up, which would index the path now anyway.
+		pyglet.resource.reindex()
+	return pyglet.resource
+
+def mark(label):
+	"""
+	Records that startup got to label
+	"""
+	_marks.append((label, time.time()))
+
+def report():
+	"""
+	Returns a list of lines with the time since bootstrap was imported at each
+	mark, and the time since the mark before it
+	"""
+	lines = []
+	last = _start
+	for label, when in _marks:
+		lines.append('{:<24} {:8.1f} ms {:+8.1f} ms'.format(label, (when - _start) * 1000,
+															 (when - last) * 1000))
+		last = when
+	return lines
+
+add_library_paths()
+configure_pyglet()
+mark('bootstrap')
+
+MODULES = ('config', 'bootstrap', 'entitymanager', 'common', 'jumper', 'level', 'headless')
+
+def main():
+	import argparse
+	import subprocess
+
+	parser = argparse.ArgumentParser(description='Times importing modules of the game, '
+												 'each in a fresh interpreter')
+	parser.add_argument('modules', nargs='*', default=list(MODULES))
+	parser.add_argument('--headless', action='store_true')
+	args = parser.parse_args()
+
+	env = dict(os.environ)
+	if args.headless:
+		env['LOGIC_GAME_HEADLESS'] = '1'
+	for module in args.modules:
+		code = ('import time; start = time.time(); import {}; '
+				'print (time.time() - start) * 1000'.format(module))
+		out = subprocess.check_output([sys.executable, '-c', code], cwd=config.GAME_DIR, env=env)
+		print '{:<24} {:8.1f} ms'.format(module, float(out.split()[-1]))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,457 @@
+"""
+A chunked map format, and a map that streams its chunks in around the focus.
+
+A TMX map is read all at once, so the time to load a level and the memory it
+takes grow with its width.  A chunk file splits one layer of a map into square
+chunks of tiles, each compressed on its own, with an index of where they are in
+the file, so that only the chunks near the player need to be read and decoded.
+
+With config.STREAM_MAP set, main.py loads its map with load, which keeps a
+chunk file of it in config.CACHE_DIR, and draws it with a ChunkLayer.
+
+File layout, all little-endian:
+
+	header			: magic 'LGCM', version, chunk size in tiles, map width and
+					  height in tiles, tile width and height in pixels
+	metadata		: length, then JSON with the layer name and the tilesets
+	index			: (offset, length) of every chunk, a column of chunks at a time
+	chunks			: zlib-compressed gids, as 32 bit unsigned ints, then edge
+					  flags, one byte per tile; both in the column-major order
+					  of a CollisionMap, and padded to a full chunk at the edges
+
+Usage:
+
+	python chunkmap.py map.tmx [layer] [output]
+
+"""
+import array
+import json
+import os
+import Queue
+import struct
+import sys
+import threading
+import zlib
+
+import bootstrap
+import cocos
+import ecs
+import pyglet
+import config
+import collisionmap
+import tmx
+
+MAGIC = 'LGCM'
+VERSION = 1
+EXTENSION = '.chunks'
+
+_HEADER = struct.Struct('<4sHHIIHH')
+_LENGTH = struct.Struct('<I')
+_ENTRY = struct.Struct('<II')
+
+class Chunk(object):
+	"""
+	The tiles of one chunk of a map.
+
+	cx, cy	: position of the chunk, in chunks
+
+	gids	: array of global tile ids; those of cell (a, b) of the chunk are at
+			  gids[a*chunk_size + b]
+
+	flags	: bytearray of edge flags, in the same order as gids
+
+	"""
+	__slots__ = ('cx', 'cy', 'gids', 'flags')
+
+	def __init__(self, cx, cy, gids, flags):
+		self.cx = cx
+		self.cy = cy
+		self.gids = gids
+		self.flags = flags
+
+class ChunkedMap(collisionmap.CollisionMap):
+	"""
+	A CollisionMap read from a chunk file, that only keeps the chunks around its
+	focus in memory.
+
+	set_focus loads the chunks within radius chunks of the focus, if they aren't
+	loaded already, asks a background thread to decode the ring of chunks
+	around those, and evicts chunks further away than that.  A chunk that
+	isn't loaded is read there and then when flags_at or flagged_cells need
+	it, so entities far from the focus still collide with the map, and it
+	stays loaded until the focus moves to another chunk.
+
+	Functions in on_load and on_evict are called with a Chunk when it is loaded
+	or evicted, on the thread that calls set_focus, for anything that mirrors
+	the loaded part of the map.
+
+	flags is None; the flags are kept in the chunks.
+
+	"""
+	def __init__(self, path, radius=1, prefetch=True):
+		self.path = path
+		with open(path, 'rb') as f:
+			(magic, version, self.chunk_size, self.width, self.height,
+			 self.tile_width, self.tile_height) = _HEADER.unpack(f.read(_HEADER.size))
+			if magic != MAGIC:
+				raise ValueError('{} is not a chunk file'.format(path))
+			if version != VERSION:
+				raise ValueError('{} is version {} of the chunk format, not {}'.format(
+								 path, version, VERSION))
+			length, = _LENGTH.unpack(f.read(_LENGTH.size))
+			meta = json.loads(f.read(length))
+
+			cs = self.chunk_size
+			self.chunks_x = -(-self.width // cs)
+			self.chunks_y = -(-self.height // cs)
+			count = self.chunks_x * self.chunks_y
+			raw = f.read(_ENTRY.size * count)
+			self._index = [_ENTRY.unpack_from(raw, n * _ENTRY.size) for n in xrange(count)]
+
+		base = os.path.dirname(path)
+		self.layer_name = meta['layer']
+		self.tilesets = [(firstgid, os.path.join(base, image))
+						 for firstgid, image in meta['tilesets']]
+		self.origin_x = self.origin_y = 0
+		self.flags = None
+
+		self.radius = radius
+		self.chunks = {} # (cx, cy) -> Chunk
+		self.focus_chunk = None
+		self.on_load = []
+		self.on_evict = []
+
+		self._file = open(path, 'rb')
+		self._pending = set() # chunks asked for but not collected yet
+		self._requests = Queue.Queue()
+		self._decoded = Queue.Queue()
+		self._thread = None
+		if prefetch:
+			self._thread = threading.Thread(target=self._prefetch, name='chunk prefetch')
+			self._thread.daemon = True
+			self._thread.start()
+
+	def close(self):
+		"""
+		Stops the prefetch thread and closes the file
+		"""
+		if self._thread is not None:
+			self._requests.put(None)
+			self._thread.join()
+			self._thread = None
+		self._file.close()
+
+	def chunk_for_cell(self, i, j):
+		return i // self.chunk_size, j // self.chunk_size
+
+	def set_focus(self, x, y):
+		"""
+		Makes sure the chunks around the point (x, y), in pixels, are loaded
+		"""
+		self._collect()
+
+		cx, cy = self.chunk_for_cell(int(x // self.tile_width), int(y // self.tile_height))
+		cx = min(max(cx, 0), self.chunks_x - 1)
+		cy = min(max(cy, 0), self.chunks_y - 1)
+		if (cx, cy) == self.focus_chunk:
+			return
+		self.focus_chunk = (cx, cy)
+
+		for key in self._around(cx, cy, self.radius):
+			if key not in self.chunks:
+				# needed now, so it can't wait for the prefetch thread
+				self._add(self._read(self._file, key))
+
+		if self._thread is not None:
+			for key in self._around(cx, cy, self.radius + 1):
+				if key not in self.chunks and key not in self._pending:
+					self._pending.add(key)
+					self._requests.put(key)
+
+		# evicting a ring further out than is prefetched stops chunks from
+		# being reloaded when the focus moves back and forth over an edge
+		for key in [k for k in self.chunks if not self._near(k, self.radius + 2)]:
+			chunk = self.chunks.pop(key)
+			for func in self.on_evict:
+				func(chunk)
+
+	def require(self, i_1, j_1, i_2, j_2):
+		"""
+		Loads the chunks of the cells in columns i_1 to i_2 and rows j_1 to
+		j_2, not including i_2 and j_2, that aren't loaded
+		"""
+		cx_1, cy_1 = self.chunk_for_cell(max(0, i_1), max(0, j_1))
+		cx_2, cy_2 = self.chunk_for_cell(min(self.width, i_2) - 1, min(self.height, j_2) - 1)
+		for cx in xrange(cx_1, cx_2 + 1):
+			for cy in xrange(cy_1, cy_2 + 1):
+				if (cx, cy) not in self.chunks:
+					self._load((cx, cy))
+
+	def gid_at(self, i, j):
+		"""
+		Returns the gid of cell (i, j), or 0 if it is off the map or its chunk
+		isn't loaded
+		"""
+		chunk = self._chunk_at(i, j)
+		if chunk is None:
+			return 0
+		cs = self.chunk_size
+		return chunk.gids[(i - chunk.cx*cs)*cs + j - chunk.cy*cs]
+
+	def flags_at(self, i, j):
+		if not (0 <= i < self.width and 0 <= j < self.height):
+			return 0
+		key = self.chunk_for_cell(i, j)
+		chunk = self.chunks.get(key) or self._load(key)
+		cs = self.chunk_size
+		return chunk.flags[(i - chunk.cx*cs)*cs + j - chunk.cy*cs]
+
+	def flagged_cells(self, i_1, j_1, i_2, j_2):
+		cs = self.chunk_size
+		chunks = self.chunks
+		for i in xrange(i_1, i_2):
+			cx, a = divmod(i, cs)
+			j = j_1
+			while j < j_2:
+				cy = j // cs
+				end = min(j_2, (cy + 1) * cs)
+				chunk = chunks.get((cx, cy)) or self._load((cx, cy))
+				flags = chunk.flags
+				offset = a*cs - cy*cs
+				for jj in xrange(j, end):
+					f = flags[offset + jj]
+					if f:
+						yield i, jj, f
+				j = end
+
+	def _chunk_at(self, i, j):
+		if 0 <= i < self.width and 0 <= j < self.height:
+			return self.chunks.get(self.chunk_for_cell(i, j))
+		return None
+
+	def _around(self, cx, cy, radius):
+		for x in xrange(max(0, cx - radius), min(self.chunks_x, cx + radius + 1)):
+			for y in xrange(max(0, cy - radius), min(self.chunks_y, cy + radius + 1)):
+				yield x, y
+
+	def _near(self, key, radius):
+		fx, fy = self.focus_chunk
+		return abs(key[0] - fx) <= radius and abs(key[1] - fy) <= radius
+
+	def _load(self, key):
+		"""
+		Reads a chunk that is needed before set_focus got to it
+		"""
+		chunk = self._read(self._file, key)
+		self._add(chunk)
+		return chunk
+
+	def _add(self, chunk):
+		self.chunks[(chunk.cx, chunk.cy)] = chunk
+		for func in self.on_load:
+			func(chunk)
+
+	def _collect(self):
+		"""
+		Adds the chunks the prefetch thread has decoded, unless the focus has
+		moved away from them or they were loaded in the meantime
+		"""
+		while True:
+			try:
+				chunk = self._decoded.get_nowait()
+			except Queue.Empty:
+				return
+			key = (chunk.cx, chunk.cy)
+			self._pending.discard(key)
+			if key not in self.chunks and self._near(key, self.radius + 1):
+				self._add(chunk)
+
+	def _read(self, f, key):
+		cx, cy = key
+		offset, length = self._index[cx*self.chunks_y + cy]
+		f.seek(offset)
+		raw = zlib.decompress(f.read(length))
+		count = self.chunk_size * self.chunk_size
+		gids = array.array('I')
+		gids.fromstring(raw[:4*count])
+		if sys.byteorder == 'big':
+			gids.byteswap()
+		return Chunk(cx, cy, gids, bytearray(raw[4*count:]))
+
+	def _prefetch(self):
+		# the thread has its own file, so that its seeks don't move the main one
+		with open(self.path, 'rb') as f:
+			while True:
+				key = self._requests.get()
+				if key is None:
+					return
+				self._decoded.put(self._read(f, key))
+
+class ChunkStreamingSystem(ecs.System):
+	"""
+	Moves the focus of the level's ChunkedMap to the scroller's focus.  Should
+	run after PlayerViewTrackerSystem.
+	"""
+	def __init__(self):
+		super(ChunkStreamingSystem, self).__init__()
+
+		self.reads = ('scroller',)
+		self.writes = ('collision_map',)
+
+	def update(self, dt, entity_manager):
+		level = self.sys_man.parent
+		level.collision_map.set_focus(level.scroller.restricted_fx,
+									  level.scroller.restricted_fy)
+
+class ChunkLayer(cocos.layer.ScrollableLayer):
+	"""
+	Draws a ChunkedMap, for Level.set_foreground, in place of the RectMapLayer
+	of the whole map.
+
+	Like a RectMapLayer, it only has sprites for the cells in view, and they
+	are updated when the view moves or a chunk in it is loaded.  Chunks in
+	view that the map hasn't loaded yet are loaded for it.  px_width and
+	px_height are those of the whole map, so that the scroller keeps the view
+	on the map rather than on the chunks that are loaded.  Needs a GL
+	context, for the tileset textures.
+
+	"""
+	def __init__(self, chunked_map):
+		super(ChunkLayer, self).__init__()
+
+		self.map = chunked_map
+		tw, th = chunked_map.tile_width, chunked_map.tile_height
+		self.px_width = chunked_map.width * tw
+		self.px_height = chunked_map.height * th
+		self.tiles = {} # gid -> cocos.tiles.Tile
+		for firstgid, image in chunked_map.tilesets:
+			name = os.path.splitext(os.path.basename(image))[0]
+			self.tiles.update(cocos.tiles.TileSet.from_atlas(name, firstgid, image, tw, th))
+		self._sprites = {} # (i, j) -> pyglet Sprite of the cell
+		self._in_view = None # (i_1, j_1, i_2, j_2) of the cells in view
+		chunked_map.on_load.append(self._loaded)
+
+	def set_view(self, x, y, w, h, viewport_ox=0, viewport_oy=0):
+		super(ChunkLayer, self).set_view(x, y, w, h, viewport_ox, viewport_oy)
+
+		tw, th = self.map.tile_width, self.map.tile_height
+		in_view = (max(0, int(x // tw)), max(0, int(y // th)),
+				   min(self.map.width, int((x + w) // tw) + 1),
+				   min(self.map.height, int((y + h) // th) + 1))
+		# the view can get ahead of the focus, and the chunks loaded for it
+		# are drawn below rather than as each one is loaded
+		self._in_view = None
+		self.map.require(*in_view)
+		self._in_view = in_view
+		self._update_sprites()
+
+	def _loaded(self, chunk):
+		if self._in_view is None:
+			return
+		cs = self.map.chunk_size
+		i_1, j_1, i_2, j_2 = self._in_view
+		if (chunk.cx*cs < i_2 and i_1 < (chunk.cx + 1)*cs and
+				chunk.cy*cs < j_2 and j_1 < (chunk.cy + 1)*cs):
+			self._update_sprites()
+
+	def _update_sprites(self):
+		tw, th = self.map.tile_width, self.map.tile_height
+		i_1, j_1, i_2, j_2 = self._in_view
+		old = self._sprites
+		sprites = {}
+		for i in xrange(i_1, i_2):
+			for j in xrange(j_1, j_2):
+				gid = self.map.gid_at(i, j)
+				if not gid:
+					continue
+				sprite = old.pop((i, j), None)
+				if sprite is None:
+					sprite = pyglet.sprite.Sprite(self.tiles[gid].image, x=i*tw, y=j*th,
+												  batch=self.batch)
+				sprites[(i, j)] = sprite
+		for sprite in old.itervalues():
+			sprite.delete()
+		self._sprites = sprites
+
+def write(path, layer, chunk_size=32):
+	"""
+	Writes a tmx.TileLayer to a chunk file at path
+	"""
+	width, height = layer.width, layer.height
+	cs = chunk_size
+	chunks_x = -(-width // cs)
+	chunks_y = -(-height // cs)
+
+	edges = {} # gid -> edge flags
+	for gid, properties in layer.properties.iteritems():
+		edges[gid] = collisionmap.edge_flags(properties.get)
+
+	base = os.path.dirname(os.path.abspath(path))
+	meta = json.dumps({
+		'layer': layer.name,
+		'tilesets': [(firstgid, os.path.relpath(image, base).replace(os.sep, '/'))
+					 for firstgid, image in layer.tilesets],
+	})
+
+	payloads = []
+	for cx in xrange(chunks_x):
+		for cy in xrange(chunks_y):
+			gids = array.array('I', [0] * (cs*cs))
+			flags = bytearray(cs*cs)
+			for a in xrange(cs):
+				i = cx*cs + a
+				if i >= width:
+					break
+				for b in xrange(cs):
+					j = cy*cs + b
+					if j >= height:
+						break
+					gid = layer.gid_at(i, j)
+					gids[a*cs + b] = gid
+					flags[a*cs + b] = edges.get(gid, 0)
+			if sys.byteorder == 'big':
+				gids.byteswap()
+			payloads.append(zlib.compress(gids.tostring() + str(flags)))
+
+	offset = _HEADER.size + _LENGTH.size + len(meta) + _ENTRY.size * len(payloads)
+	with open(path, 'wb') as f:
+		f.write(_HEADER.pack(MAGIC, VERSION, cs, width, height,
+							 layer.tile_width, layer.tile_height))
+		f.write(_LENGTH.pack(len(meta)))
+		f.write(meta)
+		for payload in payloads:
+			f.write(_ENTRY.pack(offset, len(payload)))
+			offset += len(payload)
+		for payload in payloads:
+			f.write(payload)
+
+def convert(tmx_path, layer_name='Structure', path=None, chunk_size=32):
+	"""
+	Converts a layer of a TMX file to a chunk file, by default next to it with
+	the same name.  Returns the chunk file's path.
+	"""
+	if path is None:
+		path = os.path.splitext(tmx_path)[0] + EXTENSION
+	write(path, tmx.load_layer(tmx_path, layer_name), chunk_size)
+	return path
+
+def load(name, layer_name='Structure', radius=1):
+	"""
+	Returns a ChunkedMap of a layer of a TMX file in config.MAPS_DIR, from a
+	chunk file in config.CACHE_DIR, which is made first if it is missing or
+	older than the TMX file
+	"""
+	tmx_path = os.path.join(config.GAME_DIR, config.MAPS_DIR, name)
+	path = os.path.join(config.GAME_DIR, config.CACHE_DIR,
+						'{}.{}{}'.format(os.path.basename(name), layer_name, EXTENSION))
+	if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(tmx_path):
+		directory = os.path.dirname(path)
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		convert(tmx_path, layer_name, path)
+	return ChunkedMap(path, radius)
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2:
+		sys.exit(__doc__)
+	print convert(*sys.argv[1:4])
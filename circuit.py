@@ -0,0 +1,266 @@
+"""
+Compiles the gates of a level into a netlist that evaluates many input
+combinations at once, for checking puzzle solutions.
+
+The SignalSystem evaluates a circuit one input change at a time, which is
+what the game needs, but checking a puzzle means trying every combination of
+its inputs.  A Netlist is the circuit's gates in topological order, with the
+signals they read as indexes, and it evaluates them on bit vectors: bit k of
+every signal is its value for combination k.  Each gate is then one bitwise
+operation for all the combinations together.
+
+With numpy the vectors are arrays of 64 bit words; without it they are Python
+ints as wide as they need to be.  Either way, checking all 65536 combinations
+of 16 inputs is a few thousand word operations per gate.
+
+Example:
+
+	netlist = circuit.compile(level.database)
+	wrong = circuit.check(netlist, lambda a, b, c: (a and b) or c)
+	if wrong is not None:
+		print 'fails for inputs', wrong
+
+"""
+import operator
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+import signals
+
+WORD_BITS = 64
+
+class Netlist(object):
+	"""
+	A circuit of gates in topological order.
+
+	inputs	: e_ids of the Triggers that are the inputs, in order
+
+	outputs	: e_ids of the Actuators that are the outputs, in order
+
+	gates	: (e_id, op, signal indexes of its inputs) of each gate and output,
+			  in an order where every gate comes after those wired to it.
+			  Signals 0 to len(inputs) - 1 are the inputs, and the signal of
+			  gates[n] is len(inputs) + n.  Outputs are 'BUF' gates at the
+			  end.
+
+	"""
+	def __init__(self, inputs, outputs, gates):
+		self.inputs = inputs
+		self.outputs = outputs
+		self.gates = gates
+
+	def evaluate(self, vectors, width=None):
+		"""
+		Evaluates the circuit on a bit vector for each input, numpy arrays of
+		uint64 words or ints, and returns a list of the outputs' bit vectors.
+		width is the number of bits in use, which inverting gates need for ints.
+		"""
+		if len(vectors) != len(self.inputs):
+			raise ValueError('{} inputs given for {}'.format(len(vectors), len(self.inputs)))
+		if numpy is not None and isinstance(vectors[0] if vectors else None, numpy.ndarray):
+			zero = numpy.zeros_like(vectors[0])
+			invert = operator.invert
+		else:
+			zero = 0
+			def invert(vector):
+				if width is None:
+					raise ValueError('inverting gates need the width of int vectors')
+				return vector ^ ((1 << width) - 1)
+
+		vectors = list(vectors) # then the output of each gate
+		for e_id, op, sources in self.gates:
+			values = [vectors[n] for n in sources]
+			if op in ('BUF', 'NOT', 'OR', 'NOR'):
+				value = reduce(operator.or_, values) if values else zero
+			elif op in ('AND', 'NAND'):
+				value = reduce(operator.and_, values) if values else zero
+			else: # XOR, XNOR
+				value = reduce(operator.xor, values) if values else zero
+			if op in ('NOT', 'NOR', 'NAND', 'XNOR'):
+				value = invert(value)
+			vectors.append(value)
+		return vectors[len(vectors) - len(self.outputs):]
+
+def compile(entity_manager, inputs=None, outputs=None):
+	"""
+	Returns a Netlist of the signals components in entity_manager.  inputs and
+	outputs are lists of the e_ids of Triggers and Actuators, by default all
+	of them in order of e_id.  Gates that no output depends on are left out.
+
+	Raises ValueError if the circuit has a loop, since a netlist can't hold
+	state.
+	"""
+	triggers = entity_manager.components(signals.Trigger)
+	gates = entity_manager.components(signals.Gate)
+	actuators = entity_manager.components(signals.Actuator)
+	if inputs is None:
+		inputs = sorted(triggers)
+	if outputs is None:
+		outputs = sorted(actuators)
+
+	sources = {} # e_id -> [source e_id, ...]
+	for e_id, wire in entity_manager.components(signals.Wire).iteritems():
+		sources.setdefault(wire.target, []).append((e_id, wire.source))
+	for wires in sources.itervalues():
+		wires.sort() # in the order the wires were made
+	for e_id in sources:
+		sources[e_id] = [source for wire, source in sources[e_id]]
+
+	index = dict((e_id, n) for n, e_id in enumerate(inputs))
+	order = []
+	# depth first from the outputs, so every gate comes after its sources
+	state = {}
+	for output in outputs:
+		stack = [(output, iter(sources.get(output, ())))]
+		state[output] = 1
+		while stack:
+			e_id, pending = stack[-1]
+			for source in pending:
+				if source in index:
+					continue
+				if state.get(source) == 1:
+					raise ValueError('the circuit loops through {}'.format(source))
+				if source not in state:
+					if source not in gates:
+						raise ValueError('{} is wired to {}, which is not an input or a gate'.format(
+										 source, e_id))
+					state[source] = 1
+					stack.append((source, iter(sources.get(source, ()))))
+					break
+			else:
+				stack.pop()
+				state[e_id] = 2
+				if e_id in gates:
+					index[e_id] = len(inputs) + len(order)
+					order.append(e_id)
+
+	compiled = [(e_id, gates[e_id].op, [index[source] for source in sources.get(e_id, ())])
+				for e_id in order]
+	compiled += [(e_id, 'BUF', [index[source] for source in sources.get(e_id, ())])
+				 for e_id in outputs]
+	return Netlist(list(inputs), list(outputs), compiled)
+
+def exhaustive_inputs(count):
+	"""
+	Returns bit vectors of count inputs that together hold every combination
+	of them, with input n set to bit n of the combination's number, and the
+	number of combinations
+	"""
+	combinations = 1 << count
+	if numpy is None:
+		vectors = []
+		for n in xrange(count):
+			# runs of 2**n zeros then 2**n ones
+			run = ((1 << (1 << n)) - 1) << (1 << n)
+			period = 2 << n
+			pattern = 0
+			for offset in xrange(0, combinations, period):
+				pattern |= run << offset
+			vectors.append(pattern)
+		return vectors, combinations
+
+	words = max(1, combinations // WORD_BITS)
+	bit = numpy.arange(WORD_BITS, dtype=numpy.uint64)
+	word = numpy.arange(words, dtype=numpy.uint64)
+	one = numpy.uint64(1)
+	vectors = []
+	for n in xrange(count):
+		if (1 << n) < WORD_BITS:
+			# the same pattern in every word
+			pattern = numpy.bitwise_or.reduce(((bit >> numpy.uint64(n)) & one) << bit)
+			vectors.append(numpy.full(words, pattern, dtype=numpy.uint64))
+		else:
+			# whole words on or off
+			on = (word >> numpy.uint64(n - 6)) & one
+			vectors.append(on * numpy.uint64(0xffffffffffffffff))
+	return vectors, combinations
+
+def truth_table(netlist):
+	"""
+	Returns (output bit vectors, number of combinations) for every combination
+	of netlist's inputs
+	"""
+	vectors, combinations = exhaustive_inputs(len(netlist.inputs))
+	return netlist.evaluate(vectors, combinations), combinations
+
+def check(netlist, expected):
+	"""
+	Compares netlist with expected for every combination of its inputs.
+	expected is another Netlist with as many inputs and outputs, or a function
+	taking the inputs as bools and returning the output, or a tuple of them.
+	A function is called once for each combination, which for 16 inputs takes
+	far longer than evaluating the netlists, so a reference netlist is
+	faster to check against.
+
+	Returns None if they agree, otherwise the inputs, as a tuple of bools, of
+	the first combination where they don't.  Raises ValueError if expected
+	has a different number of inputs or outputs.
+	"""
+	outputs, combinations = truth_table(netlist)
+	if isinstance(expected, Netlist):
+		if (len(expected.inputs), len(expected.outputs)) != (len(netlist.inputs),
+															 len(netlist.outputs)):
+			raise ValueError('expected has {} inputs and {} outputs, not {} and {}'.format(
+							 len(expected.inputs), len(expected.outputs),
+							 len(netlist.inputs), len(netlist.outputs)))
+		wanted, combinations = truth_table(expected)
+	else:
+		wanted = _tabulate(expected, len(netlist.inputs), len(outputs), combinations)
+
+	count = len(netlist.inputs)
+	first = None
+	for got, want in zip(outputs, wanted):
+		wrong = _first_bit(got ^ want, combinations)
+		if wrong is not None and (first is None or wrong < first):
+			first = wrong
+	if first is None:
+		return None
+	return tuple(bool(first >> n & 1) for n in xrange(count))
+
+def _tabulate(func, count, outputs, combinations):
+	"""
+	Returns bit vectors of the outputs of a Python function for every
+	combination of count inputs
+	"""
+	bits = [[] for n in xrange(outputs)]
+	for combination in xrange(combinations):
+		result = func(*[bool(combination >> n & 1) for n in xrange(count)])
+		if not isinstance(result, (tuple, list)):
+			result = (result,)
+		if len(result) != outputs:
+			raise ValueError('expected gives {} outputs, not {}'.format(len(result), outputs))
+		for n in xrange(outputs):
+			bits[n].append(bool(result[n]))
+	if numpy is None:
+		return [sum(1 << k for k, on in enumerate(column) if on) for column in bits]
+	vectors = []
+	for column in bits:
+		padded = numpy.zeros(max(WORD_BITS, len(column)), dtype=numpy.uint8)
+		padded[:len(column)] = column
+		# packbits puts the first bit of each byte highest, so each byte is
+		# reversed first, to put bit k of the vector in bit k % 8 of byte k // 8
+		packed = numpy.packbits(padded.reshape(-1, 8)[:, ::-1])
+		vectors.append(packed.view('<u8').astype(numpy.uint64))
+	return vectors
+
+def _first_bit(vector, combinations):
+	"""
+	Returns the number of the lowest set bit of a bit vector below
+	combinations, or None
+	"""
+	if numpy is None or not isinstance(vector, numpy.ndarray):
+		vector &= (1 << combinations) - 1
+		if not vector:
+			return None
+		return (vector & -vector).bit_length() - 1
+	if combinations < WORD_BITS:
+		vector = vector & numpy.uint64((1 << combinations) - 1)
+	nonzero = numpy.flatnonzero(vector)
+	if not len(nonzero):
+		return None
+	n = int(nonzero[0])
+	word = int(vector[n])
+	return n * WORD_BITS + (word & -word).bit_length() - 1
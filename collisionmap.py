@@ -0,0 +1,169 @@
+"""
+A compiled form of a tile-map's collision data.
+
+cocos.tiles.RectMapCollider looks up cells and reads the string "left",
+"right", "top" and "bottom" properties of their tiles on every query.  A
+CollisionMap reads those properties once, when it is built, into one byte of
+edge flags per tile, and collides rects against that.
+
+"""
+import tmx
+
+# Edge flags, one bit for each side of a tile that can't be passed through
+LEFT = 1
+RIGHT = 2
+TOP = 4
+BOTTOM = 8
+
+EDGES = (('left', LEFT), ('right', RIGHT), ('top', TOP), ('bottom', BOTTOM))
+
+class CollisionMap(object):
+	"""
+	Edge flags for every tile of a map, and a collide method that behaves like
+	RectMapCollider.collide_map on the map they were taken from.
+
+	width, height			: size of the map in tiles
+
+	tile_width, tile_height	: size of a tile in pixels
+
+	flags					: a bytearray of edge flags, stored in column-major
+							  order with y increasing up, like the cells of a
+							  RectMapLayer; the flags of cell (i, j) are at
+							  flags[i*height + j]
+
+	"""
+	def __init__(self, width, height, tile_width, tile_height, flags=None, origin=(0, 0)):
+		self.width = width
+		self.height = height
+		self.tile_width = tile_width
+		self.tile_height = tile_height
+		self.origin_x, self.origin_y = origin[:2]
+		if flags is None:
+			flags = bytearray(width * height)
+		if len(flags) != width * height:
+			raise ValueError('expected {} flags, got {}'.format(width * height, len(flags)))
+		self.flags = flags
+
+	@classmethod
+	def from_layer(cls, layer):
+		"""
+		Builds a CollisionMap from a cocos RectMapLayer, reading the edge
+		properties the same way RectMapCollider does.
+		"""
+		width = len(layer.cells)
+		height = len(layer.cells[0])
+		flags = bytearray(width * height)
+		for i, column in enumerate(layer.cells):
+			for j, cell in enumerate(column):
+				if cell is None or cell.tile is None:
+					continue
+				flags[i*height + j] = edge_flags(cell.get)
+		return cls(width, height, layer.tw, layer.th, flags,
+				   (layer.origin_x, layer.origin_y))
+
+	@classmethod
+	def from_tile_layer(cls, layer):
+		"""
+		Builds a CollisionMap from a tmx.TileLayer, without needing cocos or a
+		GL context.
+		"""
+		width = layer.width
+		height = layer.height
+		edges = {} # gid -> edge flags
+		for gid, properties in layer.properties.iteritems():
+			edges[gid] = edge_flags(properties.get)
+		flags = bytearray(width * height)
+		for i in xrange(width):
+			for j in xrange(height):
+				gid = layer.gid_at(i, j)
+				if gid:
+					flags[i*height + j] = edges.get(gid, 0)
+		return cls(width, height, layer.tile_width, layer.tile_height, flags)
+
+	@classmethod
+	def from_tmx(cls, path, layer_name):
+		"""
+		Builds a CollisionMap from the layer called layer_name in a TMX file
+		"""
+		return cls.from_tile_layer(tmx.load_layer(path, layer_name))
+
+	def flags_at(self, i, j):
+		"""
+		Returns the edge flags of cell (i, j), or 0 if it is off the map
+		"""
+		if 0 <= i < self.width and 0 <= j < self.height:
+			return self.flags[i*self.height + j]
+		return 0
+
+	def flagged_cells(self, i_1, j_1, i_2, j_2):
+		"""
+		Yields (i, j, flags) for the cells with flags in columns i_1 to i_2 and
+		rows j_1 to j_2, not including i_2 and j_2, a column at a time, which is
+		the order RectMapCollider checks cells in
+		"""
+		height = self.height
+		flags = self.flags
+		for i in xrange(i_1, i_2):
+			column = i * height
+			for j in xrange(j_1, j_2):
+				f = flags[column + j]
+				if f:
+					yield i, j, f
+
+	def collide(self, last, new):
+		"""
+		Collides a rect moving from last to new with the map.
+
+		Mutates new to conform with the map, and returns (dx, dy), where a
+		non-zero value means that new was pushed back along that axis, by the
+		distance it had moved from last, as RectMapCollider.collide_map does
+		when called with dx and dy of 0.
+		"""
+		tw = self.tile_width
+		th = self.tile_height
+
+		nx, ny, w, h = new.x, new.y, new.width, new.height
+		lx, ly = last.x, last.y
+		l_right = lx + last.width
+		l_top = ly + last.height
+
+		# cells in the region covered by new, as RectMapLayer.get_in_region
+		i_1 = int(max(0, (nx - self.origin_x) // tw))
+		j_1 = int(max(0, (ny - self.origin_y) // th))
+		i_2 = int(min(self.width, (nx + w - self.origin_x) // tw + 1))
+		j_2 = int(min(self.height, (ny + h - self.origin_y) // th + 1))
+
+		dx = dy = 0
+		for i, j, f in self.flagged_cells(i_1, j_1, i_2, j_2):
+			c_left = i * tw
+			c_right = c_left + tw
+			c_bottom = j * th
+			c_top = c_bottom + th
+			if f & TOP and ly >= c_top and ny < c_top:
+				dy = ly - ny
+				ny = c_top
+			if f & LEFT and l_right <= c_left and nx + w > c_left:
+				dx = lx - nx
+				nx = c_left - w
+			if f & RIGHT and lx >= c_right and nx < c_right:
+				dx = lx - nx
+				nx = c_right
+			if f & BOTTOM and l_top <= c_bottom and ny + h > c_bottom:
+				dy = ly - ny
+				ny = c_bottom - h
+
+		if nx != new.x or ny != new.y:
+			new.x = nx
+			new.y = ny
+		return dx, dy
+
+def edge_flags(get):
+	"""
+	Returns the edge flags for a tile, given a function that looks up its
+	properties by name, like Cell.get or dict.get
+	"""
+	f = 0
+	for name, flag in EDGES:
+		if get(name):
+			f |= flag
+	return f
@@ -2,6 +2,7 @@
 Some common components that aren't too specialized.
 
 """
+import bootstrap
 import cocos
 import ecs
 import inputmanager
@@ -9,36 +10,205 @@ import spritesystem
 import jumper
 import config
 import util
+import spatialhash
 
 class Position(ecs.Component):
 	"""
 	An entity's position in 2D space
 	
+	While attached to an arraystore.KinematicStore, x and y are read from and
+	written to the store's arrays.
+	
+	Writing to x or y marks the position changed for systems that track it with
+	EntityManager.track.  Moves made by the store are marked by VelocitySystem.
+	
 	"""
+	__slots__ = ('_x', '_y', '_store', '_slot', '_e_id', '_changes')
+	
 	def __init__(self):
-		self.x = 0
-		self.y = 0
+		self._x = 0
+		self._y = 0
+		self._store = None
+		self._slot = None
+		self._e_id = None
+		self._changes = None
+		
+	def watch(self, e_id, changes):
+		"""
+		Called by the EntityManager with the entity's id and the list of sets to
+		add it to when this position changes, or with None when it is removed
+		"""
+		self._e_id = e_id
+		self._changes = changes
+		
+	def attach(self, store, slot):
+		self._store = store
+		self._slot = slot
+		
+	def detach(self):
+		if self._store is not None:
+			self._x, self._y = self._store.pos[self._slot].tolist()
+		self._store = None
+		self._slot = None
+		
+	@property
+	def x(self):
+		if self._store is None:
+			return self._x
+		return self._store.pos[self._slot, 0]
+		
+	@x.setter
+	def x(self, value):
+		if self._store is None:
+			self._x = value
+		else:
+			self._store.pos[self._slot, 0] = value
+		if self._changes:
+			for changed in self._changes:
+				changed.add(self._e_id)
+			
+	@property
+	def y(self):
+		if self._store is None:
+			return self._y
+		return self._store.pos[self._slot, 1]
+		
+	@y.setter
+	def y(self, value):
+		if self._store is None:
+			self._y = value
+		else:
+			self._store.pos[self._slot, 1] = value
+		if self._changes:
+			for changed in self._changes:
+				changed.add(self._e_id)
 		
 class Velocity(ecs.Component):
 	"""
 	Holds velocity data
 	
+	While attached to an arraystore.KinematicStore, v_x, v_y and use_gravity are
+	read from and written to the store's arrays.
+	
 	"""
+	__slots__ = ('_v_x', '_v_y', '_use_gravity', '_store', '_slot')
+	
 	def __init__(self, x=0, y=0, gravity=True):
-		self.v_x = 0
-		self.v_y = 0
-		self.use_gravity = gravity
+		self._v_x = 0
+		self._v_y = 0
+		self._use_gravity = gravity
+		self._store = None
+		self._slot = None
+		
+	def attach(self, store, slot):
+		self._store = store
+		self._slot = slot
+		
+	def detach(self):
+		if self._store is not None:
+			self._v_x, self._v_y = self._store.vel[self._slot].tolist()
+			self._use_gravity = bool(self._store.gravity[self._slot])
+		self._store = None
+		self._slot = None
+		
+	@property
+	def v_x(self):
+		if self._store is None:
+			return self._v_x
+		return self._store.vel[self._slot, 0]
+		
+	@v_x.setter
+	def v_x(self, value):
+		if self._store is None:
+			self._v_x = value
+		else:
+			self._store.vel[self._slot, 0] = value
+			
+	@property
+	def v_y(self):
+		if self._store is None:
+			return self._v_y
+		return self._store.vel[self._slot, 1]
+		
+	@v_y.setter
+	def v_y(self, value):
+		if self._store is None:
+			self._v_y = value
+		else:
+			self._store.vel[self._slot, 1] = value
+			
+	@property
+	def use_gravity(self):
+		if self._store is None:
+			return self._use_gravity
+		return bool(self._store.gravity[self._slot])
+		
+	@use_gravity.setter
+	def use_gravity(self, value):
+		if self._store is None:
+			self._use_gravity = value
+		else:
+			self._store.gravity[self._slot] = value
 		
 class PlayerInput(ecs.Component):
 	"""
 	Holds an input dictionary from the InputManager
 	
+	pressed and released tell if an input has changed since the last time they
+	were asked about it, using the edge counts of the InputBinding, so that
+	presses shorter than a simulation step aren't missed.  With a plain input
+	dictionary, as in headless runs, they compare it with the last time instead.
+	
+	index is that of the InputBinding, or None for a plain input dictionary.
+	manager is the InputManager the binding is in, inputmanager.inputmanager by
+	default.
+	
 	"""
-	def __init__(self, index=None):
+	__slots__ = ('index', 'input', 'presses', 'releases', '_seen')
+	
+	def __init__(self, index=None, manager=None):
+		self.index = index
 		self.input = None
+		self.presses = None
+		self.releases = None
+		self._seen = {'pressed': {}, 'released': {}} # edge counts or values at the last look
+		
+		if index is not None:
+			if manager is None:
+				manager = inputmanager.inputmanager
+			binding = manager.get_binding(index)
+			self.input = binding.input_dict
+			self.presses = binding.presses
+			self.releases = binding.releases
+			self._seen = {'pressed': dict(self.presses), 'released': dict(self.releases)}
+			
+	def pressed(self, name):
+		"""
+		Returns True if input name was pressed since the last call
+		"""
+		return self._edge(name, self.presses, 'pressed')
+		
+	def released(self, name):
+		"""
+		Returns True if input name was released since the last call
+		"""
+		return self._edge(name, self.releases, 'released')
+		
+	def _edge(self, name, counts, kind):
+		seen = self._seen[kind]
+		if counts is None:
+			held = bool(self.input[name])
+			was = seen.get(name, False)
+			seen[name] = held
+			if kind == 'pressed':
+				return held and not was
+			return was and not held
 		
-		if index:
-			self.input = inputmanager.inputmanager.get_input_dict(index)
+		count = counts[name]
+		if seen.get(name, 0) == count:
+			return False
+		seen[name] = count
+		return True
 			
 class RectCollider(ecs.Component):
 	"""
@@ -46,13 +216,38 @@ class RectCollider(ecs.Component):
 	as well as a flag to indicate whether or not the collider should collide
 	with tile-maps
 	
-	"""			
+	Also keeps a list of callbacks which the EntityCollisionSystem calls when
+	this collider overlaps another one.
+	
+	"""
+	__slots__ = ('collide_with_map', 'hit_rect', 'last', 'callbacks')
+	
 	def __init__(self, x=0, y=0, w=0, h=0, collide_with_map=False):
 		self.collide_with_map = collide_with_map
 		self.hit_rect = cocos.rect.Rect(x,y,w,h)
 		self.last = None
+		self.callbacks = []
+		
+	def register_callback(self, func):
+		"""
+		Registers a function to call when this collider overlaps another.
+		The callback should have the signature:
+		func(e_id, other_e_id)
+		"""
+		self.callbacks.append(func)
 			
 	
+class Asleep(ecs.Component):
+	"""
+	Marks an entity that is too far from the view to be simulated.  Systems
+	leave entities with it out of their views, and arraystore.KinematicStore
+	gives their positions and velocities back to their components.
+	
+	Added and removed by activation.ActivationSystem.
+	
+	"""
+	__slots__ = ()
+	
 class PlayerMoverSystem(ecs.System):
 	"""
 	Moves an entity around according to user input
@@ -60,14 +255,18 @@ class PlayerMoverSystem(ecs.System):
 	Works on entities that have Velocity and PlayerInput
 	
 	"""
+	def __init__(self):
+		super(PlayerMoverSystem, self).__init__()
+		
+		self.reads = (PlayerInput, Asleep)
+		self.writes = (Velocity,)
+		
 	def update(self, dt, entity_manager):
-		players = entity_manager.pairs_for_type(PlayerInput)
+		players = entity_manager.view(PlayerInput, Velocity, exclude=(Asleep,))
 		
-		for e_id, player in players:
-			velocity = entity_manager.component_for_entity(e_id, Velocity)
-			if velocity:
-				velocity.v_x = player.input['HORIZONTAL_1']*100.0
-				velocity.v_y = player.input['VERTICAL_1']*100.0
+		for e_id, player, velocity in players:
+			velocity.v_x = player.input['HORIZONTAL_1']*100.0
+			velocity.v_y = player.input['VERTICAL_1']*100.0
 			
 class VelocitySystem(ecs.System):
 	"""
@@ -75,15 +274,28 @@ class VelocitySystem(ecs.System):
 	
 	Requires Velocity and Position
 	
+	If the entity manager has a KinematicStore, every entity with Velocity and
+	Position is in it, and they are all moved in one vectorized step.  The
+	positions of the entities that moved are then marked changed.
+	
 	"""
+	def __init__(self):
+		super(VelocitySystem, self).__init__()
+		
+		self.reads = (Velocity, Asleep)
+		self.writes = (Position,)
+		
 	def update(self, dt, entity_manager):
-		velocities = entity_manager.pairs_for_type(Velocity)
+		if entity_manager.kinematics is not None:
+			moved = entity_manager.kinematics.integrate(dt)
+			entity_manager.mark_all_changed(moved, Position)
+			return
 		
-		for e_id, velocity in velocities:
-			pos = entity_manager.component_for_entity(e_id, Position)
-			if pos:
-				pos.x += velocity.v_x * dt
-				pos.y += velocity.v_y * dt
+		movers = entity_manager.view(Velocity, Position, exclude=(Asleep,))
+		
+		for e_id, velocity, pos in movers:
+			pos.x += velocity.v_x * dt
+			pos.y += velocity.v_y * dt
 				
 				
 class GravitySystem(ecs.System):
@@ -92,12 +304,26 @@ class GravitySystem(ecs.System):
 	
 	Requires Velocity
 	
+	Velocities in the entity manager's KinematicStore, if it has one, are
+	accelerated in one vectorized step.
+	
 	"""
+	def __init__(self):
+		super(GravitySystem, self).__init__()
+		
+		self.reads = (Asleep,)
+		self.writes = (Velocity,)
+		
 	def update(self, dt, entity_manager):
-		pairs = entity_manager.pairs_for_type(Velocity)
+		velocities = entity_manager.view(Velocity, exclude=(Asleep,))
+		store = entity_manager.kinematics
+		if store is not None:
+			store.apply_gravity(dt, config.GRAVITY)
+			if len(store) == len(velocities):
+				return # no velocities outside of the store
 		
-		for e_id, velocity in pairs:
-			if velocity.use_gravity:
+		for e_id, velocity in velocities:
+			if velocity.use_gravity and (store is None or e_id not in store):
 				velocity.v_y -= dt*config.GRAVITY
 				
 			
@@ -113,7 +339,18 @@ class RectColliderTrackerSystem(ecs.System):
 	it to another system, so as to minimize the side-effects required of other
 	systems.
 	
+	Only colliders whose Position, RectCollider or Sprite changed since the last
+	update are touched, so entities at rest cost nothing.
+	
 	"""
+	def __init__(self):
+		super(RectColliderTrackerSystem, self).__init__()
+		
+		self.reads = (Position, spritesystem.Sprite)
+		self.writes = (RectCollider,)
+		self._changed = None # set from EntityManager.track
+		self._moved = set() # colliders updated in the last update
+		
 	def update(self, dt, entity_manager):
 		"""
 		For every RectCollidable, updates its position to match the entity.
@@ -121,17 +358,36 @@ class RectColliderTrackerSystem(ecs.System):
 		Also sets the dimensions of the rect to match of the entity's sprite, if it has one.
 		
 		"""
-		colliders = entity_manager.pairs_for_type(RectCollider)
+		if self._changed is None:
+			self._changed = entity_manager.track(Position, RectCollider, spritesystem.Sprite)
+		changed = self._changed
+		colliders = entity_manager.view(RectCollider)
 		
-		for e_id, collider in colliders:
+		# colliders that moved in the last update but not since have stopped,
+		# so where they were is where they are
+		for e_id in self._moved:
+			if e_id not in changed:
+				row = colliders.row_for_entity(e_id)
+				if row is not None:
+					row[1].last = row[1].hit_rect.copy()
+		
+		moved = set()
+		for e_id in changed:
+			row = colliders.row_for_entity(e_id)
+			if row is None:
+				continue
+			collider = row[1]
 			pos = entity_manager.component_for_entity(e_id, Position)
 			if pos:
 				collider.last = collider.hit_rect.copy()
 				collider.hit_rect.center = (pos.x, pos.y)
+				moved.add(e_id)
 			sprite = entity_manager.component_for_entity(e_id, spritesystem.Sprite)
 			if sprite:
 				collider.hit_rect.width  = sprite.sprite.width
 				collider.hit_rect.height = sprite.sprite.height
+		changed.clear()
+		self._moved = moved
 				
 	
 class MapCollisionSystem(ecs.System):
@@ -148,13 +404,16 @@ class MapCollisionSystem(ecs.System):
 	
 	Optional: Jumper
 	
+	Collisions are done against the level's collision_map, which is compiled
+	from the foreground tile-map when it is assigned to the level.
+	
 	"""
 	def __init__(self):
 		super(MapCollisionSystem, self).__init__()
 		
-		# uses this object to calculate collisions
-		self.map_collider_manager = cocos.tiles.RectMapCollider()
-	
+		self.reads = (Asleep, 'collision_map')
+		self.writes = (RectCollider, Position, Velocity, jumper.Jumper)
+		
 	def update(self, dt, entity_manager):
 		"""
 		For every entity with Velocity, Position, and RectCollider, tests for collision
@@ -162,28 +421,19 @@ class MapCollisionSystem(ecs.System):
 		out of intersection and kills the velocity of the entity in the direction it had to
 		move.
 		"""
-		pairs = entity_manager.pairs_for_type(RectCollider)
-		
-		map = self.sys_man.parent.foreground
+		map = self.sys_man.parent.collision_map
 		if not map:
 			return
 		
-		for e_id, collider in pairs:
+		colliders = entity_manager.view(RectCollider, Position, Velocity, exclude=(Asleep,))
+		
+		for e_id, collider, pos, vel in colliders:
 			if collider.collide_with_map: # filter non-map colliders
-				# now we need the velocity and position of the entity
-				pos = entity_manager.component_for_entity(e_id, Position)
-				vel = entity_manager.component_for_entity(e_id, Velocity)
-				
-				# move on if one of these is missing
-				if not pos or not vel:
-					continue
-				
 				# collider.hit_rect will be mutated to conform to the map
-				delta = self.map_collider_manager.collide_map(map, 
-															  collider.last, 
-															  collider.hit_rect, 
-															  0, 0)
-				pos.x, pos.y = collider.hit_rect.center
+				delta = map.collide(collider.last, collider.hit_rect)
+				x, y = collider.hit_rect.center
+				if x != pos.x or y != pos.y: # don't mark unmoved positions changed
+					pos.x, pos.y = x, y
 				if delta[0]: # if there was some penetration in the x-direction
 					vel.v_x = 0 # kill the x velocity
 				if abs(delta[1]):
@@ -193,12 +443,79 @@ class MapCollisionSystem(ecs.System):
 						if j:
 							j.in_air = False
 				
+class EntityCollisionSystem(ecs.System):
+	"""
+	Finds RectColliders that overlap each other and tells interested parties.
+	
+	Every hit_rect is put into a SpatialHash with cells the size of a tile, and
+	only colliders sharing a cell are tested against each other, so the cost
+	grows with the number of colliders rather than the number of pairs.
+	
+	For each overlapping pair, the callbacks of both colliders are called with
+	their own entity first, and then the callbacks registered with this system
+	are called, for parties interested in collisions between other entities.
+	Callbacks may remove entities; pairs with an entity that was removed are
+	skipped.
+	
+	Requires RectCollider
+	
+	"""
+	def __init__(self):
+		super(EntityCollisionSystem, self).__init__()
+		
+		# no declarations, since the callbacks, of this system and of the
+		# colliders, can use anything, so systemmanager puts it in a wave of
+		# its own
+		self.reads = None
+		self.writes = None
+		self.grid = spatialhash.SpatialHash(*config.TILE_SIZE)
+		self.contacts = [] # (e_id, other_e_id) pairs found in the last update
+		self._callbacks = []
+		
+	def register_callback(self, func):
+		"""
+		Registers a function to call for every pair of overlapping colliders.
+		The callback should have the signature:
+		func(e_id, other_e_id)
+		"""
+		self._callbacks.append(func)
+		
+	def update(self, dt, entity_manager):
+		colliders = entity_manager.view(RectCollider, exclude=(Asleep,))
+		
+		grid = self.grid
+		grid.clear()
+		for e_id, collider in colliders:
+			grid.insert(e_id, collider.hit_rect)
+		
+		self.contacts = grid.overlapping_pairs()
+		
+		for e_id, other in self.contacts:
+			row = colliders.row_for_entity(e_id)
+			other_row = colliders.row_for_entity(other)
+			if row is None or other_row is None:
+				continue # a callback removed one of them
+			# copied first, so that callbacks can remove either entity
+			callbacks = list(row[1].callbacks)
+			other_callbacks = list(other_row[1].callbacks)
+			for cb in callbacks:
+				cb(e_id, other)
+			for cb in other_callbacks:
+				cb(other, e_id)
+			for cb in self._callbacks:
+				cb(e_id, other)
+				
 class PlayerViewTrackerSystem(ecs.System):	
+	def __init__(self):
+		super(PlayerViewTrackerSystem, self).__init__()
+		
+		self.reads = (PlayerInput, Position)
+		self.writes = ('scroller',)
+		
 	def update(self, dt, entity_manager):
 		scroller = self.sys_man.parent.scroller
-		pairs = entity_manager.pairs_for_type(PlayerInput)
-		for e_id, pi in pairs:
-			pos = entity_manager.component_for_entity(e_id, Position)
+		players = entity_manager.view(PlayerInput, Position)
+		for e_id, pi, pos in players:
 			new_x = util.lerp(pos.x, scroller.restricted_fx, 0.6)
 			new_y = util.lerp(pos.y, scroller.restricted_fy, 0.6)
 			
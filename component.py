@@ -1,4 +1,5 @@
 import entity
+import bootstrap
 import cocos.euclid as eu
 import cocos
 from inputmanager import inputmanager as in_man
@@ -16,9 +17,19 @@ class Component(object):
 			 # subclasses should set a number that reflects the order
 			 # that it should be updated in regard to other components.
 	def __init__(self):
-		self.instance_name = entity.get_new_instance_name(self.__class__)
+		self._instance_name = None # built on first use by instance_name
 		self.is_setup = False
 		self.parent = None
+	
+	@property
+	def instance_name(self):
+		"""
+		A unique name for this component.  Most components are never asked for
+		their name, so it is only formatted the first time it is needed.
+		"""
+		if self._instance_name is None:
+			self._instance_name = entity.get_new_instance_name(self.__class__)
+		return self._instance_name
 		
 	def early_update(self, dt):
 		if not self.is_setup:
@@ -2,18 +2,31 @@
 Collects static data used by other parts of the program.
 
 Tweaking these settings allows global changes.
+
+Only settings belong here, so that importing this module has no side
+effects; getting libraries and pyglet ready is done by bootstrap.
 """
 
 from os.path import join, abspath, dirname
 import os
-import sys
 
 TITLE = 'Logic Game'
 
+# Set LOGIC_GAME_HEADLESS in the environment to run without a window or GL context
+HEADLESS = bool(os.environ.get('LOGIC_GAME_HEADLESS'))
+
 FS = True
 
 SHOW_FPS = False
 
+PROFILE = False # Time every system in every frame
+
+SHOW_PROFILE = False # Show the system timings on screen, next to the FPS.  Implies PROFILE
+
+PROFILE_CSV = 'profile.csv' # Where to write the system timings on exit, when profiling
+
+STARTUP_REPORT = False # Print how long each part of startup took, see bootstrap
+
 JS_DEADZONE = 0.3 # The absolute value of a joystick movement must be greater than this value to count
 
 BG_COLOR = (0.2,0.2,0.21,1)
@@ -28,26 +41,48 @@ WIDTH, HEIGHT = tuple([a*b*SCALE for a,b in zip(TILE_SIZE, SIZE)]) # Size of win
                                                               # scaled for tile size, 
                                                               # field size, and scale
 													  
+GAME_DIR = dirname(abspath(__file__))
+
 MAPS_DIR = 'Maps/'
 
 IMAGES_DIR = 'Images/'
 
-# Directory to find libraries needed by the game.
-LIB_DIR = '../lib/'
+CACHE_DIR = 'Cache/' # Where compiled maps are kept, see levelcache
+
+LEVEL_CACHE = True # Load maps through the compiled map cache instead of parsing their TMX files
 
-# Add those libraries to the system path
-LIB_DIR = abspath(join(dirname(abspath(__file__)), LIB_DIR))
-for lib in os.listdir(LIB_DIR):
-	sys.path.append(abspath(join(LIB_DIR, lib)))
+STREAM_MAP = False # Load and draw only the chunks of the map around the view, see chunkmap
 
-import pyglet
+ATLAS_SIZE = 512 # Largest width and height of a texture atlas page, see atlas
 
-pyglet.resource.path.append(MAPS_DIR)
-pyglet.resource.path.append(IMAGES_DIR)
-pyglet.resource.reindex()
+ASSET_UPLOAD_BUDGET = 0.002 # Seconds per frame spent putting preloaded images on atlas pages, see assets
+
+# Directory to find libraries needed by the game.  bootstrap adds each
+# directory in it to the system path
+LIB_DIR = abspath(join(GAME_DIR, '../lib/'))
 
 GRAVITY = 900.0 # pixels/s^2
 
+STEP = 1.0/60.0 # Length of a simulation step in seconds
+
+MAX_STEPS = 5 # Most simulation steps to run in one rendered frame when catching up
+
+ARRAY_STORE = False # Keep Position and Velocity in numpy arrays, if numpy is available.  Slower while systems read them one entity at a time
+
+RECORD_INPUT = None # File to record the input of every simulation step to, see inputrecord
+
+REPLAY_INPUT = None # Recording to play back instead of reading the keyboard and joysticks
+
+REWIND_SECONDS = 0 # Seconds of snapshots to keep for rewinding, see snapshot; 0 for none.  Costs about 10 us per entity per step
+
+ACTIVATION = True # Put entities far from the view to sleep, see activation
+
+ACTIVATION_MARGIN = 128 # Pixels around the view in which entities are kept awake
+
+ACTIVATION_CELL = 256 # Size in pixels of the grid cells sleeping entities are kept in
+
+CHECK_SYSTEMS = False # Raise when a system uses a component type it didn't declare, see systemmanager
+
 PLAYER_1 = {
 	'index': 1,
 		
@@ -1,6 +1,9 @@
+import bootstrap
 import cocos
-import pyglet
 import component
+import collisionmap
+import timestep
+import config
 
 class EntityLayer(cocos.layer.ScrollableLayer):
 	"""
@@ -23,8 +26,9 @@ class EntityLayer(cocos.layer.ScrollableLayer):
 		self.map_colliders = []
 		self.map = map
 		self.to_track = None
+		self.timestep = timestep.FixedStep(config.STEP, config.MAX_STEPS)
 		if self.map:
-			self.rect_map_collider = cocos.tiles.RectMapCollider()
+			self.collision_map = collisionmap.CollisionMap.from_layer(self.map)
 		
 	def add_map_collider(self, collider):
 		self.map_colliders.append(collider)
@@ -48,6 +52,15 @@ class EntityLayer(cocos.layer.ScrollableLayer):
 		"""
 		The main update routine for EntityLayers.
 		
+		Runs as many fixed-length steps as the time since the last frame calls for.
+		The timestep caps the steps taken in one frame, so if the computer sleeps
+		during the game, things don't get crazy.
+		"""
+		for i in xrange(self.timestep.advance(dt)):
+			self.step(self.timestep.step)
+		
+	def step(self, dt):
+		"""
 		Will call the update method of each Entity it owns, and then perform
 		collisions detection and response.  Finally, it allows all entities to communicate
 		with other entities.
@@ -55,11 +68,6 @@ class EntityLayer(cocos.layer.ScrollableLayer):
 		>>>a = entity.update(1.0)
 		>>>a == True
 		"""
-		
-		# if the computer sleeps during the game, things can get crazy
-		if dt > (1.0/15.0):
-			dt = 1.0/15.0
-			
 		# do basic early_update
 		for entity in self.all_entities:
 			entity.early_update(dt) # entities are not updated in any particular order.
@@ -79,10 +87,8 @@ class EntityLayer(cocos.layer.ScrollableLayer):
 		if self.map:
 			for collider in self.map_colliders:
 				if self.map:
-					change = self.rect_map_collider.collide_map(self.map, 
-																collider.old_rect, 
-																collider.hit_rect,
-																0,0)
+					change = self.collision_map.collide(collider.old_rect, 
+														collider.hit_rect)
 					if any(change):
 						collider.collision_update(change)
 						
@@ -148,12 +154,9 @@ class Entity(cocos.cocosnode.CocosNode):
 		return self.instance_name
         
 def get_blocky_image(name):
-	import pyglet.gl as gl
-	image = pyglet.resource.image(name)
-	gl.glBindTexture(image.target, image.id)
-	gl.glTexParameteri(image.target, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
-	gl.glTexParameteri(image.target, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
-	return image
+	import assets
+	# kept by the AssetManager, with NEAREST filtering set once
+	return assets.manager().image(name)
 	
 def get_new_id(cls):
 	"""
@@ -0,0 +1,286 @@
+"""
+An EntityManager that adds join queries and cached views on top of the one
+from ecs.
+
+"""
+import bootstrap
+import ecs
+
+class View(object):
+	"""
+	A persistent query for the entities that have all of a set of component types.
+
+	The EntityManager keeps registered views up to date as components are added
+	and removed, so iterating a view is just iterating a ready-made list of
+	(e_id, component_1, component_2, ...) tuples, in the same format that
+	EntityManager.entities_with returns.
+
+	Entities that have any of the exclude types are left out, whatever else
+	they have.
+
+	"""
+	def __init__(self, component_types, exclude=()):
+		self.component_types = tuple(component_types)
+		self.exclude = tuple(exclude)
+		self._rows = {} # e_id -> row tuple
+		self._list = None # cached list of rows, rebuilt after membership changes
+
+	def __iter__(self):
+		if self._list is None:
+			self._list = list(self._rows.itervalues())
+		return iter(self._list)
+
+	def __len__(self):
+		return len(self._rows)
+
+	def __contains__(self, e_id):
+		return e_id in self._rows
+
+	def row_for_entity(self, e_id):
+		return self._rows.get(e_id)
+
+	def _refresh(self, e_id, index):
+		"""
+		Re-evaluates whether e_id belongs in this view after one of its components
+		was added, replaced or removed.
+
+		"""
+		for component_type in self.exclude:
+			if e_id in index.get(component_type, ()):
+				self._discard(e_id)
+				return
+		row = [e_id]
+		for component_type in self.component_types:
+			component = index.get(component_type, {}).get(e_id)
+			if component is None:
+				self._discard(e_id)
+				return
+			row.append(component)
+		self._add(e_id, tuple(row))
+
+	def _add(self, e_id, row):
+		self._rows[e_id] = row
+		self._list = None
+
+	def _discard(self, e_id):
+		if e_id in self._rows:
+			del self._rows[e_id]
+			self._list = None
+
+class EntityManager(ecs.EntityManager):
+	"""
+	An ecs.EntityManager that also keeps its own index of component type to
+	{e_id: component}, so that systems can ask for every entity that has a
+	given set of components in one call instead of calling component_for_entity
+	for every entity.
+	
+	Systems that run every frame should use view(), which is kept up to date
+	incrementally, rather than entities_with(), which joins on every call.
+
+	Systems that only need to act when components change can track() them, to
+	get the entities whose components were added or marked changed since the
+	last time they looked.  Components that have a watch(e_id, changes) method,
+	like common.Position, mark themselves changed when they are written to.
+
+	"""
+	def __init__(self):
+		super(EntityManager, self).__init__()
+
+		self._index = {} # component type -> {e_id: component}
+		self._views = {} # (component types, excluded types) -> shared View
+		self._registered = [] # every View being kept up to date
+		self._views_by_type = {} # component type -> [View, ...]
+		self._trackers = {} # component type -> [set of changed e_ids, ...]
+		
+		self.kinematics = None # an arraystore.KinematicStore, if the level uses one
+
+	def add_component(self, e_id, component):
+		super(EntityManager, self).add_component(e_id, component)
+
+		component_type = type(component)
+		self._index.setdefault(component_type, {})[e_id] = component
+		for view in self._views_by_type.get(component_type, ()):
+			view._refresh(e_id, self._index)
+
+		changes = self._trackers.setdefault(component_type, [])
+		watch = getattr(component, 'watch', None)
+		if watch is not None:
+			watch(e_id, changes)
+		for changed in changes:
+			changed.add(e_id)
+
+	def remove_component(self, e_id, component_type):
+		super(EntityManager, self).remove_component(e_id, component_type)
+
+		components = self._index.get(component_type)
+		if components and e_id in components:
+			self._unwatch(components.pop(e_id))
+			for view in self._views_by_type.get(component_type, ()):
+				if component_type in view.exclude:
+					view._refresh(e_id, self._index)
+				else:
+					view._discard(e_id)
+			for changed in self._trackers.get(component_type, ()):
+				changed.discard(e_id)
+
+	def remove_entity(self, e_id):
+		super(EntityManager, self).remove_entity(e_id)
+
+		for component_type, components in self._index.iteritems():
+			component = components.pop(e_id, None)
+			if component is not None:
+				self._unwatch(component)
+				for changed in self._trackers.get(component_type, ()):
+					changed.discard(e_id)
+		for view in self._registered:
+			view._discard(e_id)
+
+	def view(self, *component_types, **kwargs):
+		"""
+		Returns the View of entities having all of component_types, registering
+		it the first time it is asked for.  Views are shared, so calling this
+		every frame is only a dictionary lookup.
+
+		The keyword argument exclude is a tuple of component types; entities
+		with any of them are left out of the view.
+
+		Example:
+
+			for e_id, pos, vel in entity_manager.view(Position, Velocity):
+				pos.x += vel.v_x * dt
+
+		"""
+		exclude = kwargs.pop('exclude', ())
+		if kwargs:
+			raise TypeError('unexpected keyword arguments: {}'.format(', '.join(kwargs)))
+		key = (component_types, exclude)
+		view = self._views.get(key)
+		if view is None:
+			view = self.register_view(View(component_types, exclude))
+			self._views[key] = view
+		return view
+
+	def register_view(self, view):
+		"""
+		Starts keeping view up to date, and fills it with the entities that
+		already match.  Returns the view.
+		
+		Views registered this way are private to the caller; use view() to
+		get a shared one.
+
+		"""
+		self._registered.append(view)
+		for component_type in view.component_types + view.exclude:
+			self._views_by_type.setdefault(component_type, []).append(view)
+		excluded = [self._index.get(component_type, {}) for component_type in view.exclude]
+		for row in self.entities_with(*view.component_types):
+			if not any(row[0] in components for components in excluded):
+				view._add(row[0], row)
+		return view
+
+	def track(self, *component_types):
+		"""
+		Returns a set of the e_ids of entities with components of
+		component_types, which from then on has the e_id of an entity added to
+		it whenever one of those components is added to it or changed.
+
+		The set belongs to the caller, who should clear it after acting on the
+		changes, so that it only holds changes since the last time.
+
+		Example:
+
+			changed = entity_manager.track(Position)
+			...
+			for e_id in changed:
+				...
+			changed.clear()
+
+		"""
+		changed = set()
+		for component_type in component_types:
+			self._trackers.setdefault(component_type, []).append(changed)
+			changed.update(self._index.get(component_type, ()))
+		return changed
+
+	def untrack(self, changed):
+		"""
+		Stops adding changes to a set returned by track
+		"""
+		for changes in self._trackers.itervalues():
+			# by identity, since sets with the same e_ids are equal
+			changes[:] = [c for c in changes if c is not changed]
+
+	def mark_changed(self, e_id, component_type):
+		"""
+		Records that the component_type component of e_id has changed, for
+		components that can't tell by themselves
+		"""
+		for changed in self._trackers.get(component_type, ()):
+			changed.add(e_id)
+
+	def mark_all_changed(self, e_ids, component_type):
+		"""
+		mark_changed for many entities at once
+		"""
+		for changed in self._trackers.get(component_type, ()):
+			changed.update(e_ids)
+
+	def _unwatch(self, component):
+		watch = getattr(component, 'watch', None)
+		if watch is not None:
+			watch(None, None)
+
+	def components(self, component_type):
+		"""
+		Returns {e_id: component} of every component of component_type.  It is
+		the index itself, so it mustn't be changed, and changes as components
+		are added and removed.
+
+		"""
+		return self._index.get(component_type, {})
+
+	def count(self, component_type):
+		"""
+		Returns the number of entities that have a component of component_type
+
+		"""
+		return len(self._index.get(component_type, ()))
+
+	def entities_with(self, *component_types):
+		"""
+		Returns a list of tuples (e_id, component_1, component_2, ...) for every
+		entity that has a component of each of the given types.  Components are
+		in the same order as component_types.
+
+		Only the smallest set of components is iterated; the others are used for
+		membership tests, so the cost depends on the rarest component type.
+
+		Example:
+
+			for e_id, pos, vel in entity_manager.entities_with(Position, Velocity):
+				pos.x += vel.v_x * dt
+
+		"""
+		if not component_types:
+			return []
+
+		tables = []
+		for component_type in component_types:
+			components = self._index.get(component_type)
+			if not components:
+				return [] # nobody can match
+			tables.append(components)
+
+		smallest = min(tables, key=len)
+
+		result = []
+		for e_id in smallest:
+			row = [e_id]
+			for components in tables:
+				component = components.get(e_id)
+				if component is None:
+					break
+				row.append(component)
+			else:
+				result.append(tuple(row))
+		return result
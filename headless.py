@@ -0,0 +1,228 @@
+"""
+Runs levels without a window or GL context.
+
+The ECS systems only need sprites for their size, position and image, and the
+level for its database, collision map and scroller, so a level can be built
+straight from a TMX file with stand-ins for the parts that draw, and stepped as
+fast as the computer allows.  This is for soak tests, benchmarks and simulating
+levels on machines without a GPU.
+
+Usage:
+
+	python headless.py [map] [frames] [--replay recording]
+
+With a recording from inputrecord, the player is driven by it, and the level
+runs for as many frames as it has unless told otherwise.
+
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('LOGIC_GAME_HEADLESS', '1')
+import bootstrap # should always be first, after the environment is set up
+import config
+
+import entitymanager
+import systemmanager
+import profiler
+import arraystore
+import atlas
+import collisionmap
+import chunkmap
+import levelcache
+import timestep
+import inputmanager
+import inputrecord
+import common
+import jumper
+import level
+
+class StubSprite(object):
+	"""
+	Stands in for a cocos Sprite where there is nothing to draw.  Only has the
+	attributes that systems use.
+	"""
+	def __init__(self, width, height):
+		self.width = width
+		self.height = height
+		self.position = (0, 0)
+		self.image = None
+
+class StubScroller(object):
+	"""
+	Stands in for a ScrollingManager.  Remembers the focus it is given, and has
+	the view size and scale of the game's window.
+	"""
+	def __init__(self):
+		self.restricted_fx = 0
+		self.restricted_fy = 0
+		self.view_w = config.WIDTH
+		self.view_h = config.HEIGHT
+		self.scale = config.SCALE
+
+	def set_focus(self, fx, fy):
+		self.restricted_fx = fx
+		self.restricted_fy = fy
+
+class HeadlessLevel(object):
+	"""
+	Has the attributes of a level.Level that systems use, without being a
+	cocos Scene.
+
+	foreground		: always None; nothing is drawn
+
+	collision_map	: a CollisionMap used for map collisions
+
+	scroller		: a StubScroller
+
+	systems			: a SystemManager from systemmanager
+
+	database		: an EntityManager from entitymanager
+
+	timestep		: a FixedStep; only its step length is used
+
+	input_manager	: an InputManager polled before every step, or None when input
+					  comes from plain dictionaries
+
+	"""
+	def __init__(self, collision_map=None):
+		self.background = None
+		self.foreground = None
+		self.collision_map = collision_map
+		self.scroller = StubScroller()
+
+		self.database = entitymanager.EntityManager()
+		if config.ARRAY_STORE and arraystore.numpy is not None:
+			arraystore.attach(self.database)
+		self.systems = systemmanager.SystemManager(self)
+		if config.PROFILE:
+			self.systems.profiler = profiler.FrameProfiler()
+
+		self.timestep = timestep.FixedStep(config.STEP, config.MAX_STEPS)
+		self.input_manager = None
+		self.frames = 0 # simulation steps run so far
+
+	def make_sprite(self, image):
+		"""
+		Makes a StubSprite the size of image, or of nothing if image is None,
+		for remaking the sprites of entities
+		"""
+		if image is None:
+			sprite = StubSprite(0, 0)
+		else:
+			sprite = StubSprite(image.width, image.height)
+		sprite.image = image
+		return sprite
+		
+	def step(self):
+		"""
+		Runs one simulation step
+		"""
+		if self.input_manager is not None:
+			self.input_manager.poll()
+		self.systems.update_systems(self.timestep.step, self.database)
+		self.frames += 1
+
+	def run(self, frames):
+		"""
+		Runs frames simulation steps as fast as possible.  Returns the time taken
+		in seconds.
+		"""
+		start = time.time()
+		for i in xrange(frames):
+			self.step()
+		return time.time() - start
+
+def map_path(name):
+	return os.path.join(config.GAME_DIR, config.MAPS_DIR, name)
+
+def image_path(name):
+	return os.path.join(config.GAME_DIR, config.IMAGES_DIR, name)
+
+def player_input():
+	"""
+	Returns a PlayerInput with a plain input dictionary, which a script can
+	change, instead of one from the InputManager
+	"""
+	pi = common.PlayerInput()
+	pi.input = inputmanager.InputBinding.model_dict.copy()
+	return pi
+
+def robot_sprite():
+	"""
+	A StubSprite the size of one frame of the robot in main.py
+	"""
+	width, height = atlas.png_size(image_path('contrast-robot.png'))
+	return StubSprite(width // 3, height)
+
+def replay_input(path):
+	"""
+	Returns a new InputManager without devices, whose source plays back the
+	recording at path.  Each level gets its own, so levels in one process
+	don't share input.
+	"""
+	manager = inputmanager.InputManager()
+	manager.init_headless()
+	replay = inputrecord.Replay(path)
+	for index in replay.indexes:
+		manager.bind({'index': index})
+	manager.source = replay
+	return manager
+
+def load(map_name='logic-map-1.tmx', layer='Structure', replay=None):
+	"""
+	Builds a HeadlessLevel from a TMX file in config.MAPS_DIR with the standard
+	systems and a player like the one in main.py.  A chunk file from chunkmap
+	is streamed instead, and layer is ignored, since it holds only one.
+
+	If replay is the path of an input recording, the player is driven by its
+	first binding, otherwise by a plain input dictionary.
+
+	Returns (level, player's e_id).
+	"""
+	if map_name.endswith(chunkmap.EXTENSION):
+		cm = chunkmap.ChunkedMap(map_path(map_name))
+		cm.set_focus(100, 100)
+	elif config.LEVEL_CACHE:
+		cm = levelcache.load(map_path(map_name)).collision_map(layer)
+	else:
+		cm = collisionmap.CollisionMap.from_tmx(map_path(map_name), layer)
+	new_level = HeadlessLevel(cm)
+	if replay is None:
+		pi = player_input()
+	else:
+		new_level.input_manager = replay_input(replay)
+		pi = common.PlayerInput(new_level.input_manager.source.indexes[0],
+								new_level.input_manager)
+	e_id = level.add_player(new_level.database, robot_sprite(), jumper.JumperAnimation(),
+							pi, 100, 100)
+	level.add_standard_systems(new_level)
+	return new_level, e_id
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('map', nargs='?', default='logic-map-1.tmx')
+	parser.add_argument('frames', nargs='?', type=int)
+	parser.add_argument('--replay', help='input recording to drive the player with')
+	args = parser.parse_args()
+
+	headless_level, player = load(args.map, replay=args.replay)
+	frames = args.frames
+	if frames is None:
+		if args.replay:
+			frames = headless_level.input_manager.source.count_steps()
+		else:
+			frames = 6000
+	elapsed = headless_level.run(frames)
+	pos = headless_level.database.component_for_entity(player, common.Position)
+
+	print '{} frames in {:.3f}s ({:.0f} frames/s)'.format(frames, elapsed, frames / elapsed)
+	print 'player at ({:.1f}, {:.1f})'.format(pos.x, pos.y)
+	
+	if headless_level.systems.profiler:
+		print '\n'.join(headless_level.systems.profiler.report())
+		headless_level.systems.profiler.write_csv(config.PROFILE_CSV)
+
+if __name__ == '__main__':
+	main()
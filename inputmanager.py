@@ -1,3 +1,4 @@
+import bootstrap
 import cocos
 import config
 import pyglet
@@ -7,6 +8,14 @@ class InputBinding(object):
 	Holds information about user input bindings.
 	
 	Used internally by InputManager
+	
+	input_dict is updated as keyboard and joystick events come in, and only for
+	the input names bound to the key, axis or button that changed.
+	
+	presses and releases count, for every input name, how many times it has gone
+	from 0 to non-zero and back.  They only ever go up, so anything can tell if
+	an input was pressed since it last looked, even if it was pressed and
+	released between two looks.
 	"""
 	
 	INPUT_NAMES = (
@@ -92,6 +101,10 @@ class InputBinding(object):
 		self.joystick = None # Reference to a pyglet joystick device
 							 # InputManager will set up this reference
 		self.input_dict = InputBinding.model_dict.copy()
+		self.presses = InputBinding.model_dict.copy()
+		self.releases = InputBinding.model_dict.copy()
+		self.listeners = [] # functions called with (index, input name, pressed) on edges
+		self.replaying = False # when True, device events are ignored and set_input drives the inputs
 		
 		self._axes = InputBinding.axes_dict.copy()
 		
@@ -104,63 +117,138 @@ class InputBinding(object):
 			self.joy_binding = self.binding['joystick']
 		except KeyError:
 			self.joy_binding = None
+			
+		# what each key, axis and button affects, so that events only update those inputs
+		self._key_inputs = {} # key name -> [input name, ...]
+		self._key_sources = {} # input name -> [(key name, value when held), ...]
+		for key_name, input_name in (self.key_binding or {}).iteritems():
+			if type(key_name) is tuple:
+				sources = ((key_name[0], 1.0), (key_name[1], -1.0))
+			else:
+				sources = ((key_name, 1),)
+			for source, value in sources:
+				self._key_inputs.setdefault(source, []).append(input_name)
+				self._key_sources.setdefault(input_name, []).append((source, value))
+		
+		self._axis_inputs = {} # axis name -> [(input name, sign), ...]
+		self._button_inputs = {} # button number -> [input name, ...]
+		for j_name, input_name in (self.joy_binding or {}).iteritems():
+			if type(j_name) is str:
+				if type(input_name) is tuple:
+					sign = -1.0 if input_name[1] == 'invert' else 1.0
+					self._axis_inputs.setdefault(j_name, []).append((input_name[0], sign))
+				else:
+					self._axis_inputs.setdefault(j_name, []).append((input_name, 1.0))
+			else:
+				self._button_inputs.setdefault(j_name, []).append(input_name)
+		
+		self._key_values = {} # input name -> value from the keyboard
+		self._joy_values = {} # input name -> value from the joystick
 						
 	def add_joystick(self, joystick):
 		self.joystick = joystick
 		joystick.on_joyaxis_motion = self.on_joyaxis_motion
+		joystick.on_joybutton_press = self.on_joybutton_press
+		joystick.on_joybutton_release = self.on_joybutton_release
 	
 	def remove_joystick(self):
 		self.joystick.on_joyaxis_motion = None
+		self.joystick.on_joybutton_press = None
+		self.joystick.on_joybutton_release = None
 		self.joystick = None
+		self._axes = InputBinding.axes_dict.copy()
+		names = self._joy_values.keys()
+		self._joy_values.clear()
+		for name in names:
+			self._refresh(name)
 		
 	def on_joyaxis_motion(self, joystick, axis, value):
-		if abs(value) > config.JS_DEADZONE:
-			#print 'js:{0}, axis:{1}, value:{2:+.5f}'.format(joystick, axis, value)
-			self._axes[axis] = value
-			return
-		self._axes[axis] = 0.0
-		
-	def update_keys(self, key_set):
-		d = {}
-		for key_name, input_name in self.key_binding.iteritems():
-			# try to access key_name as a 2-tuple
-			if type(key_name) is tuple:
-				if key_name[0] in key_set:
-					d[input_name] = 1.0
-				elif key_name[1] in key_set:
-					d[input_name] = -1.0
-			else:
-				if key_name in key_set:
-					d[input_name] = 1
-		return d
+		if abs(value) <= config.JS_DEADZONE:
+			value = 0.0
+		#print 'js:{0}, axis:{1}, value:{2:+.5f}'.format(joystick, axis, value)
+		self._axes[axis] = value
+		for input_name, sign in self._axis_inputs.get(axis, ()):
+			self._joy_values[input_name] = sign * value
+			self._refresh(input_name)
+			
+	def on_joybutton_press(self, joystick, button):
+		for input_name in self._button_inputs.get(button, ()):
+			self._joy_values[input_name] = 1.0
+			self._refresh(input_name)
+			
+	def on_joybutton_release(self, joystick, button):
+		for input_name in self._button_inputs.get(button, ()):
+			self._joy_values[input_name] = 0.0
+			self._refresh(input_name)
 		
-	def update_joystick(self):
-		d = {}
-		if self.joystick:
-			for j_name, input_name in self.joy_binding.iteritems():
-				# start with axis names
-				if type(j_name) is str:
-					a_value = self._axes[j_name]
-					if a_value:				
-						if type(input_name) is tuple:		
-							d[input_name[0]] = -a_value if input_name[1] == 'invert' else a_value
-						else: 
-							d[input_name] = a_value
-				else:
-					if self.joystick.buttons[j_name]: # lookup button by index j_name
-						d[input_name] = 1.0
-		return d
+	def on_key(self, key_set, key_name):
+		"""
+		Updates the inputs bound to key_name, which was just pressed or
+		released.  key_set is every key that is held down.
+		"""
+		for input_name in self._key_inputs.get(key_name, ()):
+			value = 0
+			for source, source_value in self._key_sources[input_name]:
+				if source in key_set:
+					value = source_value
+					break
+			self._key_values[input_name] = value
+			self._refresh(input_name)
+			
+	def _refresh(self, input_name):
+		"""
+		Sets an input from its keyboard and joystick values, the joystick taking
+		precedence, and records and announces an edge if there is one
+		"""
+		if self.replaying:
+			return
+		value = self._joy_values.get(input_name) or self._key_values.get(input_name, 0)
+		old = self.input_dict[input_name]
+		if value == old:
+			return
+		self.input_dict[input_name] = value
+		if not old:
+			self.presses[input_name] += 1
+		elif not value:
+			self.releases[input_name] += 1
+		else:
+			return # still held, just by a different amount
+		for listener in self.listeners:
+			listener(self.index, input_name, bool(value))
 		
+	def set_input(self, input_name, value, presses=0, releases=0):
+		"""
+		Sets an input directly, along with the number of times it was pressed
+		and released since it was last set, as a replay does
+		"""
+		self.input_dict[input_name] = value
+		self.presses[input_name] += presses
+		self.releases[input_name] += releases
+		# edges alternate, and the last one leaves the input as it is now
+		count = presses + releases
+		pressed = bool(value) if count % 2 else not value
+		for n in xrange(count):
+			for listener in self.listeners:
+				listener(self.index, input_name, pressed)
+			pressed = not pressed
+			
 	def update(self, key_set):
 		"""
-		Updates the input_dict to relfect current user input state
-		Called every frame by the InputManager
+		Updates the input_dict to relfect current user input state, from scratch.
+		
+		Events keep input_dict up to date, so this is only needed to resync, for
+		instance after input was bound while keys were held down.
 		"""		
-		self.input_dict.update(self.model_dict) # reset input_dict
-		key_input = self.update_keys(key_set)
-		js_input = self.update_joystick()
-		self.input_dict.update(key_input)
-		self.input_dict.update(js_input)
+		for key_name in self._key_inputs:
+			self.on_key(key_set, key_name)
+		if self.joystick:
+			for axis in self._axis_inputs:
+				self.on_joyaxis_motion(self.joystick, axis, self._axes[axis])
+			for button in self._button_inputs:
+				if self.joystick.buttons[button]: # lookup button by index
+					self.on_joybutton_press(self.joystick, button)
+				else:
+					self.on_joybutton_release(self.joystick, button)
 		
 		
 class InputManager(cocos.cocosnode.CocosNode):
@@ -169,12 +257,17 @@ class InputManager(cocos.cocosnode.CocosNode):
 	
 	Provides keyboard, joystick, and mouse information.
 	
-	In the future, it may implement an event/listener pattern to
-	alert other objects about input events.
+	Input dictionaries are updated when keyboard and joystick events arrive,
+	so frames without input events do no input work.  Functions pushed with
+	push_listener are told whenever an input is pressed or released.
 	"""
 	
 	is_event_handler = True
 	
+	recorder = None # an inputrecord.Recorder that poll gives every step to
+	
+	_source = None
+	
 	def __init__(self):
 		pass
 		
@@ -190,21 +283,62 @@ class InputManager(cocos.cocosnode.CocosNode):
 		
 		"""
 		super(InputManager, self).__init__()
+		self._setup()
 		
 		from cocos.director import director
 	
 		director.window.push_handlers(self.on_key_press, self.on_key_release)
 		
+		self._find_joysticks() # Find and open all joystick devices
+		
+	def init_headless(self):
+		"""
+		Sets up the InputManager without a window or joysticks, for headless
+		runs whose input comes from a source such as an inputrecord.Replay.  The
+		director isn't needed.
+		"""
+		self._setup()
+		
+	def _setup(self):
 		self._keys = set()
 		self._joysticks = []
 		self.__unused_joysticks = []
 		self._bindings = {} # Dictionary containing InputBindings, by index
+		self._listeners = [] # Shared with every InputBinding
+		self._source = None
+		self.recorder = None
 		
-		self._find_joysticks() # Find and open all joystick devices
-				
 		self.is_running = True
 		
-		self.schedule(self.step)
+	@property
+	def source(self):
+		"""
+		Where input comes from instead of the keyboard and joysticks, like an
+		inputrecord.Replay, or None for the devices.  poll calls its
+		apply({index: InputBinding}) once per simulation step.
+		"""
+		return self._source
+		
+	@source.setter
+	def source(self, source):
+		self._source = source
+		for binding in self._bindings.itervalues():
+			binding.replaying = source is not None
+			
+	@property
+	def bindings(self):
+		return self._bindings
+			
+	def poll(self):
+		"""
+		Called by the level once per simulation step, before its systems run.
+		Applies the next step of the source, if there is one, and gives the
+		step's input to the recorder, if there is one.
+		"""
+		if self._source is not None:
+			self._source.apply(self._bindings)
+		if self.recorder is not None:
+			self.recorder.record(self._bindings)
 
 		
 	def _find_joysticks(self):
@@ -245,6 +379,9 @@ class InputManager(cocos.cocosnode.CocosNode):
 			del self._bindings[index]
 		# Store the binding
 		self._bindings[index] = new_input_binding
+		new_input_binding.listeners = self._listeners
+		new_input_binding.update(self._keys) # for keys already held down
+		new_input_binding.replaying = self._source is not None
 		
 		if new_input_binding.joy_binding and len(self.__unused_joysticks):
 			new_input_binding.add_joystick(self.__unused_joysticks.pop(0))
@@ -258,10 +395,31 @@ class InputManager(cocos.cocosnode.CocosNode):
 		return len(self._joysticks)
 		
 	def on_key_press(self, key, modifiers):
-		self._keys.add(pyglet.window.key.symbol_string(key))
+		key_name = pyglet.window.key.symbol_string(key)
+		self._keys.add(key_name)
+		for binding in self._bindings.itervalues():
+			binding.on_key(self._keys, key_name)
 	
 	def on_key_release(self, key, modifiers):
-		self._keys.remove(pyglet.window.key.symbol_string(key))
+		key_name = pyglet.window.key.symbol_string(key)
+		self._keys.discard(key_name) # it may have been pressed before the window had focus
+		for binding in self._bindings.itervalues():
+			binding.on_key(self._keys, key_name)
+		
+	def push_listener(self, func):
+		"""
+		Registers a function to call when an input is pressed or released.
+		The function should have the signature:
+		func(index, input_name, pressed)
+		where pressed is True for a press and False for a release.
+		"""
+		self._listeners.append(func)
+		
+	def remove_listener(self, func):
+		self._listeners.remove(func)
+		
+	def get_binding(self, index):
+		return self._bindings[index]
 		
 	def get_input_dict(self, index):
 		return self._bindings[index].input_dict
@@ -271,6 +429,10 @@ class InputManager(cocos.cocosnode.CocosNode):
 	#	self.schedule(self.step)
 		
 	def step(self, dt, *args, **kwargs):
+		"""
+		Resyncs every binding from scratch.  Not scheduled; events keep the
+		bindings up to date.
+		"""
 		for binding in self._bindings.itervalues():
 			binding.update(self._keys)
 
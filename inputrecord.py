@@ -0,0 +1,162 @@
+"""
+Records the input of every simulation step to a file, and plays it back.
+
+With the simulation running on a fixed timestep, the same input on the same
+steps gives the same game, so a recorded session can be replayed headless to
+reproduce a bug, or as a benchmark to compare builds with.
+
+A Recorder is given to InputManager.recorder, and a Replay to
+InputManager.source, in place of the keyboard and joysticks.  Either way,
+InputManager.poll is called once per simulation step by the level.
+
+File layout, all little-endian:
+
+	header		: magic 'LGIR', version, and the length of the metadata
+	metadata	: JSON with the step length, the input names, and the binding
+				  indexes that were recorded
+	steps		: for every step, the number of inputs that changed, then for
+				  each of them the binding's position in the list of indexes,
+				  the input's position in the list of names, its new value, and
+				  how many times it was pressed and released during the step
+
+Steps where nothing changes take two bytes.
+
+"""
+import json
+import struct
+
+import config
+import inputmanager
+
+MAGIC = 'LGIR'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHI')
+_COUNT = struct.Struct('<H')
+_CHANGE = struct.Struct('<BBdBB')
+
+class Recorder(object):
+	"""
+	Writes the input of the bindings with the given indexes to a file, one
+	step at a time.  Bindings that are bound later are not recorded.
+	"""
+	def __init__(self, path, indexes, step=None):
+		if step is None:
+			step = config.STEP
+		self.indexes = sorted(indexes)
+		self.names = list(inputmanager.InputBinding.INPUT_NAMES)
+		self.steps = 0
+
+		# what the file says each input is, and the edge counts that were written
+		self._values = [dict.fromkeys(self.names, 0) for index in self.indexes]
+		self._presses = [None] * len(self.indexes)
+		self._releases = [None] * len(self.indexes)
+
+		meta = json.dumps({'step': step, 'inputs': self.names, 'indexes': self.indexes})
+		self._file = open(path, 'wb')
+		self._file.write(_HEADER.pack(MAGIC, VERSION, len(meta)))
+		self._file.write(meta)
+
+	def record(self, bindings):
+		"""
+		Writes one step, given {index: InputBinding}
+		"""
+		changes = []
+		for slot, index in enumerate(self.indexes):
+			binding = bindings.get(index)
+			if binding is None:
+				continue
+			values = self._values[slot]
+			presses = self._presses[slot]
+			releases = self._releases[slot]
+			if presses is None:
+				# counting starts when recording does
+				presses = self._presses[slot] = dict(binding.presses)
+				releases = self._releases[slot] = dict(binding.releases)
+			for n, name in enumerate(self.names):
+				value = binding.input_dict[name]
+				pressed = binding.presses[name] - presses[name]
+				released = binding.releases[name] - releases[name]
+				if value == values[name] and not pressed and not released:
+					continue
+				# more than 255 edges in one step can only be written 255 at a time
+				pressed = min(pressed, 255)
+				released = min(released, 255)
+				changes.append(_CHANGE.pack(slot, n, value, pressed, released))
+				values[name] = value
+				presses[name] += pressed
+				releases[name] += released
+
+		self._file.write(_COUNT.pack(len(changes)))
+		self._file.write(''.join(changes))
+		self.steps += 1
+
+	def close(self):
+		self._file.close()
+
+class Replay(object):
+	"""
+	Plays back a file written by a Recorder.  Each call to apply sets the
+	bindings' inputs to those of the next recorded step.
+
+	finished is True once every step has been applied; the inputs then stay as
+	they were on the last step.
+
+	"""
+	def __init__(self, path):
+		with open(path, 'rb') as f:
+			data = f.read()
+		magic, version, length = _HEADER.unpack_from(data)
+		if magic != MAGIC:
+			raise ValueError('{} is not an input recording'.format(path))
+		if version != VERSION:
+			raise ValueError('{} is version {} of the recording format, not {}'.format(
+							 path, version, VERSION))
+		meta = json.loads(data[_HEADER.size:_HEADER.size + length])
+		if abs(meta['step'] - config.STEP) > 1e-9:
+			raise ValueError('{} was recorded with steps of {}s, not {}s'.format(
+							 path, meta['step'], config.STEP))
+
+		self.names = [str(name) for name in meta['inputs']]
+		self.indexes = meta['indexes']
+		self.step = 0 # steps applied so far
+		self._data = data
+		self._offset = _HEADER.size + length
+
+	@property
+	def finished(self):
+		return self._offset >= len(self._data)
+
+	def count_steps(self):
+		"""
+		Returns the number of steps in the recording
+		"""
+		steps = 0
+		offset = self._first_step()
+		while offset < len(self._data):
+			count, = _COUNT.unpack_from(self._data, offset)
+			offset += _COUNT.size + count * _CHANGE.size
+			steps += 1
+		return steps
+
+	def apply(self, bindings):
+		"""
+		Sets the inputs of {index: InputBinding} to those of the next step
+		"""
+		if self.finished:
+			return
+		data = self._data
+		count, = _COUNT.unpack_from(data, self._offset)
+		offset = self._offset + _COUNT.size
+		for n in xrange(count):
+			slot, name, value, pressed, released = _CHANGE.unpack_from(data, offset)
+			offset += _CHANGE.size
+			binding = bindings.get(self.indexes[slot])
+			if binding is not None:
+				binding.set_input(self.names[name], value, pressed, released)
+		self._offset = offset
+		self.step += 1
+
+	def _first_step(self):
+		magic, version, length = _HEADER.unpack_from(self._data)
+		return _HEADER.size + length
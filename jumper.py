@@ -2,9 +2,12 @@ import math
 
 import common
 import spritesystem
+import bootstrap
 import ecs
 
 class JumperAnimation(ecs.Component):
+	__slots__ = ('stand_left', 'stand_right', 'walk_left', 'walk_right')
+	
 	def __init__(self):
 		self.stand_left = None
 		self.stand_right = None
@@ -19,6 +22,8 @@ class Jumper(ecs.Component):
 	as vertical jump speed.
 	
 	"""
+	__slots__ = ('in_air', 'jump', 'walk', 'acc')
+	
 	def __init__(self, jump=200, walk=200, acc=500):
 		self.in_air = False
 		self.jump = jump
@@ -29,24 +34,29 @@ class JumperSystem(ecs.System):
 	"""
 	Makes entities with the Jumper component jump in response to user input
 	
+	A jump needs JUMP to be pressed, rather than held, so holding it doesn't
+	bounce the entity along, and a tap between two steps still counts.
+	
 	Requires Jumper, PlayerInput, Velocity
 	"""
+	def __init__(self):
+		super(JumperSystem, self).__init__()
+		
+		self.reads = (common.Asleep,)
+		# PlayerInput keeps track of the presses it has reported
+		self.writes = (Jumper, common.PlayerInput, common.Velocity)
 	
 	def update(self, dt, entity_manager):
-		pairs = entity_manager.pairs_for_type(Jumper)
+		jumpers = entity_manager.view(Jumper, common.PlayerInput, common.Velocity,
+									  exclude=(common.Asleep,))
 		
-		for e_id, jumper in pairs:
-			pi = entity_manager.component_for_entity(e_id, common.PlayerInput)
-			vel = entity_manager.component_for_entity(e_id, common.Velocity)
-			
-			if not pi or not vel:
-				continue
-			
+		for e_id, jumper, pi, vel in jumpers:
 			if abs(vel.v_y) > 0:
 				jumper.in_air = True
 			
-			
-			if not jumper.in_air and pi.input['JUMP']:
+			# asked every step, so that presses in the air don't carry over to landing
+			pressed = pi.pressed('JUMP')
+			if not jumper.in_air and pressed:
 				vel.v_y = jumper.jump
 				jumper.in_air = True
 				
@@ -56,15 +66,17 @@ class WalkerSystem(ecs.System):
 	
 	Requires Walker, PlayerInput, Velocity
 	"""
+	def __init__(self):
+		super(WalkerSystem, self).__init__()
+		
+		self.reads = (Jumper, common.PlayerInput, common.Asleep)
+		self.writes = (common.Velocity,)
 	
 	def update(self, dt, entity_manager):
-		pairs = entity_manager.pairs_for_type(Jumper)
+		walkers = entity_manager.view(Jumper, common.PlayerInput, common.Velocity,
+									  exclude=(common.Asleep,))
 		
-		for e_id, jumper in pairs:
-			pi = entity_manager.component_for_entity(e_id, common.PlayerInput)
-			vel = entity_manager.component_for_entity(e_id, common.Velocity)
-			if not pi or not vel:
-				return
+		for e_id, jumper, pi, vel in walkers:
 			if pi.input['HORIZONTAL_1']:
 				vel.v_x += pi.input['HORIZONTAL_1'] * jumper.acc * dt
 				if abs(vel.v_x) > jumper.walk:
@@ -76,28 +88,37 @@ class WalkerSystem(ecs.System):
 					vel.v_x = 0
 				
 class JumperAnimationSystem(ecs.System):
+	def __init__(self):
+		super(JumperAnimationSystem, self).__init__()
+		
+		self.reads = (JumperAnimation, common.Velocity, Jumper, common.Asleep)
+		self.writes = (spritesystem.Sprite,)
+		
 	def update(self, dt, entity_manager):
-		pairs = entity_manager.pairs_for_type(JumperAnimation)
-		for e_id, j_a in pairs:
-			sprite = entity_manager.component_for_entity(e_id, spritesystem.Sprite)
-			vel = entity_manager.component_for_entity(e_id, common.Velocity)
-			jumper = entity_manager.component_for_entity(e_id, Jumper)
-			
+		animated = entity_manager.view(JumperAnimation, spritesystem.Sprite, 
+												common.Velocity, Jumper,
+												exclude=(common.Asleep,))
+		for e_id, j_a, sprite, vel, jumper in animated:
+			image = sprite.sprite.image
 			if jumper.in_air:
 				if vel.v_x > 0:
-					sprite.sprite.image = j_a.stand_right
+					image = j_a.stand_right
 				elif vel.v_x < 0:
-					sprite.sprite.image = j_a.stand_left
+					image = j_a.stand_left
 			else:
-				if vel.v_x > 0 and sprite.sprite.image is not j_a.walk_right:					
-					sprite.sprite.image = j_a.walk_right
-				elif vel.v_x < 0 and sprite.sprite.image is not j_a.walk_left:
-					sprite.sprite.image = j_a.walk_left
-				elif vel.v_x == 0:
-					if sprite.sprite.image is j_a.walk_right:
-						sprite.sprite.image = j_a.stand_right
-					elif sprite.sprite.image is j_a.walk_left:
-						sprite.sprite.image = j_a.stand_left
+				if vel.v_x > 0:
+					image = j_a.walk_right
+				elif vel.v_x < 0:
+					image = j_a.walk_left
+				elif image is j_a.walk_right:
+					image = j_a.stand_right
+				elif image is j_a.walk_left:
+					image = j_a.stand_left
+			
+			if image is not sprite.sprite.image:
+				sprite.sprite.image = image
+				# the size may have changed, which RectColliderTrackerSystem cares about
+				entity_manager.mark_changed(e_id, spritesystem.Sprite)
 
 		
 		
@@ -2,7 +2,21 @@
 Module for the Level class, which encapsulates the data and workings of a game-level.
 """
 import config
-import ecs
+import entitymanager
+import systemmanager
+import profiler
+import arraystore
+import collisionmap
+import chunkmap
+import timestep
+import common
+import activation
+import jumper
+import spritesystem
+import inputmanager
+import snapshot
+import signals
+import bootstrap
 import cocos
 
 class Level(cocos.scene.Scene):
@@ -17,13 +31,28 @@ class Level(cocos.scene.Scene):
 	foreground	: a RectMapLayer which displays foreground imagery.  This map is also used for
 				  map collisions.
 	
+	collision_map	: a CollisionMap compiled from foreground when it is assigned, or
+				  given to set_foreground
+	
 	sprites		: a ScrollableLayer to which sprites can be added
 	
+	sprite_batch	: a BatchNode in sprites, which draws the sprites added with add_sprite
+				  together, in a draw call for each texture or atlas page they use
+	
 	scroll_man	: a ScrollingManager to look after scrolling of the view
 				 
-	system_man	: a SystemManager from ecs
+	systems		: a SystemManager from systemmanager
+	
+	database	: an EntityManager from entitymanager
+	
+	timestep	: a FixedStep which decides how many simulation steps to run each frame
+	
+	interpolators	: systems whose interpolate method is called once per rendered frame
+	
+	input_manager	: the InputManager, polled once per simulation step
 	
-	database	: an EntityManager from ecs
+	assets		: an assets.AssetManager that is pumped once per frame while it
+				  preloads images, or None
 	
 	"""
 	def __init__(self, fg=None, bg=None):
@@ -40,15 +69,27 @@ class Level(cocos.scene.Scene):
 		
 		self._background = None
 		self._foreground = None
+		self.collision_map = None
 		
 		self.background = bg
 		self.foreground = fg
 		
 		self.sprites = cocos.layer.ScrollableLayer()
+		self.sprite_batch = cocos.batch.BatchNode()
+		self.sprites.add(self.sprite_batch)
 		self.scroller = cocos.layer.ScrollingManager()
 		
-		self.database = ecs.EntityManager() # a database to hold all component data
-		self.systems = ecs.SystemManager(self) # the container for Systems
+		self.database = entitymanager.EntityManager() # a database to hold all component data
+		if config.ARRAY_STORE and arraystore.numpy is not None:
+			arraystore.attach(self.database)
+		self.systems = systemmanager.SystemManager(self) # the container for Systems
+		if config.PROFILE or config.SHOW_PROFILE:
+			self.systems.profiler = profiler.FrameProfiler()
+		
+		self.timestep = timestep.FixedStep(config.STEP, config.MAX_STEPS)
+		self.interpolators = []
+		self.input_manager = inputmanager.inputmanager
+		self.assets = None
 		
 		self.add(self.scroller)
 		#self.scroller.add(self.background, z=-1)
@@ -57,6 +98,9 @@ class Level(cocos.scene.Scene):
 		
 		self.scroller.scale = config.SCALE
 		
+		if config.SHOW_PROFILE:
+			self.add(profiler.ProfilerOverlay(self.systems.profiler), z=2)
+		
 		# add self to the director's interpreter_locals
 		cocos.director.director.interpreter_locals['level'] = self
 		
@@ -78,11 +122,46 @@ class Level(cocos.scene.Scene):
 		
 	@foreground.setter
 	def foreground(self, new_fg):
+		self.set_foreground(new_fg)
+		
+	def set_foreground(self, new_fg, collision_map=None):
+		"""
+		Sets the foreground.  Its collision map is compiled from it, unless one
+		that was compiled ahead of time, like a levelcache one, is given.
+		"""
 		if self._foreground:
 			self.scroller.remove(self._foreground)
 		if new_fg:
 			self._foreground = new_fg
 			self.scroller.add(new_fg, z=0)
+			if collision_map is None:
+				collision_map = collisionmap.CollisionMap.from_layer(new_fg)
+			self.collision_map = collision_map
+			
+	def add_sprite(self, sprite, z=0):
+		"""
+		Adds a cocos Sprite to sprite_batch.  The sprites of ECS Sprite components
+		should be added this way, rather than to sprites.
+		"""
+		self.sprite_batch.add(sprite, z=z)
+		
+	def make_sprite(self, image):
+		"""
+		Makes a cocos Sprite of image and adds it with add_sprite, for remaking
+		the sprites of entities
+		"""
+		sprite = cocos.sprite.Sprite(image)
+		self.add_sprite(sprite)
+		return sprite
+		
+	def add_interpolator(self, system):
+		"""
+		Has system.interpolate(alpha, entity_manager) called after the simulation
+		steps of every rendered frame, where alpha is how far the frame is between
+		the last two steps.
+		"""
+		system.interpolating = True
+		self.interpolators.append(system)
 			
 	def on_enter(self):
 		super(Level, self).on_enter()
@@ -90,7 +169,97 @@ class Level(cocos.scene.Scene):
 		self.schedule(self.update_on_frame)
 		
 	def update_on_frame(self, dt):
-		#print 'update_on_frame called'
-		dt = 1.0/60.0
-		#print 'dt: {}'.format(dt)
-		self.systems.update_systems(dt, self.database)
+		"""
+		Runs as many fixed-length simulation steps as the time since the last frame
+		calls for, then lets the interpolators place things between the last two steps.
+		"""
+		if self.assets is not None:
+			self.assets.pump()
+		
+		step = self.timestep.step
+		for i in xrange(self.timestep.advance(dt)):
+			self.input_manager.poll()
+			self.systems.update_systems(step, self.database)
+			
+		alpha = self.timestep.alpha
+		for system in self.interpolators:
+			system.interpolate(alpha, self.database)
+
+def add_standard_systems(level, activation_system=None):
+	"""
+	Adds the systems that run a level to level.systems, in the order they run.
+	
+	Works with anything that has a systems attribute, so it can also set up
+	levels that aren't Level objects, like headless ones.
+	
+	An ActivationSystem is added first when activation_system is True, or when
+	it is None and config.ACTIVATION is set.  A chunkmap.ChunkStreamingSystem
+	is added when the level's collision_map is a chunkmap.ChunkedMap, so it
+	has to be set first.  A snapshot.RewindSystem is added last when
+	config.REWIND_SECONDS is set.
+	
+	Returns the SpriteTrackerSystem, so that it can be made an interpolator.
+	"""
+	systems = level.systems
+	
+	if activation_system is None:
+		activation_system = config.ACTIVATION
+	if activation_system:
+		systems.add_system(activation.ActivationSystem(), -1)
+	
+	systems.add_system(jumper.JumperSystem(), 0)
+	systems.add_system(jumper.WalkerSystem(), 1)
+
+	systems.add_system(common.VelocitySystem(), 3)
+	systems.add_system(common.GravitySystem(), 2)
+	
+	systems.add_system(common.RectColliderTrackerSystem(), 4)
+	systems.add_system(common.MapCollisionSystem(), 5)
+	systems.add_system(common.EntityCollisionSystem(), 6)
+	systems.add_system(signals.SignalSystem(), 6) # after EntityCollisionSystem, for contacts
+	
+	systems.add_system(jumper.JumperAnimationSystem(), 7)
+	sprite_tracker = spritesystem.SpriteTrackerSystem()
+	systems.add_system(sprite_tracker, 8)
+	
+	systems.add_system(common.PlayerViewTrackerSystem(), 9)
+	if isinstance(level.collision_map, chunkmap.ChunkedMap):
+		# after PlayerViewTrackerSystem, which moves the focus
+		systems.add_system(chunkmap.ChunkStreamingSystem(), 10)
+	
+	if config.REWIND_SECONDS:
+		systems.add_system(snapshot.RewindSystem(), 100)
+	
+	return sprite_tracker
+	
+def add_player(database, sprite, animation, player_input, x, y):
+	"""
+	Creates a player-controlled jumper entity.
+	
+	Keyword arguments:
+	
+	sprite			: the sprite, or anything with width, height, position and image
+	animation		: a JumperAnimation
+	player_input	: a PlayerInput, or None for a jumper moved some other way
+	x, y			: starting position
+	
+	Returns the new entity's id.
+	"""
+	e_id = database.new_entity()
+	
+	sc = spritesystem.Sprite()
+	sc.sprite = sprite
+	pos = common.Position()
+	pos.x = x
+	pos.y = y
+	database.add_component(e_id, pos)
+	database.add_component(e_id, sc)
+	
+	database.add_component(e_id, common.Velocity())
+	if player_input is not None:
+		database.add_component(e_id, player_input)
+	database.add_component(e_id, common.RectCollider(collide_with_map=True))
+	database.add_component(e_id, jumper.Jumper(jump=350))
+	database.add_component(e_id, animation)
+	
+	return e_id
@@ -0,0 +1,314 @@
+"""
+A cache of TMX maps compiled to a binary form that loads without parsing.
+
+Reading a TMX file means parsing its XML, decoding the base64 and zlib tile
+data of every layer, and reading the tile properties that collisions depend
+on.  A compiled map holds the results: the tile ids of each layer, the edge
+flags that CollisionMap uses, and the tilesets and their properties.  It is
+loaded by mapping the file into memory.
+
+Compiled maps are kept in config.CACHE_DIR.  Each one records the
+modification time, size and SHA-1 hash of the TMX file it came from.  load
+recompiles a map when its TMX file has changed, so the cache is transparent,
+and this module can be run as a build step to fill it ahead of time.
+
+File layout, all little-endian:
+
+	header		: magic 'LGLV', version, the TMX file's mtime, size and SHA-1,
+				  and the length of the metadata
+	metadata	: JSON with the map and tile sizes, the tilesets, and for each
+				  layer its name, visibility and where its data is
+	data		: for each layer, its gids as 32 bit unsigned ints, then its
+				  edge flags, one byte per tile; both in the column-major order
+				  of a CollisionMap
+
+Usage:
+
+	python levelcache.py [--force] [map.tmx ...]
+
+"""
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+import config
+import collisionmap
+import tmx
+
+MAGIC = 'LGLV'
+VERSION = 1
+EXTENSION = '.lvl'
+
+_HEADER = struct.Struct('<4sHdQ20sI')
+_MTIME_OFFSET = 6 # where the mtime is in the header, for refreshing it
+
+class CompiledMap(object):
+	"""
+	A compiled map, mapped into memory.
+
+	width, height			: size of the map in tiles
+
+	tile_width, tile_height	: size of a tile in pixels
+
+	tilesets				: list of (firstgid, image path) of the map's tilesets
+
+	properties				: {gid: {name: value}} for tiles with properties
+
+	layer_names				: names of the tile layers, in the order of the TMX file
+
+	"""
+	def __init__(self, path):
+		self.path = path
+		with open(path, 'rb') as f:
+			self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		magic, version, mtime, size, digest, length = _HEADER.unpack_from(self._map)
+		if magic != MAGIC or version != VERSION:
+			raise ValueError('{} is not a version {} compiled map'.format(path, VERSION))
+		meta = json.loads(self._map[_HEADER.size:_HEADER.size + length])
+		self._data = _HEADER.size + length
+
+		base = os.path.dirname(path)
+		self.width = meta['width']
+		self.height = meta['height']
+		self.tile_width = meta['tile_width']
+		self.tile_height = meta['tile_height']
+		self.tilesets = [(firstgid, os.path.normpath(os.path.join(base, image)))
+						 for firstgid, image in meta['tilesets']]
+		self.properties = dict((int(gid), props) for gid, props in meta['properties'].iteritems())
+		self._layers = dict((layer['name'], layer) for layer in meta['layers'])
+		self.layer_names = [layer['name'] for layer in meta['layers']]
+		self._tiles = None
+
+	def close(self):
+		self._map.close()
+
+	def gids(self, name):
+		"""
+		Returns an array of the gids of a layer, in the column-major order of a
+		CollisionMap
+		"""
+		count = self.width * self.height
+		start = self._data + self._layer(name)['offset']
+		gids = array.array('I')
+		gids.fromstring(self._map[start:start + 4*count])
+		if sys.byteorder == 'big':
+			gids.byteswap()
+		return gids
+
+	def collision_map(self, name):
+		"""
+		Returns a CollisionMap of a layer from its compiled edge flags
+		"""
+		count = self.width * self.height
+		start = self._data + self._layer(name)['offset'] + 4*count
+		return collisionmap.CollisionMap(self.width, self.height, self.tile_width,
+										 self.tile_height, bytearray(self._map[start:start + count]))
+
+	def rect_map_layer(self, name):
+		"""
+		Returns a cocos RectMapLayer of a layer, like the one cocos.tiles.load
+		makes, with tiles from the map's tilesets.  Layers of a map share their
+		tilesets.  Needs a GL context, for the tileset textures.
+		"""
+		import cocos.tiles
+
+		if self._tiles is None:
+			self._tiles = {}
+			tw, th = self.tile_width, self.tile_height
+			for firstgid, image in self.tilesets:
+				tileset_name = os.path.splitext(os.path.basename(image))[0]
+				tileset = cocos.tiles.TileSet.from_atlas(tileset_name, firstgid, image, tw, th)
+				for gid, tile in tileset.iteritems():
+					tile.properties.update(self.properties.get(gid, {}))
+				self._tiles.update(tileset)
+
+		tw, th = self.tile_width, self.tile_height
+		height = self.height
+		gids = self.gids(name)
+		cells = []
+		for i in xrange(self.width):
+			column = i * height
+			cells.append([cocos.tiles.RectCell(i, j, tw, th, {}, self._tiles.get(gids[column + j]))
+						  for j in xrange(height)])
+		layer = cocos.tiles.RectMapLayer(name, tw, th, cells, None, {})
+		layer.visible = self._layer(name)['visible']
+		return layer
+
+	def _layer(self, name):
+		try:
+			return self._layers[name]
+		except KeyError:
+			raise KeyError('no layer named {} in {}'.format(name, self.path))
+
+def map_path(name):
+	"""
+	Returns the path of a map in config.MAPS_DIR.  Absolute paths are returned
+	as they are.
+	"""
+	return os.path.join(config.GAME_DIR, config.MAPS_DIR, name)
+
+def cache_path(tmx_path):
+	"""
+	Returns the path of the compiled map of tmx_path in config.CACHE_DIR.  The
+	name has a hash of the map's absolute path, so that maps with the same
+	name in different directories don't share a file.
+	"""
+	key = hashlib.sha1(os.path.abspath(tmx_path)).hexdigest()[:12]
+	return os.path.join(config.GAME_DIR, config.CACHE_DIR,
+						'{}.{}{}'.format(os.path.basename(tmx_path), key, EXTENSION))
+
+def load(name):
+	"""
+	Returns the CompiledMap of a TMX file, compiling it first if it isn't in
+	the cache or has changed since it was compiled
+	"""
+	tmx_path = map_path(name)
+	path = cache_path(tmx_path)
+	if not is_current(tmx_path, path):
+		compile_map(tmx_path, path)
+	return CompiledMap(path)
+
+def is_current(tmx_path, path):
+	"""
+	Returns True if the compiled map at path was compiled from the TMX file as
+	it is now.  A file whose mtime changed but whose contents didn't is still
+	current, and its recorded mtime is updated, so it is only hashed once.
+	"""
+	if not os.path.exists(path):
+		return False
+	with open(path, 'rb') as f:
+		try:
+			magic, version, mtime, size, digest, length = _HEADER.unpack(f.read(_HEADER.size))
+		except struct.error:
+			return False
+	if magic != MAGIC or version != VERSION:
+		return False
+
+	stat = os.stat(tmx_path)
+	if stat.st_size != size:
+		return False
+	if stat.st_mtime == mtime:
+		return True
+	if _digest(tmx_path) != digest:
+		return False
+	with open(path, 'r+b') as f:
+		f.seek(_MTIME_OFFSET)
+		f.write(struct.pack('<d', stat.st_mtime))
+	return True
+
+def compile_map(tmx_path, path=None):
+	"""
+	Compiles a TMX file, by default into the cache.  Returns the compiled map's
+	path.
+	"""
+	if path is None:
+		path = cache_path(tmx_path)
+	stat = os.stat(tmx_path)
+	digest = _digest(tmx_path)
+	layers = tmx.load_layers(tmx_path)
+	if not layers:
+		raise ValueError('{} has no tile layers'.format(tmx_path))
+	first = layers[0]
+	width, height = first.width, first.height
+
+	edges = {} # gid -> edge flags
+	for gid, properties in first.properties.iteritems():
+		edges[gid] = collisionmap.edge_flags(properties.get)
+
+	base = os.path.dirname(os.path.abspath(path))
+	meta = {
+		'width': width,
+		'height': height,
+		'tile_width': first.tile_width,
+		'tile_height': first.tile_height,
+		'tilesets': [(firstgid, os.path.relpath(image, base).replace(os.sep, '/'))
+					 for firstgid, image in first.tilesets],
+		'properties': first.properties,
+		'layers': [],
+	}
+
+	data = []
+	offset = 0
+	for layer in layers:
+		if (layer.width, layer.height) != (width, height):
+			raise ValueError('layer {} of {} is not the size of the map'.format(layer.name, tmx_path))
+		gids = array.array('I', [0] * (width * height))
+		flags = bytearray(width * height)
+		for i in xrange(width):
+			column = i * height
+			for j in xrange(height):
+				gid = layer.gid_at(i, j)
+				gids[column + j] = gid
+				flags[column + j] = edges.get(gid, 0)
+		if sys.byteorder == 'big':
+			gids.byteswap()
+		meta['layers'].append({'name': layer.name, 'visible': layer.visible, 'offset': offset})
+		data.append(gids.tostring())
+		data.append(str(flags))
+		offset += 5 * width * height
+
+	meta = json.dumps(meta)
+	directory = os.path.dirname(path)
+	if directory and not os.path.isdir(directory):
+		os.makedirs(directory)
+	# written to a file of its own and renamed, so a half-written file is never
+	# loaded, and processes compiling the same map at once don't share one
+	fd, temp = tempfile.mkstemp(suffix='.tmp', dir=directory or None)
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			f.write(_HEADER.pack(MAGIC, VERSION, stat.st_mtime, stat.st_size, digest, len(meta)))
+			f.write(meta)
+			for chunk in data:
+				f.write(chunk)
+		_replace(temp, path)
+	except:
+		if os.path.exists(temp):
+			os.remove(temp)
+		raise
+	return path
+
+def _replace(source, destination):
+	"""
+	Renames source to destination, replacing it.  That is atomic on POSIX; on
+	Windows, rename won't replace a file, so it is removed first.
+	"""
+	try:
+		os.rename(source, destination)
+	except OSError:
+		if os.name != 'nt' or not os.path.exists(destination):
+			raise
+		os.remove(destination)
+		os.rename(source, destination)
+
+def _digest(path):
+	sha = hashlib.sha1()
+	with open(path, 'rb') as f:
+		for block in iter(lambda: f.read(65536), ''):
+			sha.update(block)
+	return sha.digest()
+
+def main():
+	args = sys.argv[1:]
+	force = '--force' in args
+	names = [arg for arg in args if arg != '--force']
+	if not names:
+		directory = map_path('')
+		names = sorted(name for name in os.listdir(directory) if name.endswith('.tmx'))
+
+	for name in names:
+		tmx_path = map_path(name)
+		path = cache_path(tmx_path)
+		if force or not is_current(tmx_path, path):
+			compile_map(tmx_path, path)
+			print 'compiled', name
+		else:
+			print 'current ', name
+
+if __name__ == '__main__':
+	main()
@@ -1,4 +1,5 @@
-import config # should always be first
+import bootstrap # should always be first
+import config
 
 import cocos
 import pyglet
@@ -6,13 +7,17 @@ import pyglet
 import math
 
 import level
+import levelcache
+import chunkmap
+import assets
+import inputrecord
 import common
-import spritesystem
-import jumper
 
 from cocos.director import director as dtor
 from inputmanager import inputmanager as in_man
 
+bootstrap.mark('imports')
+
 		
 def main():	
 	# Initialize Director
@@ -24,10 +29,16 @@ def main():
 			  do_not_scale=True,
 			  )
 	window.set_exclusive_mouse(True)
+	bootstrap.mark('director')
 	# Initialize the InputManager
 	in_man.init()
 		
 	in_man.bind(config.PLAYER_1)
+	
+	if config.REPLAY_INPUT:
+		in_man.source = inputrecord.Replay(config.REPLAY_INPUT)
+	elif config.RECORD_INPUT:
+		in_man.recorder = inputrecord.Recorder(config.RECORD_INPUT, in_man.bindings.keys())
 			
 	print config.WIDTH, config.HEIGHT
 	
@@ -69,61 +80,56 @@ def main():
 	dtor.interpreter_locals['el'] = el
 	
 	"""
-	img = pyglet.resource.image('contrast-robot.png')
-	img = pyglet.image.ImageGrid(img, 1, 3)
-	seq = img.texture_sequence
-	#walk_anim = seq.get_animation(0.2)
-	walk_anim = pyglet.image.Animation.from_image_sequence(seq, 0.1)
-	stand_anim = pyglet.image.Animation.from_image_sequence(seq[:1], 0.1)
-	anim = jumper.JumperAnimation()
-	anim.walk_right = walk_anim
-	anim.walk_left  = walk_anim.get_transform(flip_x=True)
-	anim.stand_right = stand_anim
-	anim.stand_left = stand_anim.get_transform(flip_x=True)
+	asset_man = assets.manager()
+	asset_man.preload('logic-map-1.tmx')
 	
-	print 'walk_anim: {}'.format(walk_anim)
+	anim = asset_man.jumper_animation('contrast-robot.png', 1, 3, 0.1)
+	walk_anim = anim.walk_right
 	
-	tile_map = cocos.tiles.load('logic-map-1.tmx')
+	print 'walk_anim: {}'.format(walk_anim)
 	
 	first_level = level.Level()
-	first_level.foreground = tile_map['Structure']
+	first_level.assets = asset_man
+	streamed = None
+	if config.STREAM_MAP:
+		streamed = chunkmap.load('logic-map-1.tmx')
+		streamed.set_focus(100, 100)
+		first_level.set_foreground(chunkmap.ChunkLayer(streamed), streamed)
+	elif config.LEVEL_CACHE:
+		compiled = levelcache.load('logic-map-1.tmx')
+		first_level.set_foreground(compiled.rect_map_layer('Structure'),
+								   compiled.collision_map('Structure'))
+	else:
+		bootstrap.resources()
+		tile_map = cocos.tiles.load('logic-map-1.tmx')
+		first_level.foreground = tile_map['Structure']
 	
 	# build out level
-	db = first_level.database
-	
-	e_1 = db.new_entity()
-	sc = spritesystem.Sprite()
-	sc.sprite = cocos.sprite.Sprite(walk_anim, opacity=250)
-	first_level.sprites.add(sc.sprite)
-	pos = common.Position()
-	pos.x = 100
-	pos.y = 100
-	db.add_component(e_1, pos)
-	db.add_component(e_1, sc)
-	
-	db.add_component(e_1, common.Velocity())
-	db.add_component(e_1, common.PlayerInput(1))
-	db.add_component(e_1, common.RectCollider(collide_with_map=True))
-	db.add_component(e_1, jumper.Jumper(jump=350))	
-	db.add_component(e_1, anim)
-	
-	first_level.systems.add_system(jumper.JumperSystem(), 0)
-	first_level.systems.add_system(jumper.WalkerSystem(), 1)
-
-	first_level.systems.add_system(common.VelocitySystem(), 3)
-	first_level.systems.add_system(common.GravitySystem(), 2)	
+	sprite = cocos.sprite.Sprite(walk_anim, opacity=250)
+	first_level.add_sprite(sprite)
+	level.add_player(first_level.database, sprite, anim, common.PlayerInput(1), 100, 100)
 	
-	first_level.systems.add_system(common.RectColliderTrackerSystem(), 4)
-	first_level.systems.add_system(common.MapCollisionSystem(), 5)
+	sprite_tracker = level.add_standard_systems(first_level)
+	first_level.add_interpolator(sprite_tracker)
+	bootstrap.mark('level')
 	
-	first_level.systems.add_system(jumper.JumperAnimationSystem(), 6)
-	first_level.systems.add_system(spritesystem.SpriteTrackerSystem(), 7)
-	
-	first_level.systems.add_system(common.PlayerViewTrackerSystem(), 8)
+	if config.STARTUP_REPORT:
+		print '\n'.join(bootstrap.report())
 	
 	pyglet.gl.glClearColor(*config.BG_COLOR)	
 	dtor.set_show_FPS(config.SHOW_FPS)
-	dtor.run(first_level)		
+	dtor.run(first_level)
+	
+	if first_level.systems.profiler:
+		first_level.systems.profiler.write_csv(config.PROFILE_CSV)
+		
+	if in_man.recorder:
+		in_man.recorder.close()
+		
+	asset_man.save_manifest()
+	
+	if streamed is not None:
+		streamed.close()
 		
 if __name__ == '__main__':
 		
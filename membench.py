@@ -0,0 +1,105 @@
+"""
+Reports how many bytes the components of a typical entity take up.
+
+Builds entities with the component mix of the player in main.py and compares
+the slotted component classes with the same data held in per-instance
+dictionaries, which is how components were stored before they had __slots__.
+The slots only do away with the __dict__ if ecs.Component has __slots__ too,
+so the report says which classes can still have one.
+
+Usage:
+
+	python membench.py [entity count]
+
+"""
+import gc
+import sys
+
+import headless # sets up headless mode, so it comes before the other game modules
+import common
+import jumper
+import spritesystem
+import entitymanager
+
+class _DictComponent(object):
+	"""
+	Stand-in for a component that keeps its attributes in a __dict__
+	"""
+
+def make_components():
+	"""
+	Returns the components of one entity, like the player built in main.py
+	"""
+	return [common.Position(),
+			common.Velocity(),
+			common.PlayerInput(),
+			common.RectCollider(collide_with_map=True),
+			jumper.Jumper(),
+			jumper.JumperAnimation(),
+			spritesystem.Sprite()]
+
+def as_dict_component(component):
+	"""
+	Returns a copy of component with its slot values in a __dict__
+	"""
+	copy = _DictComponent()
+	for name in type(component).__slots__:
+		setattr(copy, name, getattr(component, name))
+	return copy
+
+def component_size(component):
+	"""
+	Size of the component itself plus its __dict__, if it has one.
+
+	Attribute values are not counted since they are the same either way.  The
+	__dict__ is found through gc instead of getattr, because asking an object
+	that can have a __dict__ for it creates an empty one if it had none yet.
+	"""
+	size = sys.getsizeof(component)
+	for referent in gc.get_referents(component):
+		if isinstance(referent, dict):
+			size += sys.getsizeof(referent)
+	return size
+
+def can_have_dict(component_type):
+	"""
+	Returns True if instances of component_type can have a __dict__, which is
+	the case unless every class it derives from has __slots__
+	"""
+	return component_type.__dictoffset__ != 0
+
+def measure(count):
+	"""
+	Returns (bytes per entity with dicts, bytes per entity with slots, sorted
+	names of the slotted classes whose instances can still have a __dict__)
+	"""
+	database = entitymanager.EntityManager()
+	before = 0
+	after = 0
+	open_types = set()
+	for i in range(count):
+		e_id = database.new_entity()
+		for component in make_components():
+			database.add_component(e_id, component)
+			if can_have_dict(type(component)):
+				open_types.add(type(component).__name__)
+			after += component_size(component)
+			before += component_size(as_dict_component(component))
+	return float(before) / count, float(after) / count, sorted(open_types)
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+	before, after, open_types = measure(count)
+	print 'entities:         {}'.format(count)
+	print 'bytes per entity: {:.1f} with __dict__, {:.1f} with __slots__'.format(before, after)
+	print 'saved:            {:.1%}'.format(1.0 - after / before)
+	if open_types:
+		# then the __slots__ only keep the declared attributes out of a
+		# __dict__, which is still made if anything sets another attribute
+		print
+		print 'ecs.Component has no __slots__, so these can still have a __dict__:'
+		print '                  {}'.format(', '.join(open_types))
+		print 'The sizes above count a __dict__ only where one was made.'
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,126 @@
+"""
+Per-system frame timings.
+
+"""
+import csv
+from array import array
+from timeit import default_timer as clock
+
+import bootstrap
+import cocos
+import config
+
+class FrameProfiler(object):
+	"""
+	Times every system in every frame that a SystemManager runs, keeping the
+	last capacity frames in a ring buffer.
+
+	Only installed when profiling is wanted; a SystemManager without one does
+	no timing at all.
+
+	"""
+	def __init__(self, capacity=600):
+		self.capacity = capacity
+		self.frames = 0 # frames recorded in total, including overwritten ones
+		self.names = [] # one per timed column, 'frame' last
+		self._samples = [] # an array of seconds per name, used as a ring buffer
+		self._systems = None
+
+	def _track(self, systems):
+		self._systems = list(systems)
+		self.names = [type(system).__name__ for system in systems] + ['frame']
+		self._samples = [array('d', [0.0] * self.capacity) for name in self.names]
+		self.frames = 0
+
+	def update_systems(self, systems, dt, entity_manager):
+		"""
+		Runs systems for one frame, like SystemManager.update_systems, timing each
+		"""
+		if systems != self._systems:
+			self._track(systems) # systems were added, so start over
+
+		slot = self.frames % self.capacity
+		samples = self._samples
+
+		start = last = clock()
+		for n, system in enumerate(systems):
+			system.update(dt, entity_manager)
+			now = clock()
+			samples[n][slot] = now - last
+			last = now
+		samples[-1][slot] = last - start
+		self.frames += 1
+
+	def recorded(self):
+		"""
+		Returns the number of frames in the ring buffer
+		"""
+		return min(self.frames, self.capacity)
+
+	def samples(self, name):
+		"""
+		Returns the recorded times of name in seconds, oldest first
+		"""
+		ring = self._samples[self.names.index(name)]
+		count = self.recorded()
+		if self.frames <= self.capacity:
+			return list(ring[:count])
+		start = self.frames % self.capacity
+		return list(ring[start:]) + list(ring[:start])
+
+	def stats(self):
+		"""
+		Returns a list of (name, min, mean, p99) in seconds for every system and
+		for the whole frame, over the recorded frames
+		"""
+		count = self.recorded()
+		if not count:
+			return []
+		result = []
+		for name, ring in zip(self.names, self._samples):
+			times = sorted(ring[:count])
+			p99 = times[min(count - 1, int(count * 0.99))]
+			result.append((name, times[0], sum(times) / count, p99))
+		return result
+
+	def report(self):
+		"""
+		Returns the stats as lines of text, in milliseconds
+		"""
+		lines = ['{:<28} {:>7} {:>7} {:>7}'.format('ms', 'min', 'mean', 'p99')]
+		for name, low, mean, p99 in self.stats():
+			lines.append('{:<28} {:7.3f} {:7.3f} {:7.3f}'.format(name, low*1000, mean*1000, p99*1000))
+		return lines
+
+	def write_csv(self, path):
+		"""
+		Writes the recorded frames to path, one row per frame, oldest first, with
+		a column of seconds for every system and one for the whole frame
+		"""
+		columns = [self.samples(name) for name in self.names]
+		with open(path, 'wb') as f:
+			writer = csv.writer(f)
+			writer.writerow(self.names)
+			for row in zip(*columns):
+				writer.writerow(['{:.9f}'.format(t) for t in row])
+
+class ProfilerOverlay(cocos.layer.Layer):
+	"""
+	Shows a FrameProfiler's report in the top left corner of the window,
+	refreshed twice a second
+	"""
+	def __init__(self, profiler):
+		super(ProfilerOverlay, self).__init__()
+		self.profiler = profiler
+		self.label = cocos.text.Label('', font_name='Courier New', font_size=10,
+									  multiline=True, width=config.WIDTH,
+									  anchor_y='top', color=(255, 255, 255, 200))
+		self.label.position = 4, config.HEIGHT - 4
+		self.add(self.label)
+		
+	def on_enter(self):
+		super(ProfilerOverlay, self).on_enter()
+		self.schedule_interval(self.refresh, 0.5)
+
+	def refresh(self, dt):
+		self.label.element.text = '\n'.join(self.profiler.report())
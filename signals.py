@@ -0,0 +1,313 @@
+"""
+Logic signals: gates, the wires between them, the triggers that drive them,
+and the actuators they drive.
+
+As roadmap.txt puts it, a Trigger changes state when something happens in
+the level, like the player standing on a pad or pressing a button, and alerts
+whatever is wired to it, so that an elevator, say, doesn't need to know where
+its signal comes from.  In between, signals can go through gates, so levels
+can be puzzles in digital logic.
+
+Every gate, trigger and actuator is an entity.  A Wire is an entity of its own
+that connects the output of one of them to an input of a gate or actuator.
+
+"""
+import heapq
+
+import bootstrap
+import ecs
+import common
+
+OPERATIONS = {
+	'BUF': lambda values: any(values),
+	'NOT': lambda values: not any(values),
+	'AND': lambda values: bool(values) and all(values),
+	'NAND': lambda values: not (bool(values) and all(values)),
+	'OR': lambda values: any(values),
+	'NOR': lambda values: not any(values),
+	'XOR': lambda values: sum(values) % 2 == 1,
+	'XNOR': lambda values: sum(values) % 2 == 0,
+}
+
+class Gate(ecs.Component):
+	"""
+	A logic gate.  op is one of the names in OPERATIONS, and value is its
+	output, worked out by the SignalSystem from the outputs wired to it.
+
+	"""
+	__slots__ = ('op', 'value')
+
+	def __init__(self, op):
+		if op not in OPERATIONS:
+			raise ValueError('unknown gate {}'.format(op))
+		self.op = op
+		self.value = False
+
+class Wire(ecs.Component):
+	"""
+	Connects the output of the gate or trigger source to an input of the gate
+	or actuator target.  value is the signal on it, for drawing lit wires.
+
+	"""
+	__slots__ = ('source', 'target', 'value')
+
+	def __init__(self, source, target):
+		self.source = source
+		self.target = target
+		self.value = False
+
+class Trigger(ecs.Component):
+	"""
+	A source of a signal.  Its value is set in one of three ways:
+
+	contact		: on while an entity with PlayerInput overlaps the trigger's
+				  RectCollider, when contact is True
+
+	input_name	: on while an input, like 'JUMP', is held on any PlayerInput
+
+	otherwise, by calling SignalSystem.set
+
+	"""
+	__slots__ = ('contact', 'input_name', 'value')
+
+	def __init__(self, contact=False, input_name=None):
+		self.contact = contact
+		self.input_name = input_name
+		self.value = False
+
+class Actuator(ecs.Component):
+	"""
+	Something a signal drives.  value is the signal wired to it; when it
+	changes, the callbacks are called with func(e_id, value).
+
+	"""
+	__slots__ = ('value', 'callbacks')
+
+	def __init__(self):
+		self.value = False
+		self.callbacks = []
+
+	def register_callback(self, func):
+		"""
+		Registers a function to call when the value changes.
+		The callback should have the signature:
+		func(e_id, value)
+		"""
+		self.callbacks.append(func)
+
+class SignalSystem(ecs.System):
+	"""
+	Propagates signals from triggers through gates to actuators, only when
+	something changes.
+
+	The entities are put in topological order once, when gates, wires,
+	triggers or actuators are added or removed.  Each one gets a level one more
+	than the highest of those wired to it, with triggers at level 0.  Then on
+	each update, the gates and actuators wired to a trigger whose value changed
+	are put on a heap by level, and are evaluated in that order.  Those whose
+	output changes put the ones wired to them on the heap in turn, so
+	everything is evaluated at most once, after all of its inputs, and a
+	frame where no trigger changes costs next to nothing, however big the
+	circuit.
+
+	Wires that close a loop, as in a latch, carry their signal on the next
+	update instead, like a flip-flop.
+
+	Contact triggers read the contacts found by the EntityCollisionSystem, so
+	this should run after it.
+
+	"""
+	def __init__(self):
+		super(SignalSystem, self).__init__()
+
+		# no declarations, since the callbacks of actuators can use anything,
+		# so systemmanager puts it in a wave of its own
+		self.reads = None
+		self.writes = None
+		self._changed = None # set from EntityManager.track
+		self._counts = None # of each of the component types, at the last build
+		self._nodes = {} # e_id -> Gate, Trigger or Actuator
+		self._levels = {} # e_id -> topological level
+		self._inputs = {} # e_id -> [Wire, ...] into it
+		self._outputs = {} # e_id -> [Wire, ...] out of it, that don't close loops
+		self._loops = {} # e_id -> [Wire, ...] out of it, that close loops
+		self._pending = set() # e_ids to evaluate on the next update
+		self._set = {} # e_id -> value from set()
+		self._touching = set() # contact triggers that were on at the last update
+		self._input_triggers = []
+		self._collisions = None
+
+	def set(self, e_id, value):
+		"""
+		Sets the value of a Trigger without contact or input_name, from the next
+		update on
+		"""
+		self._set[e_id] = bool(value)
+
+	def value(self, e_id):
+		"""
+		Returns the output of a gate or trigger, or the input of an actuator
+		"""
+		return self._nodes[e_id].value
+
+	def update(self, dt, entity_manager):
+		if self._changed is None:
+			self._changed = entity_manager.track(Gate, Wire, Trigger, Actuator)
+		counts = tuple(entity_manager.count(t) for t in (Gate, Wire, Trigger, Actuator))
+		if self._changed or counts != self._counts:
+			self._counts = counts
+			self._changed.clear()
+			self._build(entity_manager)
+
+		heap = []
+		pending = self._pending
+		self._pending = set()
+		for e_id in pending:
+			if e_id in self._nodes:
+				heapq.heappush(heap, (self._levels[e_id], e_id))
+
+		for e_id, value in self._set.iteritems():
+			trigger = self._nodes.get(e_id)
+			if isinstance(trigger, Trigger) and trigger.value != value:
+				trigger.value = value
+				self._fire(e_id, heap)
+		self._set.clear()
+
+		if self._input_triggers:
+			held = set()
+			for e_id, pi in entity_manager.view(common.PlayerInput):
+				for name, value in pi.input.iteritems():
+					if value:
+						held.add(name)
+			for e_id, trigger in self._input_triggers:
+				value = trigger.input_name in held
+				if trigger.value != value:
+					trigger.value = value
+					self._fire(e_id, heap)
+
+		if self._collisions is not None:
+			touching = set()
+			players = entity_manager.view(common.PlayerInput)
+			nodes = self._nodes
+			for e_id, other in self._collisions.contacts:
+				for trigger_id, player_id in ((e_id, other), (other, e_id)):
+					trigger = nodes.get(trigger_id)
+					if (isinstance(trigger, Trigger) and trigger.contact
+							and player_id in players):
+						touching.add(trigger_id)
+			for e_id in touching ^ self._touching:
+				self._nodes[e_id].value = e_id in touching
+				self._fire(e_id, heap)
+			self._touching = touching
+
+		self._propagate(heap)
+
+	def _fire(self, e_id, heap):
+		"""
+		Puts what is wired to e_id on the heap, and what it loops back to off
+		until the next update
+		"""
+		value = self._nodes[e_id].value
+		levels = self._levels
+		for wire in self._outputs.get(e_id, ()):
+			wire.value = value
+			heapq.heappush(heap, (levels[wire.target], wire.target))
+		for wire in self._loops.get(e_id, ()):
+			wire.value = value
+			self._pending.add(wire.target)
+
+	def _propagate(self, heap):
+		done = set()
+		while heap:
+			level, e_id = heapq.heappop(heap)
+			if e_id in done:
+				continue # reached from more than one input
+			done.add(e_id)
+			node = self._nodes[e_id]
+			values = [wire.value for wire in self._inputs.get(e_id, ())]
+			if isinstance(node, Gate):
+				value = OPERATIONS[node.op](values)
+				if value != node.value:
+					node.value = value
+					self._fire(e_id, heap)
+			elif isinstance(node, Actuator):
+				value = any(values)
+				if value != node.value:
+					node.value = value
+					for func in node.callbacks:
+						func(e_id, value)
+
+	def _build(self, entity_manager):
+		"""
+		Puts the gates, triggers and actuators in topological order, and
+		evaluates every gate
+		"""
+		nodes = {}
+		for component_type in (Trigger, Gate, Actuator):
+			nodes.update(entity_manager.components(component_type))
+
+		inputs = dict((e_id, []) for e_id in nodes)
+		outputs = dict((e_id, []) for e_id in nodes)
+		for e_id, wire in entity_manager.components(Wire).iteritems():
+			if wire.source in nodes and wire.target in nodes:
+				inputs[wire.target].append(wire)
+				outputs[wire.source].append(wire)
+
+		# depth first, from the triggers first, so that the wires that close
+		# loops are the ones leading back into the part already visited
+		levels = {}
+		loops = {}
+		forward = dict((e_id, []) for e_id in nodes)
+		state = {} # e_id -> 1 while being visited, 2 when done
+		order = [] # in reverse topological order
+		starts = sorted(nodes, key=lambda e_id: (not isinstance(nodes[e_id], Trigger), e_id))
+		for start in starts:
+			if start in state:
+				continue
+			state[start] = 1
+			stack = [(start, iter(outputs[start]))]
+			while stack:
+				e_id, wires = stack[-1]
+				for wire in wires:
+					target = wire.target
+					if state.get(target) == 1:
+						loops.setdefault(e_id, []).append(wire)
+					else:
+						forward[e_id].append(wire)
+						if target not in state:
+							state[target] = 1
+							stack.append((target, iter(outputs[target])))
+							break
+				else:
+					state[e_id] = 2
+					order.append(e_id)
+					stack.pop()
+		for e_id in reversed(order):
+			level = levels.setdefault(e_id, 0)
+			for wire in forward[e_id]:
+				if levels.get(wire.target, 0) < level + 1:
+					levels[wire.target] = level + 1
+
+		self._nodes = nodes
+		self._levels = levels
+		self._inputs = inputs
+		self._outputs = forward
+		self._loops = loops
+		self._input_triggers = [(e_id, node) for e_id, node in nodes.iteritems()
+								if isinstance(node, Trigger) and node.input_name]
+		self._touching = set(e_id for e_id, node in nodes.iteritems()
+							 if isinstance(node, Trigger) and node.contact and node.value)
+		self._collisions = None
+		if any(isinstance(node, Trigger) and node.contact for node in nodes.itervalues()):
+			for system in self.sys_man.ordered_systems():
+				if isinstance(system, common.EntityCollisionSystem):
+					self._collisions = system
+
+		# everything is evaluated once, since anything may have changed
+		for e_id, node in nodes.iteritems():
+			for wire in outputs[e_id]:
+				wire.value = node.value
+		heap = [(levels[e_id], e_id) for e_id, node in nodes.iteritems()
+				if not isinstance(node, Trigger)]
+		heapq.heapify(heap)
+		self._propagate(heap)
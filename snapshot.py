@@ -0,0 +1,573 @@
+"""
+Snapshots of the whole state of a level's entities, for saving and loading,
+restarting a level without reloading its map, and rewinding.
+
+A snapshot is columnar: for every component type with a Codec, an array of
+the e_ids that have one, and an array of doubles holding the fields of their
+components one after the other.  Taking one reads the components' numbers
+into flat arrays and nothing else, and saving it is writing the arrays out.
+It still reads every component of every entity, so it costs about 10 us per
+entity with the standard components: a millisecond at 100 entities, which can
+be done every step, but 10 ms at 1000, most of a 16 ms frame.  Levels that
+rewind, see RewindSystem, should keep to a few hundred entities.
+
+Images, like those of sprites and JumperAnimations, are stored by name.  They
+have to be given a name with register_image before a snapshot is taken.
+
+Restoring is done in place, into the level the snapshot was taken from or
+one built the same way.  Components whose values differ are written through
+their usual attributes, so trackers and stores notice, entities that were
+added since are removed, and entities that were removed since are made again.
+Components of types without a Codec are left as they are, and the callbacks of
+RectColliders can't be saved, so remade ones have none.
+
+The plain input dictionaries of PlayerInputs, which scripts and batchsim
+drive, are kept by reference in the snapshot, so that a PlayerInput is given
+back the same dictionary, even when it is remade.  Those of a snapshot loaded
+from a file are new dictionaries.
+
+File layout, all little-endian:
+
+	header		: magic 'LGSS', version, and the length of the metadata
+	metadata	: JSON with the frame, the image names, and for each column the
+				  component type, the number of entities and fields per entity
+	columns		: for each column, its e_ids as 32 bit ints, then its values
+				  as doubles
+
+"""
+import array
+import collections
+import json
+import struct
+import sys
+
+import bootstrap
+import ecs
+import config
+import arraystore
+import common
+import jumper
+import spritesystem
+import inputmanager
+
+MAGIC = 'LGSS'
+VERSION = 2
+
+_HEADER = struct.Struct('<4sHI')
+
+NONE = float('nan') # stands for None in fields that may not have a value
+
+_images = {} # image -> name
+_images_by_name = {} # name -> image
+
+def register_image(name, image):
+	"""
+	Gives an image, or an Animation, the name snapshots refer to it by
+	"""
+	_images[image] = name
+	_images_by_name[name] = image
+
+class Codec(object):
+	"""
+	Turns components of one type into a fixed number of doubles, and back.
+
+	encode returns the fields of a component as a tuple, create makes a new
+	component from them, and restore writes them into an existing component.
+	Images are passed through snapshot.image_index and snapshot.image, to
+	store them by name.
+
+	encode_all appends the e_ids and fields of every component to a column,
+	and can be overridden to read them in bulk.
+
+	"""
+	component_type = None
+	fields = 0
+
+	def encode(self, component, snapshot):
+		return ()
+
+	def encode_all(self, components, ids, values, snapshot, entity_manager):
+		encode = self.encode
+		for e_id, component in components.iteritems():
+			ids.append(e_id)
+			values.extend(encode(component, snapshot))
+
+	def create(self, values, snapshot, restorer):
+		return self.component_type()
+
+	def restore(self, component, values, snapshot, restorer):
+		pass
+
+class PositionCodec(Codec):
+	component_type = common.Position
+	fields = 2
+
+	def encode(self, pos, snapshot):
+		return pos.x, pos.y
+
+	def encode_all(self, components, ids, values, snapshot, entity_manager):
+		store = entity_manager.kinematics
+		if store is None:
+			return super(PositionCodec, self).encode_all(components, ids, values,
+														 snapshot, entity_manager)
+		# the positions in the store are copied out in one go
+		ids.extend(store.entities())
+		values.fromstring(store.pos[:len(store)].tostring())
+		for e_id, pos in components.iteritems():
+			if e_id not in store:
+				ids.append(e_id)
+				values.extend((pos.x, pos.y))
+
+	def create(self, values, snapshot, restorer):
+		pos = common.Position()
+		pos.x, pos.y = values
+		return pos
+
+	def restore(self, pos, values, snapshot, restorer):
+		x, y = values
+		if pos.x != x or pos.y != y:
+			pos.x, pos.y = x, y
+
+class VelocityCodec(Codec):
+	component_type = common.Velocity
+	fields = 3
+
+	def encode(self, vel, snapshot):
+		return vel.v_x, vel.v_y, vel.use_gravity
+
+	def encode_all(self, components, ids, values, snapshot, entity_manager):
+		store = entity_manager.kinematics
+		if store is None:
+			return super(VelocityCodec, self).encode_all(components, ids, values,
+														 snapshot, entity_manager)
+		n = len(store)
+		ids.extend(store.entities())
+		values.fromstring(arraystore.numpy.column_stack((store.vel[:n],
+														 store.gravity[:n])).tostring())
+		for e_id, vel in components.iteritems():
+			if e_id not in store:
+				ids.append(e_id)
+				values.extend((vel.v_x, vel.v_y, vel.use_gravity))
+
+	def create(self, values, snapshot, restorer):
+		vel = common.Velocity()
+		self.restore(vel, values, snapshot, restorer)
+		return vel
+
+	def restore(self, vel, values, snapshot, restorer):
+		vel.v_x, vel.v_y, gravity = values
+		vel.use_gravity = bool(gravity)
+
+class JumperCodec(Codec):
+	component_type = jumper.Jumper
+	fields = 4
+
+	def encode(self, j, snapshot):
+		return j.in_air, j.jump, j.walk, j.acc
+
+	def create(self, values, snapshot, restorer):
+		j = jumper.Jumper()
+		self.restore(j, values, snapshot, restorer)
+		return j
+
+	def restore(self, j, values, snapshot, restorer):
+		in_air, j.jump, j.walk, j.acc = values
+		j.in_air = bool(in_air)
+
+class JumperAnimationCodec(Codec):
+	component_type = jumper.JumperAnimation
+	fields = 4
+
+	def encode(self, j_a, snapshot):
+		index = snapshot.image_index
+		return (index(j_a.stand_left), index(j_a.stand_right), index(j_a.walk_left),
+				index(j_a.walk_right))
+
+	def create(self, values, snapshot, restorer):
+		j_a = jumper.JumperAnimation()
+		self.restore(j_a, values, snapshot, restorer)
+		return j_a
+
+	def restore(self, j_a, values, snapshot, restorer):
+		for name, index in zip(j_a.__slots__, values):
+			setattr(j_a, name, snapshot.image(index))
+
+class RectColliderCodec(Codec):
+	component_type = common.RectCollider
+	fields = 9
+
+	def encode(self, collider, snapshot):
+		rect = collider.hit_rect
+		last = collider.last
+		if last is None:
+			last = (NONE,) * 4
+		else:
+			last = last.position + last.size
+		return (collider.collide_with_map,) + rect.position + rect.size + last
+
+	def create(self, values, snapshot, restorer):
+		collider = common.RectCollider()
+		self.restore(collider, values, snapshot, restorer)
+		return collider
+
+	def restore(self, collider, values, snapshot, restorer):
+		collider.collide_with_map = bool(values[0])
+		rect = collider.hit_rect
+		rect.position = values[1:3]
+		rect.size = values[3:5]
+		if values[5] != values[5]: # NONE
+			collider.last = None
+		else:
+			last = collider.last = rect.copy()
+			last.position = values[5:7]
+			last.size = values[7:9]
+
+class SpriteCodec(Codec):
+	"""
+	Stores the sprite's image by name and its size, along with the positions
+	kept for interpolation.  Remade sprites come from the level's make_sprite.
+	"""
+	component_type = spritesystem.Sprite
+	fields = 7
+
+	def encode(self, sprite, snapshot):
+		previous = sprite.previous or (NONE, NONE)
+		current = sprite.current or (NONE, NONE)
+		return ((snapshot.image_index(sprite.sprite.image), sprite.sprite.width,
+				 sprite.sprite.height) + previous + current)
+
+	def create(self, values, snapshot, restorer):
+		sprite = spritesystem.Sprite()
+		image = snapshot.image(values[0])
+		sprite.sprite = restorer.level.make_sprite(image)
+		if image is None:
+			# only stand-in sprites have no image to take their size from
+			sprite.sprite.width = values[1]
+			sprite.sprite.height = values[2]
+		self._restore_positions(sprite, values)
+		return sprite
+
+	def restore(self, sprite, values, snapshot, restorer):
+		image = snapshot.image(values[0])
+		if image is not sprite.sprite.image:
+			sprite.sprite.image = image
+		self._restore_positions(sprite, values)
+
+	def _restore_positions(self, sprite, values):
+		px, py, cx, cy = values[3:]
+		sprite.previous = None if px != px else (px, py)
+		sprite.current = None if cx != cx else (cx, cy)
+
+_INPUT_NAMES = list(inputmanager.InputBinding.INPUT_NAMES)
+_INPUT_BITS = dict((name, 1 << n) for n, name in enumerate(_INPUT_NAMES))
+
+class PlayerInputCodec(Codec):
+	"""
+	Stores the index of the InputBinding, or -1, and for a plain input
+	dictionary, its snapshot.input_index, its values, and as bits, the inputs
+	that were held when pressed and released last compared them.
+
+	The edge counts of a binding only go up, so a restored PlayerInput with a
+	binding starts counting edges from the counts it has now.
+	"""
+	component_type = common.PlayerInput
+	fields = 4 + len(_INPUT_NAMES)
+
+	def encode(self, pi, snapshot):
+		index = pi.index
+		if index is None:
+			return ([-1, snapshot.input_index(pi.input)] + map(pi.input.__getitem__, _INPUT_NAMES) +
+					[_bits(pi._seen['pressed']), _bits(pi._seen['released'])])
+		return [index] + [0] * (self.fields - 1)
+
+	def create(self, values, snapshot, restorer):
+		index = int(values[0])
+		if index >= 0:
+			return common.PlayerInput(index, restorer.level.input_manager)
+		pi = common.PlayerInput()
+		self.restore(pi, values, snapshot, restorer)
+		return pi
+
+	def restore(self, pi, values, snapshot, restorer):
+		if pi.index is None:
+			# an entity that is still there keeps its dictionary, even when
+			# the snapshot was loaded from a file
+			input_dict = snapshot.input_dict(values[1], pi.input)
+			if pi.input is not input_dict:
+				pi.input = input_dict
+			input_dict.update(zip(_INPUT_NAMES, values[2:-2]))
+			pi._seen['pressed'] = _unbits(int(values[-2]))
+			pi._seen['released'] = _unbits(int(values[-1]))
+		else:
+			pi._seen['pressed'] = dict(pi.presses)
+			pi._seen['released'] = dict(pi.releases)
+
+def _bits(seen):
+	bits = 0
+	for name, held in seen.iteritems():
+		if held:
+			bits |= _INPUT_BITS[name]
+	return bits
+
+def _unbits(bits):
+	# inputs that aren't in seen count as not held
+	if not bits:
+		return {}
+	return dict((name, True) for name, bit in _INPUT_BITS.iteritems() if bits & bit)
+
+class AsleepCodec(Codec):
+	component_type = common.Asleep
+
+CODECS = [PositionCodec(), VelocityCodec(), JumperCodec(), JumperAnimationCodec(),
+		  RectColliderCodec(), SpriteCodec(), PlayerInputCodec(), AsleepCodec()]
+
+class Snapshot(object):
+	"""
+	The state of a level's entities at one step.
+
+	frame	: the level's frame count when it was taken, if it has one
+
+	columns	: {component type name: (array of e_ids, array of values)}
+
+	images	: names of the images the values refer to by index
+
+	inputs	: the plain input dictionaries the values refer to by index, which
+			  aren't saved
+
+	"""
+	def __init__(self, frame=0):
+		self.frame = frame
+		self.columns = collections.OrderedDict()
+		self.images = []
+		self.inputs = []
+		self._image_indexes = {}
+		self._input_indexes = {} # id of an input dictionary -> index
+
+	def image_index(self, image):
+		"""
+		Returns the index in images of an image's name, or -1 for None
+		"""
+		if image is None:
+			return -1
+		index = self._image_indexes.get(image)
+		if index is None:
+			try:
+				name = _images[image]
+			except KeyError:
+				raise ValueError('{!r} has no name; give it one with register_image'.format(image))
+			index = self._image_indexes[image] = len(self.images)
+			self.images.append(name)
+		return index
+
+	def image(self, index):
+		"""
+		Returns the image with index image_index, or None for -1
+		"""
+		if index < 0:
+			return None
+		return _images_by_name[self.images[int(index)]]
+
+	def input_index(self, input_dict):
+		"""
+		Returns the index in inputs of a plain input dictionary
+		"""
+		index = self._input_indexes.get(id(input_dict))
+		if index is None:
+			index = self._input_indexes[id(input_dict)] = len(self.inputs)
+			self.inputs.append(input_dict)
+		return index
+
+	def input_dict(self, index, default=None):
+		"""
+		Returns the input dictionary with index input_index.  A snapshot loaded
+		from a file doesn't have them, so the first time each is asked for it
+		takes default, or a new one if default is None.
+		"""
+		index = int(index)
+		if len(self.inputs) <= index:
+			self.inputs.extend([None] * (index + 1 - len(self.inputs)))
+		if self.inputs[index] is None:
+			if default is None:
+				default = inputmanager.InputBinding.model_dict.copy()
+			self.inputs[index] = default
+			self._input_indexes[id(default)] = index
+		return self.inputs[index]
+
+	def entities(self):
+		"""
+		Returns the set of e_ids in the snapshot
+		"""
+		found = set()
+		for ids, values in self.columns.itervalues():
+			found.update(ids)
+		return found
+
+	def tostring(self):
+		meta = json.dumps({
+			'frame': self.frame,
+			'images': self.images,
+			'columns': [(name, len(ids), len(values) // len(ids) if ids else 0)
+						for name, (ids, values) in self.columns.iteritems()],
+		})
+		parts = [_HEADER.pack(MAGIC, VERSION, len(meta)), meta]
+		for ids, values in self.columns.itervalues():
+			if sys.byteorder == 'big':
+				ids, values = array.array('i', ids), array.array('d', values)
+				ids.byteswap()
+				values.byteswap()
+			parts.append(ids.tostring())
+			parts.append(values.tostring())
+		return ''.join(parts)
+
+	@classmethod
+	def fromstring(cls, data):
+		magic, version, length = _HEADER.unpack_from(data)
+		if magic != MAGIC:
+			raise ValueError('not a snapshot')
+		if version != VERSION:
+			raise ValueError('version {} of the snapshot format, not {}'.format(version, VERSION))
+		meta = json.loads(data[_HEADER.size:_HEADER.size + length])
+		snapshot = cls(meta['frame'])
+		snapshot.images = [str(name) for name in meta['images']]
+		offset = _HEADER.size + length
+		for name, count, fields in meta['columns']:
+			ids = array.array('i')
+			ids.fromstring(data[offset:offset + 4*count])
+			offset += 4*count
+			values = array.array('d')
+			values.fromstring(data[offset:offset + 8*count*fields])
+			offset += 8*count*fields
+			if sys.byteorder == 'big':
+				ids.byteswap()
+				values.byteswap()
+			snapshot.columns[str(name)] = (ids, values)
+		return snapshot
+
+	def save(self, path):
+		with open(path, 'wb') as f:
+			f.write(self.tostring())
+
+	@classmethod
+	def load(cls, path):
+		with open(path, 'rb') as f:
+			return cls.fromstring(f.read())
+
+class Snapshotter(object):
+	"""
+	Takes snapshots of a level's entities and restores them.
+
+	level	: a level.Level or headless.HeadlessLevel; anything with a database,
+			  systems, an input_manager for PlayerInputs with bindings, which
+			  may be None, and a make_sprite(image) for remade sprites
+
+	codecs	: the Codecs of the component types that are saved
+
+	After a restore, every system with a restored(entity_manager) method has it
+	called, for systems that keep state about the entities.
+
+	"""
+	def __init__(self, level, codecs=None):
+		self.level = level
+		self.codecs = list(CODECS if codecs is None else codecs)
+
+	def take(self, frame=None):
+		"""
+		Returns a Snapshot of the level's entities as they are now.  frame
+		defaults to the level's frame count.
+		"""
+		em = self.level.database
+		if frame is None:
+			frame = getattr(self.level, 'frames', 0)
+		snapshot = Snapshot(frame)
+		for codec in self.codecs:
+			ids = array.array('i')
+			values = array.array('d')
+			codec.encode_all(em.components(codec.component_type), ids, values, snapshot, em)
+			snapshot.columns[codec.component_type.__name__] = (ids, values)
+		return snapshot
+
+	def restore(self, snapshot):
+		"""
+		Puts the level's entities back the way they were when snapshot was taken
+		"""
+		em = self.level.database
+
+		# entities that came along after the snapshot are removed
+		now = set()
+		for codec in self.codecs:
+			now.update(em.components(codec.component_type))
+		for e_id in now - snapshot.entities():
+			sprite = em.component_for_entity(e_id, spritesystem.Sprite)
+			if sprite and getattr(sprite.sprite, 'parent', None) is not None:
+				sprite.sprite.kill()
+			em.remove_entity(e_id)
+
+		for codec in self.codecs:
+			column = snapshot.columns.get(codec.component_type.__name__)
+			if column is None:
+				continue
+			ids, values = column
+			fields = codec.fields
+			component_type = codec.component_type
+			components = em.components(component_type)
+			stale = set(components)
+			for n, e_id in enumerate(ids):
+				row = values[n*fields:(n + 1)*fields]
+				component = components.get(e_id)
+				if component is None:
+					em.add_component(e_id, codec.create(row, snapshot, self))
+				else:
+					codec.restore(component, row, snapshot, self)
+					stale.discard(e_id)
+			for e_id in stale:
+				em.remove_component(e_id, component_type)
+			# what trackers had yet to see when the snapshot was taken isn't in
+			# it, so everything restored is as good as changed
+			em.mark_all_changed(ids, component_type)
+
+		if hasattr(self.level, 'frames'):
+			self.level.frames = snapshot.frame
+		for system in self.level.systems.ordered_systems():
+			restored = getattr(system, 'restored', None)
+			if restored is not None:
+				restored(em)
+
+class RewindSystem(ecs.System):
+	"""
+	Takes a snapshot every step and keeps the last seconds of them, so that the
+	level can be rewound to any of those steps.  Should run after every other
+	system.  A snapshot costs about 10 us per entity, so this is for levels of
+	a few hundred entities at most.
+	"""
+	def __init__(self, seconds=None):
+		super(RewindSystem, self).__init__()
+
+		if seconds is None:
+			seconds = config.REWIND_SECONDS
+		self.history = collections.deque(maxlen=max(1, int(round(seconds / config.STEP))))
+		self._snapshotter = None
+
+	@property
+	def snapshotter(self):
+		if self._snapshotter is None:
+			self._snapshotter = Snapshotter(self.sys_man.parent)
+		return self._snapshotter
+
+	def update(self, dt, entity_manager):
+		# the level counts this step once its systems have run
+		frame = getattr(self.sys_man.parent, 'frames', -1) + 1
+		self.history.append(self.snapshotter.take(frame))
+
+	def rewind(self, steps=1):
+		"""
+		Restores the level to how it was steps steps ago, or as far back as
+		there are snapshots, forgetting the snapshots after it.  Returns the
+		number of steps rewound.
+		"""
+		steps = min(steps, len(self.history) - 1)
+		if steps < 0:
+			return 0
+		for n in xrange(steps):
+			self.history.pop()
+		self.snapshotter.restore(self.history[-1])
+		return steps
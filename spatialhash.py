@@ -0,0 +1,106 @@
+"""
+A uniform grid for finding overlapping rects without testing every pair.
+
+"""
+
+class SpatialHash(object):
+	"""
+	Buckets rects by the grid cells they cover.  Only rects that share a cell
+	are tested against each other, so finding every overlapping pair costs
+	about as much as the number of rects, as long as rects are not much bigger
+	than a cell and not all piled into the same few cells.
+
+	Usage, once per frame:
+
+		grid.clear()
+		for key, rect in things:
+			grid.insert(key, rect)
+		for key_a, key_b in grid.overlapping_pairs():
+			...
+
+	"""
+	def __init__(self, cell_width, cell_height):
+		self.cell_width = cell_width
+		self.cell_height = cell_height
+		self._cells = {} # (i, j) -> [index, ...]
+		self._keys = []
+		self._rects = []
+
+	def __len__(self):
+		return len(self._keys)
+
+	def clear(self):
+		self._cells = {}
+		self._keys = []
+		self._rects = []
+
+	def insert(self, key, rect):
+		"""
+		Adds rect to every cell it covers.  rect needs x, y, width and height
+		attributes, like a cocos.rect.Rect, and is not copied.
+		"""
+		index = len(self._keys)
+		self._keys.append(key)
+		self._rects.append(rect)
+
+		cells = self._cells
+		i_1, j_1, i_2, j_2 = self._cell_range(rect)
+		for i in xrange(i_1, i_2 + 1):
+			for j in xrange(j_1, j_2 + 1):
+				cell = cells.get((i, j))
+				if cell is None:
+					cells[(i, j)] = [index]
+				else:
+					cell.append(index)
+
+	def query(self, rect):
+		"""
+		Returns the keys of the inserted rects that overlap rect
+		"""
+		found = set()
+		cells = self._cells
+		i_1, j_1, i_2, j_2 = self._cell_range(rect)
+		for i in xrange(i_1, i_2 + 1):
+			for j in xrange(j_1, j_2 + 1):
+				for index in cells.get((i, j), ()):
+					if index not in found and _overlap(rect, self._rects[index]):
+						found.add(index)
+		return [self._keys[index] for index in found]
+
+	def overlapping_pairs(self):
+		"""
+		Returns a list of (key_a, key_b) for every pair of inserted rects that
+		overlap.  Each pair is reported once.  Rects that only touch along an
+		edge do not overlap.
+		"""
+		keys = self._keys
+		rects = self._rects
+		tested = set()
+		pairs = []
+		for cell in self._cells.itervalues():
+			count = len(cell)
+			if count < 2:
+				continue
+			for n in xrange(count - 1):
+				a = cell[n]
+				rect_a = rects[a]
+				for m in xrange(n + 1, count):
+					b = cell[m]
+					# a pair sharing several cells is only tested once
+					pair = (a, b) if a < b else (b, a)
+					if pair in tested:
+						continue
+					tested.add(pair)
+					if _overlap(rect_a, rects[b]):
+						pairs.append((keys[a], keys[b]))
+		return pairs
+
+	def _cell_range(self, rect):
+		cw = self.cell_width
+		ch = self.cell_height
+		return (int(rect.x // cw), int(rect.y // ch),
+				int((rect.x + rect.width) // cw), int((rect.y + rect.height) // ch))
+
+def _overlap(a, b):
+	return (a.x < b.x + b.width and b.x < a.x + a.width and
+			a.y < b.y + b.height and b.y < a.y + a.height)
@@ -1,3 +1,4 @@
+import bootstrap
 import cocos
 import ecs
 import common
@@ -5,21 +6,82 @@ import common
 class Sprite(ecs.Component):
 	"""
 	Encapsulates a cocos sprite.
+	
+	Also keeps the entity's position at the last two simulation steps, for
+	drawing the sprite between them.
 	"""
+	__slots__ = ('sprite', 'previous', 'current')
+	
 	def __init__(self):
 		self.sprite = None
+		self.previous = None
+		self.current = None
 	
 class SpriteTrackerSystem(ecs.System):
 	"""
 	Makes sure that sprites are rendered at the same coordinates as its entity's
 	position
+	
+	When added to a Level with add_interpolator, sprites are instead placed once
+	per rendered frame, between the positions of the last two simulation steps.
+	
+	Only entities whose Position or Sprite changed, and those that were still
+	moving in the last update, are looked at, so entities at rest cost nothing.
 	"""
+	def __init__(self):
+		super(SpriteTrackerSystem, self).__init__()
+		
+		self.reads = (common.Position,)
+		self.writes = (Sprite,)
+		self.interpolating = False
+		self._changed = None # set from EntityManager.track
+		self._moving = set() # entities whose previous and current positions differ
+		self._rows = [] # (e_id, sprite, position) rows looked at in the last update
+		
 	def update(self, dt, entity_manager):
+		if self._changed is None:
+			self._changed = entity_manager.track(common.Position, Sprite)
+		
+		sprites = entity_manager.view(Sprite, common.Position)
+		# moving entities that haven't changed since the last update have stopped,
+		# and need previous to catch up with current
+		ids = self._changed | self._moving
+		self._changed.clear()
 		
-		sprites = entity_manager.pairs_for_type(Sprite)
-		# We have a list of (e_id, component)
-		for e_id, sprite in sprites:
-			# get position for this entity
-			pos = entity_manager.component_for_entity(e_id, common.Position)
-			if pos:
-				sprite.sprite.position = (pos.x, pos.y)
\ No newline at end of file
+		rows = []
+		moving = set()
+		for e_id in ids:
+			row = sprites.row_for_entity(e_id)
+			if row is None:
+				continue
+			e_id, sprite, pos = row
+			sprite.previous = sprite.current
+			sprite.current = (float(pos.x), float(pos.y))
+			if sprite.previous != sprite.current:
+				moving.add(e_id)
+			if not self.interpolating and sprite.sprite.position != sprite.current:
+				sprite.sprite.position = sprite.current
+			rows.append(row)
+		self._moving = moving
+		self._rows = rows
+				
+	def interpolate(self, alpha, entity_manager):
+		"""
+		Places every sprite looked at in the last update alpha of the way from
+		its entity's previous position to its current one
+		"""
+		beta = 1.0 - alpha
+		for e_id, sprite, pos in self._rows:
+			current = sprite.current
+			previous = sprite.previous
+			if current is None:
+				continue # not simulated yet
+			if previous is None or previous == current:
+				placed = current
+			else:
+				placed = (previous[0]*beta + current[0]*alpha,
+						  previous[1]*beta + current[1]*alpha)
+			# a batched sprite rewrites its vertices when moved, so resting
+			# sprites are left alone
+			if sprite.sprite.position != placed:
+				sprite.sprite.position = placed
\ No newline at end of file
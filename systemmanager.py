@@ -0,0 +1,186 @@
+"""
+A SystemManager that runs its own update loop, so that it can be instrumented,
+and that works out which systems share data from what they declare.
+
+"""
+import bootstrap
+import ecs
+import config
+
+class UndeclaredAccess(Exception):
+	pass
+
+class SystemManager(ecs.SystemManager):
+	"""
+	An ecs.SystemManager that keeps its systems in the order they run and runs
+	them itself.
+
+	If profiler is set to a profiler.FrameProfiler, every system is timed.  When
+	it is None, which is the default, update_systems is a plain loop.
+
+	Systems can declare what they use, as reads and writes attributes that are
+	tuples of component types, or of names of other things they share, like
+	'scroller'.  A system that reads another system's results has that
+	system's class in its reads, since every system writes its own class.  A
+	system without declarations, or with both set to None, is taken to use
+	everything, which is right for systems that call callbacks, like
+	common.EntityCollisionSystem and signals.SignalSystem.
+
+	waves() uses the declarations to put the systems in waves.  A system goes
+	in the wave after the last of the systems before it that writes what it
+	reads or writes, or reads what it writes, so the systems of a wave don't
+	depend on each other.  The systems still all run one after the other on
+	this thread, in order of priority: Python only runs one thread at a time,
+	and systems like JumperAnimationSystem and PlayerViewTrackerSystem change
+	cocos and pyglet objects, which must only be used from the main thread.
+	The waves show how much could run at the same time, for instance with
+	work moved into numpy, and what the declarations say about each system.
+
+	With check set, which is config.CHECK_SYSTEMS by default, each system with
+	declarations is given an entity manager that raises UndeclaredAccess when
+	it is asked for a component type the system didn't declare, to find wrong
+	declarations.  Accesses through other objects, like the KinematicStore,
+	aren't checked.  Neither happens while profiling.
+
+	"""
+	def __init__(self, parent):
+		super(SystemManager, self).__init__(parent)
+
+		self._schedule = [] # (priority, order added, system)
+		self._in_order = [] # systems in the order they run
+		self._waves = None # lists of systems that don't depend on each other
+		self.profiler = None
+		self.check = config.CHECK_SYSTEMS
+
+	def ordered_systems(self):
+		"""
+		Returns a list of the systems, in the order they run
+		"""
+		return list(self._in_order)
+
+	def add_system(self, system, priority):
+		super(SystemManager, self).add_system(system, priority)
+
+		# systems with equal priority run in the order they were added
+		self._schedule.append((priority, len(self._schedule), system))
+		self._schedule.sort()
+		self._in_order = [s for p, n, s in self._schedule]
+		self._waves = None
+
+	def waves(self):
+		"""
+		Returns a list of waves of systems, each a list of systems that only
+		depend on those in the waves before it
+		"""
+		if self._waves is None:
+			declared = [_declarations(system) for system in self._in_order]
+			waves = []
+			wave_of = [] # index of the wave of each system
+			for n, system in enumerate(self._in_order):
+				wave = 0
+				for m in xrange(n):
+					if wave_of[m] >= wave and _conflict(declared[m], declared[n]):
+						wave = wave_of[m] + 1
+				if wave == len(waves):
+					waves.append([])
+				waves[wave].append(system)
+				wave_of.append(wave)
+			self._waves = waves
+		return self._waves
+
+	def update_systems(self, dt, entity_manager):
+		if self.profiler is not None:
+			self.profiler.update_systems(self._in_order, dt, entity_manager)
+		elif self.check:
+			for system in self._in_order:
+				system.update(dt, _checked(system, entity_manager))
+		else:
+			for system in self._in_order:
+				system.update(dt, entity_manager)
+
+def _declarations(system):
+	"""
+	Returns (reads, writes) of system as sets, or None for a system without
+	declarations
+	"""
+	writes = getattr(system, 'writes', None)
+	reads = getattr(system, 'reads', None)
+	if writes is None and reads is None:
+		return None
+	return set(reads or ()), set(writes or ()) | set([type(system)])
+
+def _conflict(first, second):
+	"""
+	Returns True if systems with the declarations first and second depend on
+	each other
+	"""
+	if first is None or second is None:
+		return True
+	reads, writes = first
+	other_reads, other_writes = second
+	return bool(writes & (other_reads | other_writes) or other_writes & reads)
+
+def _checked(system, entity_manager):
+	if getattr(system, 'reads', None) is None and getattr(system, 'writes', None) is None:
+		return entity_manager
+	return CheckedEntityManager(entity_manager, system)
+
+class CheckedEntityManager(object):
+	"""
+	Passes everything on to an entity manager, after checking that the
+	component types asked for are in the declarations of system
+	"""
+	def __init__(self, entity_manager, system):
+		self._entity_manager = entity_manager
+		self._system = system
+		self._writes = set(system.writes or ())
+		self._uses = set(system.reads or ()) | self._writes
+
+	def __getattr__(self, name):
+		return getattr(self._entity_manager, name)
+
+	def _use(self, component_types, allowed):
+		for component_type in component_types:
+			if component_type not in allowed:
+				raise UndeclaredAccess('{} uses {} without declaring it'.format(
+									   type(self._system).__name__, component_type.__name__))
+
+	def view(self, *component_types, **kwargs):
+		self._use(component_types + tuple(kwargs.get('exclude', ())), self._uses)
+		return self._entity_manager.view(*component_types, **kwargs)
+
+	def entities_with(self, *component_types):
+		self._use(component_types, self._uses)
+		return self._entity_manager.entities_with(*component_types)
+
+	def component_for_entity(self, e_id, component_type):
+		self._use((component_type,), self._uses)
+		return self._entity_manager.component_for_entity(e_id, component_type)
+
+	def components(self, component_type):
+		self._use((component_type,), self._uses)
+		return self._entity_manager.components(component_type)
+
+	def count(self, component_type):
+		self._use((component_type,), self._uses)
+		return self._entity_manager.count(component_type)
+
+	def track(self, *component_types):
+		self._use(component_types, self._uses)
+		return self._entity_manager.track(*component_types)
+
+	def add_component(self, e_id, component):
+		self._use((type(component),), self._writes)
+		self._entity_manager.add_component(e_id, component)
+
+	def remove_component(self, e_id, component_type):
+		self._use((component_type,), self._writes)
+		self._entity_manager.remove_component(e_id, component_type)
+
+	def mark_changed(self, e_id, component_type):
+		self._use((component_type,), self._writes)
+		self._entity_manager.mark_changed(e_id, component_type)
+
+	def mark_all_changed(self, e_ids, component_type):
+		self._use((component_type,), self._writes)
+		self._entity_manager.mark_all_changed(e_ids, component_type)
@@ -0,0 +1,42 @@
+"""
+Checks that the ActivationSystem forgets entities removed while asleep.  Run
+with pytest.
+"""
+import headless # should always be first, to run without a window
+import entitymanager
+import systemmanager
+import activation
+import common
+
+class Parent(object):
+	def __init__(self):
+		self.scroller = headless.StubScroller()
+
+def entity(database, x, y):
+	e_id = database.new_entity()
+	pos = common.Position()
+	pos.x, pos.y = x, y
+	database.add_component(e_id, pos)
+	return e_id
+
+def test_removed_while_asleep():
+	database = entitymanager.EntityManager()
+	systems = systemmanager.SystemManager(Parent())
+	system = activation.ActivationSystem(margin=0, cell_size=64)
+	systems.add_system(system, 0)
+	near = entity(database, 0, 0)
+	far = entity(database, 10000, 0)
+	systems.update_systems(0, database)
+	assert far in system.sleeping
+	assert near not in system.sleeping
+
+	database.remove_entity(far)
+	systems.update_systems(0, database)
+	assert far not in system.sleeping
+	assert not any(far in cell for cell in system._cells.itervalues())
+
+	# an entity given the same e_id later, near the view, stays awake
+	pos = common.Position()
+	database.add_component(far, pos)
+	systems.update_systems(0, database)
+	assert database.component_for_entity(far, common.Asleep) is None
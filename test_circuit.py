@@ -0,0 +1,162 @@
+"""
+Checks that compiled netlists give the same outputs as the SignalSystem, with
+and without numpy.  Run with pytest.
+"""
+import random
+
+import pytest
+
+import headless # should always be first, to run without a window
+import entitymanager
+import systemmanager
+import signals
+import circuit
+
+@pytest.fixture(params=['numpy', 'ints'])
+def backend(request, monkeypatch):
+	if request.param == 'ints':
+		monkeypatch.setattr(circuit, 'numpy', None)
+	elif circuit.numpy is None:
+		pytest.skip('numpy is not installed')
+	return request.param
+
+class Builder(object):
+	"""
+	Makes the entities of a circuit
+	"""
+	def __init__(self):
+		self.database = entitymanager.EntityManager()
+
+	def node(self, component):
+		e_id = self.database.new_entity()
+		self.database.add_component(e_id, component)
+		return e_id
+
+	def wire(self, source, target):
+		return self.node(signals.Wire(source, target))
+
+	def gate(self, op, *sources):
+		e_id = self.node(signals.Gate(op))
+		for source in sources:
+			self.wire(source, e_id)
+		return e_id
+
+	def output(self, source):
+		e_id = self.node(signals.Actuator())
+		self.wire(source, e_id)
+		return e_id
+
+def adder(builder, bits):
+	"""
+	Makes a ripple carry adder, and returns the triggers of a then b, and the
+	actuators of the sum, lowest bit first, then the carry
+	"""
+	a = [builder.node(signals.Trigger()) for n in xrange(bits)]
+	b = [builder.node(signals.Trigger()) for n in xrange(bits)]
+	sums = []
+	carry = None
+	for n in xrange(bits):
+		half = builder.gate('XOR', a[n], b[n])
+		if carry is None:
+			sums.append(half)
+			carry = builder.gate('AND', a[n], b[n])
+		else:
+			sums.append(builder.gate('XOR', half, carry))
+			carry = builder.gate('OR', builder.gate('AND', a[n], b[n]),
+								 builder.gate('AND', half, carry))
+	return a + b, [builder.output(s) for s in sums + [carry]]
+
+def add(*bits):
+	half = len(bits) // 2
+	total = (sum(bit << n for n, bit in enumerate(bits[:half])) +
+			 sum(bit << n for n, bit in enumerate(bits[half:])))
+	return tuple(bool(total >> n & 1) for n in xrange(half + 1))
+
+def simulate(database, inputs, outputs, combination):
+	"""
+	Returns the outputs the SignalSystem gives for a combination of inputs
+	"""
+	system = signals.SignalSystem()
+	manager = systemmanager.SystemManager(None)
+	manager.add_system(system, 0)
+	for n, e_id in enumerate(inputs):
+		system.set(e_id, combination >> n & 1)
+	manager.update_systems(0, database)
+	return tuple(system.value(e_id) for e_id in outputs)
+
+def bit(vector, n):
+	if isinstance(vector, (int, long)):
+		return bool(vector >> n & 1)
+	return bool(int(vector[n // circuit.WORD_BITS]) >> (n % circuit.WORD_BITS) & 1)
+
+def test_adder_matches_signal_system(backend):
+	builder = Builder()
+	inputs, outputs = adder(builder, 8)
+	netlist = circuit.compile(builder.database, inputs=inputs)
+	assert netlist.outputs == outputs
+	table, combinations = circuit.truth_table(netlist)
+	assert combinations == 1 << 16
+
+	rand = random.Random(0)
+	for combination in [0, combinations - 1] + rand.sample(xrange(combinations), 100):
+		expected = simulate(builder.database, inputs, outputs, combination)
+		assert tuple(bit(vector, combination) for vector in table) == expected
+
+def test_adder_adds(backend):
+	builder = Builder()
+	inputs, outputs = adder(builder, 8)
+	netlist = circuit.compile(builder.database, inputs=inputs)
+	assert circuit.check(netlist, add) is None
+	assert circuit.check(netlist, netlist) is None
+
+def test_counterexample(backend):
+	builder = Builder()
+	x = builder.node(signals.Trigger())
+	y = builder.node(signals.Trigger())
+	out = builder.output(builder.gate('XNOR', x, y))
+	netlist = circuit.compile(builder.database)
+	(table,), combinations = circuit.truth_table(netlist)
+	for combination in xrange(combinations):
+		expected = simulate(builder.database, [x, y], [out], combination)
+		assert (bit(table, combination),) == expected
+
+	assert circuit.check(netlist, lambda a, b: a == b) is None
+	# the first combination where XNOR isn't XOR is both inputs off
+	assert circuit.check(netlist, lambda a, b: a != b) == (False, False)
+
+def test_evaluate_ints_without_width():
+	builder = Builder()
+	x = builder.node(signals.Trigger())
+	y = builder.node(signals.Trigger())
+	builder.output(builder.gate('AND', x, y))
+	netlist = circuit.compile(builder.database)
+	assert netlist.evaluate([0b1100, 0b1010]) == [0b1000]
+
+	builder.output(builder.gate('NOT', x))
+	netlist = circuit.compile(builder.database)
+	assert netlist.evaluate([0b1100, 0b1010], 4)[1] == 0b0011
+	with pytest.raises(ValueError):
+		netlist.evaluate([0b1100, 0b1010])
+
+def test_check_refuses_other_sizes(backend):
+	builder = Builder()
+	inputs, outputs = adder(builder, 2)
+	smaller = Builder()
+	x = smaller.node(signals.Trigger())
+	y = smaller.node(signals.Trigger())
+	smaller.output(smaller.gate('XOR', x, y))
+	with pytest.raises(ValueError):
+		circuit.check(circuit.compile(builder.database, inputs=inputs),
+					  circuit.compile(smaller.database))
+	with pytest.raises(ValueError):
+		circuit.check(circuit.compile(builder.database, inputs=inputs), lambda *bits: bits[0])
+
+def test_loop_is_refused():
+	builder = Builder()
+	trigger = builder.node(signals.Trigger())
+	first = builder.gate('NOR', trigger)
+	second = builder.gate('NOR', first)
+	builder.wire(second, first)
+	builder.output(second)
+	with pytest.raises(ValueError):
+		circuit.compile(builder.database)
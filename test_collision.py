@@ -0,0 +1,29 @@
+"""
+Checks the EntityCollisionSystem.  Run with pytest.
+"""
+import headless # should always be first, to run without a window
+import entitymanager
+import common
+
+def collider(database, callback=None):
+	e_id = database.new_entity()
+	rect = common.RectCollider(100, 100, 16, 16)
+	if callback is not None:
+		rect.register_callback(callback)
+	database.add_component(e_id, rect)
+	return e_id
+
+def test_callback_can_remove_entities():
+	database = entitymanager.EntityManager()
+	touched = []
+	def pick_up(e_id, other):
+		touched.append(other)
+		database.remove_entity(other)
+	player = collider(database, pick_up)
+	first = collider(database)
+	second = collider(database)
+
+	system = common.EntityCollisionSystem()
+	system.update(0, database)
+	assert sorted(touched) == [first, second]
+	assert database.components(common.RectCollider).keys() == [player]
@@ -0,0 +1,69 @@
+"""
+Checks that restoring a snapshot puts a level back where it was, so running
+it again gives the same game.  Run with pytest.
+"""
+import pytest
+
+import headless # should always be first, to run without a window
+import config
+import arraystore
+import benchmark
+import common
+import snapshot
+
+def positions(level):
+	return sorted((e_id, float(pos.x), float(pos.y))
+				  for e_id, pos in level.database.components(common.Position).iteritems())
+
+def run(level, input_dict, start, frames):
+	for frame in xrange(start, start + frames):
+		benchmark.drive(input_dict, frame)
+		level.step()
+
+def test_restore_is_deterministic():
+	level, input_dict = benchmark.build(200)
+	snapshotter = snapshot.Snapshotter(level)
+	run(level, input_dict, 0, 30)
+	taken = snapshotter.take()
+	run(level, input_dict, 30, 60)
+	expected = positions(level)
+
+	# entities removed since the snapshot are made again
+	for e_id in sorted(level.database.components(common.Position))[:5]:
+		level.database.remove_entity(e_id)
+	snapshotter.restore(taken)
+	run(level, input_dict, 30, 60)
+	assert positions(level) == expected
+
+@pytest.mark.parametrize('array_store', [False, True])
+def test_restore_from_string(monkeypatch, array_store):
+	if array_store and arraystore.numpy is None:
+		pytest.skip('numpy is not installed')
+	monkeypatch.setattr(config, 'ARRAY_STORE', array_store)
+	level, input_dict = benchmark.build(200)
+	assert (level.database.kinematics is not None) == array_store
+	snapshotter = snapshot.Snapshotter(level)
+	run(level, input_dict, 0, 30)
+	data = snapshotter.take().tostring()
+	run(level, input_dict, 30, 60)
+	expected = positions(level)
+
+	snapshotter.restore(snapshot.Snapshot.fromstring(data))
+	run(level, input_dict, 30, 60)
+	assert positions(level) == expected
+
+def test_restored_input_keeps_its_dict():
+	level, player = headless.load()
+	input_dict = level.database.component_for_entity(player, common.PlayerInput).input
+	snapshotter = snapshot.Snapshotter(level)
+	run(level, input_dict, 0, 30)
+	taken = snapshotter.take()
+	run(level, input_dict, 30, 60)
+	expected = positions(level)
+
+	level.database.remove_entity(player)
+	snapshotter.restore(taken)
+	# whatever drives the player still has the restored one's dictionary
+	assert level.database.component_for_entity(player, common.PlayerInput).input is input_dict
+	run(level, input_dict, 30, 60)
+	assert positions(level) == expected
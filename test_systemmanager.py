@@ -0,0 +1,71 @@
+"""
+Checks how the SystemManager puts systems in waves, and that checking
+declarations doesn't change the results.  Run with pytest.
+"""
+import pytest
+
+import headless # should always be first, to run without a window
+import config
+import ecs
+import benchmark
+import common
+import signals
+import systemmanager
+
+def run(frames=120):
+	"""
+	Runs a benchmark level and returns its systems and the positions of its
+	entities
+	"""
+	level, input_dict = benchmark.build(200)
+	for frame in xrange(frames):
+		benchmark.drive(input_dict, frame)
+		level.step()
+	positions = sorted((e_id, float(pos.x), float(pos.y))
+					   for e_id, pos in level.database.components(common.Position).iteritems())
+	return level.systems, positions
+
+def test_checking_matches_unchecked(monkeypatch):
+	monkeypatch.setattr(config, 'CHECK_SYSTEMS', False)
+	systems, unchecked = run()
+
+	monkeypatch.setattr(config, 'CHECK_SYSTEMS', True)
+	systems, checked = run()
+	assert checked == unchecked
+
+def test_waves_keep_order():
+	systems, positions = run(1)
+	waves = systems.waves()
+	ordered = systems.ordered_systems()
+	assert set(s for wave in waves for s in wave) == set(ordered)
+	assert any(len(wave) > 1 for wave in waves)
+	wave_of = dict((s, n) for n, wave in enumerate(waves) for s in wave)
+	for n, system in enumerate(ordered):
+		for earlier in ordered[:n]:
+			if systemmanager._conflict(systemmanager._declarations(earlier),
+									   systemmanager._declarations(system)):
+				assert wave_of[earlier] < wave_of[system]
+	# systems that call callbacks get waves of their own
+	for system in ordered:
+		if isinstance(system, (common.EntityCollisionSystem, signals.SignalSystem)):
+			assert waves[wave_of[system]] == [system]
+
+class Sneaky(ecs.System):
+	"""
+	Declares that it reads Position, but reads Velocity too
+	"""
+	def __init__(self):
+		super(Sneaky, self).__init__()
+		self.reads = (common.Position,)
+		self.writes = ()
+
+	def update(self, dt, entity_manager):
+		entity_manager.components(common.Position)
+		entity_manager.components(common.Velocity)
+
+def test_undeclared_access_is_caught():
+	level, input_dict = benchmark.build(10)
+	level.systems.check = True
+	level.systems.add_system(Sneaky(), 100)
+	with pytest.raises(systemmanager.UndeclaredAccess):
+		level.step()
@@ -0,0 +1,44 @@
+"""
+Fixed-timestep scheduling.
+
+"""
+
+class FixedStep(object):
+	"""
+	Turns the variable time between rendered frames into a whole number of
+	fixed-length simulation steps.
+
+	Real time is added to an accumulator, and one step is taken for every
+	step-length of time in it.  What is left over is kept for the next frame,
+	and alpha tells how far the current moment is between the last two steps,
+	for interpolating what is drawn.
+
+	If the game falls too far behind, for instance because the computer slept,
+	at most max_steps are taken and the rest of the backlog is dropped, so
+	that catching up can't take longer than the frame that caused it.
+
+	"""
+	def __init__(self, step=1.0/60.0, max_steps=5):
+		self.step = step
+		self.max_steps = max_steps
+		self.accumulator = 0.0
+
+	def advance(self, dt):
+		"""
+		Adds dt seconds of real time and returns the number of steps to run
+		"""
+		self.accumulator += dt
+		# the small tolerance keeps a frame of exactly one step from rounding to 0
+		steps = int(self.accumulator / self.step + 1e-6)
+		if steps > self.max_steps:
+			steps = self.max_steps
+			self.accumulator = self.step * steps
+		self.accumulator = max(0.0, self.accumulator - self.step * steps)
+		return steps
+
+	@property
+	def alpha(self):
+		"""
+		How far, from 0 to 1, the present is between the last step and the next one
+		"""
+		return min(1.0, self.accumulator / self.step)
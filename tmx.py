@@ -0,0 +1,141 @@
+"""
+Reads the tile data of TMX maps without cocos.
+
+cocos.tiles.load makes textures for every tileset, which needs a GL context.
+This module only reads what the simulation needs: the size of the map, the
+tile ids of a layer, and the properties of the tiles.
+
+"""
+import base64
+import os
+import struct
+import zlib
+from xml.etree import ElementTree
+
+class TileLayer(object):
+	"""
+	A layer of tiles read from a TMX file.
+
+	name					: the layer's name in the TMX file
+
+	width, height			: size of the layer in tiles
+
+	tile_width, tile_height	: size of a tile in pixels
+
+	gids					: the layer's global tile ids, one per tile, in the
+							  order of the TMX file, i.e. row by row from the top
+							  left; 0 is an empty tile
+
+	properties				: {gid: {name: value}} for tiles with properties,
+							  with values converted as cocos.tiles.load does
+
+	tilesets				: list of (firstgid, image path) of the map's tilesets
+
+	visible					: False if the layer is hidden in the TMX file
+
+	"""
+	def __init__(self, name, width, height, tile_width, tile_height, gids,
+				 properties, tilesets, visible=True):
+		self.name = name
+		self.width = width
+		self.height = height
+		self.tile_width = tile_width
+		self.tile_height = tile_height
+		self.gids = gids
+		self.properties = properties
+		self.tilesets = tilesets
+		self.visible = visible
+
+	def gid_at(self, i, j):
+		"""
+		Returns the gid of cell (i, j), counting columns from the left and rows
+		from the bottom, like the cells of a cocos RectMapLayer
+		"""
+		return self.gids[(self.height - 1 - j) * self.width + i]
+
+	def properties_for(self, gid):
+		return self.properties.get(gid, {})
+
+def load_layer(path, name):
+	"""
+	Reads the layer called name from the TMX file at path.  Raises KeyError if
+	there is no such layer.
+	"""
+	layers = _load(path, name)
+	if not layers:
+		raise KeyError('no layer named {} in {}'.format(name, path))
+	return layers[0]
+
+def load_layers(path):
+	"""
+	Reads every tile layer of the TMX file at path, in the order they are in
+	the file
+	"""
+	return _load(path)
+
+def _load(path, name=None):
+	root = ElementTree.parse(path).getroot()
+	if root.tag != 'map':
+		raise ValueError('{} is a <{}> document, not a <map>'.format(path, root.tag))
+
+	tile_width = int(root.attrib['tilewidth'])
+	tile_height = int(root.attrib['tileheight'])
+	base = os.path.dirname(path)
+
+	properties = {}
+	tilesets = []
+	for tag in root.findall('tileset'):
+		firstgid = int(tag.attrib['firstgid'])
+		tileset_base = base
+		if 'source' in tag.attrib:
+			# an external .tsx tileset
+			tileset_path = os.path.join(base, tag.attrib['source'])
+			tag = ElementTree.parse(tileset_path).getroot()
+			tileset_base = os.path.dirname(tileset_path)
+		image = tag.find('image')
+		if image is not None:
+			tilesets.append((firstgid, os.path.join(tileset_base, image.attrib['source'])))
+		for tile in tag.findall('tile'):
+			props = tile.find('properties')
+			if props is None:
+				continue
+			tile_props = properties.setdefault(firstgid + int(tile.attrib['id']), {})
+			for p in props.findall('property'):
+				value = p.attrib['value']
+				if value.isdigit():
+					value = int(value) # the same conversion cocos.tiles.load does
+				tile_props[p.attrib['name']] = value
+
+	layers = []
+	for layer in root.findall('layer'):
+		if name is not None and layer.attrib['name'] != name:
+			continue
+		width = int(layer.attrib['width'])
+		height = int(layer.attrib['height'])
+		gids = _read_data(layer.find('data'), width * height)
+		layers.append(TileLayer(layer.attrib['name'], width, height, tile_width,
+								tile_height, gids, properties, tilesets,
+								bool(int(layer.attrib.get('visible', 1)))))
+	return layers
+
+def _read_data(data, count):
+	encoding = data.attrib.get('encoding')
+	if encoding == 'base64':
+		raw = base64.b64decode(data.text.strip())
+		compression = data.attrib.get('compression')
+		if compression == 'zlib':
+			raw = zlib.decompress(raw)
+		elif compression == 'gzip':
+			raw = zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+		elif compression:
+			raise ValueError('unsupported compression: {}'.format(compression))
+		gids = list(struct.unpack('<{}I'.format(count), raw))
+	elif encoding == 'csv':
+		gids = [int(gid) for gid in data.text.replace('\n', '').split(',')]
+	else:
+		gids = [int(tile.attrib.get('gid', 0)) for tile in data.findall('tile')]
+
+	if len(gids) != count:
+		raise ValueError('expected {} tiles, got {}'.format(count, len(gids)))
+	# the top bits are flip flags
+	return [gid & 0x1FFFFFFF for gid in gids]